@@ -16,6 +16,7 @@
 
 import sys
 import os
+import types
 import ConfigParser
 import fnmatch
 
@@ -138,11 +139,34 @@ class Config:
 
   def __init__(self):
     self.root_options_overlayed = 0
+    # results of parsing the configuration, shared with copies of this
+    # object (see overlay_root_options() and load_kv_files())
+    self._memo = { }
     for section in self._base_sections:
       if section[-1] == '*':
         continue
       setattr(self, section, _sub_config())
 
+  def get_memo(self, key):
+    """Return the value memoized under KEY by set_memo() for this
+    configuration (or any copy of it), or None."""
+    return self._memo.get(key)
+
+  def set_memo(self, key, value):
+    """Memoize VALUE under KEY, for as long as this configuration (and
+    its copies) are in use."""
+    self._memo[key] = value
+
+  def copy(self):
+    """Return a copy of this configuration, whose options may be changed
+    (by overlay_root_options(), say) without affecting this one."""
+    cfg = Config()
+    for name, value in vars(self).items():
+      if isinstance(value, _sub_config):
+        value = _copy_sub_config(value)
+      setattr(cfg, name, value)
+    return cfg
+
   def load_config(self, pathname, vhost=None):
     """Load the configuration file at PATHNAME, applying configuration
     settings there as overrides to the built-in default values.  If
@@ -165,10 +189,12 @@ class Config:
   def load_kv_files(self, language):
     """Process the key/value (kv) files specified in the
     configuration, merging their values into the configuration as
-    dotted heirarchical items."""
-    
-    kv = _sub_config()
+    dotted heirarchical items.
+
+    The result is shared with other callers (until the files change),
+    so it must not be modified."""
 
+    kv_files = [ ]
     for fname in self.general.kv_files:
       if fname[0] == '[':
         idx = fname.index(']')
@@ -177,10 +203,20 @@ class Config:
       else:
         parts = [ ]
       fname = fname.replace('%lang%', language)
+      kv_files.append((parts, os.path.join(self.base, fname)))
+
+    key = ('kv', tuple(map(lambda x: (tuple(x[0]), x[1]), kv_files)))
+    stamps = map(lambda x: _file_stamp(x[1]), kv_files)
+    memo = self._memo.get(key)
+    if memo and memo[0] == stamps:
+      return memo[1]
+
+    kv = _sub_config()
 
+    for parts, path in kv_files:
       parser = ConfigParser.ConfigParser()
       parser.optionxform = lambda x: x # don't case-normalize option names.
-      parser.read(os.path.join(self.base, fname))
+      parser.read(path)
       for section in parser.sections():
         for option in parser.options(section):
           full_name = parts + [section]
@@ -194,6 +230,7 @@ class Config:
               ob = c
           setattr(ob, option, parser.get(section, option))
 
+    self._memo[key] = (stamps, kv)
     return kv
 
   def path(self, path):
@@ -201,10 +238,21 @@ class Config:
     return os.path.join(self.base, path)
 
   def _process_section(self, parser, section, subcfg_name):
+    self._set_values(subcfg_name, self._section_values(parser, section))
+
+  def _set_values(self, subcfg_name, values):
+    """Set the options in the list of (name, value) pairs VALUES in the
+    SUBCFG_NAME section of the configuration."""
     if not hasattr(self, subcfg_name):
       setattr(self, subcfg_name, _sub_config())
     sc = getattr(self, subcfg_name)
+    for opt, value in values:
+      setattr(sc, opt, _copy_value(value))
 
+  def _section_values(self, parser, section):
+    """Return a list of (name, value) pairs of the options in SECTION,
+    with the values converted to their proper types."""
+    values = [ ]
     for opt in parser.options(section):
       value = parser.get(section, opt)
       if opt in self._force_multi_value:
@@ -220,7 +268,8 @@ class Config:
       if opt == 'cvs_roots' or opt == 'svn_roots':
         value = _parse_roots(opt, value)
 
-      setattr(sc, opt, value)
+      values.append((opt, value))
+    return values
 
   def _is_allowed_section(self, section, allowed_sections):
     """Return 1 iff SECTION is an allowed section, defined as being
@@ -286,15 +335,26 @@ class Config:
     if not self.conf_path:
       return
 
-    for section in self.parser.sections():
-      base_section = self._is_allowed_override('root', rootname, section)
-      if base_section:
-        # We can currently only deal with root overlays happening
-        # once, so check that we've not yet done any overlaying of
-        # per-root options.
-        assert(self.root_options_overlayed == 0)
-        self._process_section(self.parser, section, base_section)
-        did_overlay = 1
+    # The overriding values are parsed once, and remembered for
+    # subsequent requests for the same root.
+    key = ('root', rootname)
+    overrides = self._memo.get(key)
+    if overrides is None:
+      overrides = [ ]
+      for section in self.parser.sections():
+        base_section = self._is_allowed_override('root', rootname, section)
+        if base_section:
+          overrides.append((base_section,
+                            self._section_values(self.parser, section)))
+      self._memo[key] = overrides
+
+    for base_section, values in overrides:
+      # We can currently only deal with root overlays happening
+      # once, so check that we've not yet done any overlaying of
+      # per-root options.
+      assert(self.root_options_overlayed == 0)
+      self._set_values(base_section, values)
+      did_overlay = 1
 
     # If we actually did any overlaying, remember this fact so we
     # don't do it again later.
@@ -403,10 +463,16 @@ class Config:
     self.options.binary_mime_types = []
     self.options.http_expiration_time = 600
     self.options.generate_etags = 1
+    self.options.response_cache_dir = None
+    self.options.response_cache_kbytes = 65536
     self.options.svn_ignore_mimetype = 0
     self.options.svn_config_dir = None
+    self.options.svn_revinfo_cache_dir = None
     self.options.max_filesize_kbytes = 512
     self.options.use_rcsparse = 0
+    self.options.rcsparse_cache_dir = None
+    self.options.cvs_dirlogs_jobs = 0
+    self.options.cvs_dirlogs_jobs_threshold = 100
     self.options.sort_by = 'file'
     self.options.sort_group_dirs = 1
     self.options.hide_attic = 1
@@ -419,8 +485,12 @@ class Config:
     self.options.hr_ignore_white = 0
     self.options.hr_ignore_keyword_subst = 1
     self.options.hr_intraline = 0
+    self.options.hr_intraline_max_block_size = 16384
+    self.options.hr_intraline_time_limit = 2
+    self.options.diff_algorithm = 'myers'
     self.options.allow_compress = 0
     self.options.template_dir = "templates/default"
+    self.options.template_mtime_check = 1
     self.options.docroot = None
     self.options.show_subdir_lastmod = 0
     self.options.show_roots_lastmod = 0
@@ -431,6 +501,8 @@ class Config:
     self.options.iso8601_timestamps = 0
     self.options.short_log_len = 80
     self.options.enable_syntax_coloration = 1
+    self.options.highlight_cache_dir = None
+    self.options.highlight_cache_kbytes = 65536
     self.options.tabsize = 8
     self.options.detect_encoding = 0
     self.options.use_cvsgraph = 0
@@ -464,9 +536,68 @@ class Config:
     self.cvsdb.row_limit = 1000
     self.cvsdb.rss_row_limit = 100
     self.cvsdb.check_database_for_root = 0
+    self.cvsdb.commit_batch_size = 1000
 
     self.query.viewvc_base_url = None
     
+
+# Parsed configurations shared by all of this process's callers of
+# get_config(), keyed by pathname.  Values are 2-tuples of the stamp
+# (see _file_stamp()) of the file that was parsed and the resulting
+# Config object, which is never modified.
+_configs = { }
+
+def get_config(pathname, vhost=None):
+  """Return a Config with default values set, and the configuration
+  file at PATHNAME and the overrides for VHOST (if provided) loaded.
+
+  The file is parsed once per process, and again whenever it changes.
+  Each caller gets its own copy of the configuration, which it may
+  change as it likes."""
+
+  stamp = _file_stamp(pathname)
+  cached = _configs.get(pathname)
+  if cached and cached[0] == stamp:
+    base = cached[1]
+  else:
+    base = Config()
+    base.set_defaults()
+    base.load_config(pathname)
+    _configs[pathname] = (stamp, base)
+
+  cfg = base
+  if vhost and base.parser.has_section('vhosts'):
+    canon_vhost = base._find_canon_vhost(base.parser, vhost)
+    if canon_vhost:
+      key = ('vhost', canon_vhost)
+      cfg = base._memo.get(key)
+      if cfg is None:
+        cfg = base.copy()
+        cfg._process_vhost(cfg.parser, vhost)
+        base._memo[key] = cfg
+  return cfg.copy()
+
+def _file_stamp(path):
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return st.st_mtime, st.st_size
+
+def _copy_value(value):
+  # option values are strings, integers, lists, and dictionaries
+  if type(value) is types.ListType:
+    return value[:]
+  if type(value) is types.DictType:
+    return value.copy()
+  return value
+
+def _copy_sub_config(sc):
+  copy = _sub_config()
+  for name, value in vars(sc).items():
+    setattr(copy, name, _copy_value(value))
+  return copy
+
 def _startswith(somestr, substr):
   return somestr[:len(substr)] == substr
 
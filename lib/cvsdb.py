@@ -31,13 +31,20 @@ CURRENT_SCHEMA_VERSION = 1
 ## error
 error = "cvsdb error"
 
+## the number of values looked up by a single "WHERE ... IN (...)" query
+SQL_IN_LIMIT = 500
+
+## the number of query result rows fetched (and whose names are looked
+## up) at a time
+QUERY_FETCH_SIZE = 1000
+
 ## CheckinDatabase provides all interfaces needed to the SQL database
 ## back-end; it needs to be subclassed, and have its "Connect" method
 ## defined to actually be complete; it should run well off of any DBI 2.0
 ## complient database interface
 
 class CheckinDatabase:
-    def __init__(self, host, port, user, passwd, database):
+    def __init__(self, host, port, user, passwd, database, batch_size=1000):
         self._host = host
         self._port = port
         self._user = user
@@ -45,6 +52,9 @@ class CheckinDatabase:
         self._database = database
         self._version = None
 
+        ## number of commits AddCommitList() adds per transaction
+        self.batch_size = batch_size
+
         ## database lookup caches
         self._get_cache = {}
         self._get_id_cache = {}
@@ -115,6 +125,70 @@ class CheckinDatabase:
         temp2[value] = id
         return id
 
+    def sql_get_id_list(self, table, column, values, ids):
+        ## look up the ids of VALUES, a few hundred at a time, storing
+        ## those found in the dictionary IDS
+        cursor = self.db.cursor()
+        for i in range(0, len(values), SQL_IN_LIMIT):
+            chunk = values[i:i+SQL_IN_LIMIT]
+            sql = "SELECT id, %s FROM %s WHERE %s IN (%s)" \
+                  % (column, table, column, ",".join(["%s"] * len(chunk)))
+            cursor.execute(sql, tuple(chunk))
+            for (id, value) in cursor.fetchall():
+                ids[value] = str(int(id))
+
+    def get_id_list(self, table, column, values, auto_set=1):
+        """Return a dictionary mapping each of VALUES to its id in TABLE,
+        adding the values which aren't there yet (or, unless AUTO_SET,
+        mapping them to None), as get_id() does for a single value but
+        in a few queries."""
+        try:
+            cache = self._get_id_cache[table][column]
+        except KeyError:
+            cache = self._get_id_cache.setdefault(table, {})[column] = {}
+
+        ids = {}
+        missing = {}
+        for value in values:
+            try:
+                ids[value] = cache[value]
+            except KeyError:
+                missing[value] = None
+        missing = missing.keys()
+        if not missing:
+            return ids
+
+        found = {}
+        self.sql_get_id_list(table, column, missing, found)
+        new = filter(lambda x: not found.has_key(x), missing)
+        absent = {}
+        if new and auto_set:
+            sql = "INSERT IGNORE INTO %s (%s) VALUES (%%s)" % (table, column)
+            cursor = self.db.cursor()
+            cursor.executemany(sql, map(lambda x: (x, ), new))
+            self.sql_get_id_list(table, column, new, found)
+        elif len(found) == len(missing) - len(new):
+            ## every row found is one of the values, so the rest aren't
+            ## in the table at all
+            for value in new:
+                absent[value] = None
+
+        for value in missing:
+            try:
+                id = found[value]
+            except KeyError:
+                if absent.has_key(value):
+                    id = None
+                else:
+                    ## the database matched this value to one which
+                    ## differs (in case or trailing spaces, say), so look
+                    ## it up on its own
+                    id = self.get_id(table, column, value, auto_set)
+            else:
+                cache[value] = id
+            ids[value] = id
+        return ids
+
     def sql_get(self, table, column, id):
         sql = "SELECT %s FROM %s WHERE id=%%s" % (column, table)
         sql_args = (id, )
@@ -152,6 +226,34 @@ class CheckinDatabase:
 
         temp2[id] = value
         return value
+
+    def cache_values(self, table, column, ids):
+        """Cache the COLUMN values of the rows of TABLE with the given
+        IDS, so that get() needn't query them one at a time.  Only those
+        not cached already are looked up, a few hundred at a time."""
+        try:
+            cache = self._get_cache[table][column]
+        except KeyError:
+            cache = self._get_cache.setdefault(table, {})[column] = {}
+
+        missing = {}
+        for id in ids:
+            if id is not None and not cache.has_key(id):
+                missing[id] = None
+        missing = missing.keys()
+
+        cursor = self.db.cursor()
+        for i in range(0, len(missing), SQL_IN_LIMIT):
+            chunk = missing[i:i+SQL_IN_LIMIT]
+            sql = "SELECT id, %s FROM %s WHERE id IN (%s)" \
+                  % (column, table, ",".join(["%s"] * len(chunk)))
+            cursor.execute(sql, tuple(chunk))
+            found = {}
+            for (id, value) in cursor.fetchall():
+                found[int(id)] = value
+            for id in chunk:
+                ## ids without a row are cached too, as having no value
+                cache[id] = found.get(int(id))
         
     def get_list(self, table, field_index):
         sql = "SELECT * FROM %s" % (table)
@@ -280,6 +382,61 @@ class CheckinDatabase:
         temp[description] = id
         return id
 
+    def SQLGetDescriptionIDList(self, descriptions, ids):
+        ## look up the ids of DESCRIPTIONS, a few hundred at a time,
+        ## storing those found in the dictionary IDS
+        cursor = self.db.cursor()
+        for i in range(0, len(descriptions), SQL_IN_LIMIT):
+            chunk = descriptions[i:i+SQL_IN_LIMIT]
+            hashes = {}
+            for description in chunk:
+                hashes[len(description)] = None
+            hashes = hashes.keys()
+            sql = "SELECT id, description FROM descs " \
+                  "WHERE hash IN (%s) AND description IN (%s) ORDER BY id" \
+                  % (",".join(["%s"] * len(hashes)),
+                     ",".join(["%s"] * len(chunk)))
+            cursor.execute(sql, tuple(hashes) + tuple(chunk))
+            for (id, description) in cursor.fetchall():
+                if not ids.has_key(description):
+                    ids[description] = str(int(id))
+
+    def GetDescriptionIDList(self, descriptions):
+        """Return a dictionary mapping each of DESCRIPTIONS to its id,
+        adding the descriptions which aren't in the database yet, as
+        GetDescriptionID() does for a single description."""
+        ids = {}
+        missing = {}
+        for description in descriptions:
+            try:
+                ids[description] = \
+                    self._desc_id_cache[len(description)][description]
+            except KeyError:
+                missing[description] = None
+        missing = missing.keys()
+        if not missing:
+            return ids
+
+        found = {}
+        self.SQLGetDescriptionIDList(missing, found)
+        new = filter(lambda x: not found.has_key(x), missing)
+        if new:
+            sql = "INSERT INTO descs (hash, description) VALUES (%s, %s)"
+            cursor = self.db.cursor()
+            cursor.executemany(sql, map(lambda x: (len(x), x), new))
+            self.SQLGetDescriptionIDList(new, found)
+
+        for description in missing:
+            try:
+                id = found[description]
+            except KeyError:
+                id = self.GetDescriptionID(description)
+            else:
+                self._desc_id_cache.setdefault(len(description),
+                                               {})[description] = id
+            ids[description] = id
+        return ids
+
     def GetDescription(self, id):
         return self.get("descs", "description", id)
 
@@ -292,9 +449,84 @@ class CheckinDatabase:
     def GetAuthorList(self):
         return self.get_list("people", 1)
 
-    def AddCommitList(self, commit_list):
-        for commit in commit_list:
-            self.AddCommit(commit)
+    def AddCommitList(self, commit_list, batch_size=None, batch_cb=None):
+        """Add the commits in COMMIT_LIST to the database, BATCH_SIZE
+        (by default, self.batch_size) at a time, as AddCommitBatch()
+        does.  Return a list of (COUNT, SECONDS) tuples giving
+        the number of commits in each batch and the time taken to add
+        them; if BATCH_CB is not None, it is also called with each
+        tuple as its batch is added."""
+        if not batch_size:
+            batch_size = self.batch_size
+        timings = []
+        for i in range(0, len(commit_list), batch_size):
+            batch = commit_list[i:i+batch_size]
+            start = time.time()
+            self.AddCommitBatch(batch)
+            timing = (len(batch), time.time() - start)
+            timings.append(timing)
+            if batch_cb:
+                batch_cb(timing)
+        return timings
+
+    def AddCommitBatch(self, commit_list):
+        """Add the commits in COMMIT_LIST to the database, looking up
+        (or adding) the authors, directories, files, branches and
+        descriptions they refer to in a few queries rather than a few
+        per commit.  The batch is added in a single transaction, which
+        makes it atomic only if the tables are transactional (InnoDB,
+        say).  The MyISAM tables make-database creates ignore
+        transactions, so a failed batch may be left partly added; as
+        commits are added with REPLACE, adding them again is harmless."""
+        cursor = self.db.cursor()
+        cursor.execute("BEGIN")
+        try:
+            who_ids = self.get_id_list(
+                "people", "who", map(lambda x: x.GetAuthor(), commit_list))
+            repository_ids = self.get_id_list(
+                "repositories", "repository",
+                map(lambda x: x.GetRepository(), commit_list))
+            directory_ids = self.get_id_list(
+                "dirs", "dir", map(lambda x: x.GetDirectory(), commit_list))
+            file_ids = self.get_id_list(
+                "files", "file", map(lambda x: x.GetFile(), commit_list))
+            branch_ids = self.get_id_list(
+                "branches", "branch", map(lambda x: x.GetBranch(), commit_list))
+            description_ids = self.GetDescriptionIDList(
+                map(lambda x: x.GetDescription(), commit_list))
+
+            rows = []
+            for commit in commit_list:
+                rows.append((commit.GetTypeString(),
+                             dbi.DateTimeFromTicks(commit.GetTime() or 0.0),
+                             who_ids[commit.GetAuthor()],
+                             repository_ids[commit.GetRepository()],
+                             directory_ids[commit.GetDirectory()],
+                             file_ids[commit.GetFile()],
+                             commit.GetRevision(),
+                             "NULL",
+                             branch_ids[commit.GetBranch()],
+                             commit.GetPlusCount() or '0',
+                             commit.GetMinusCount() or '0',
+                             description_ids[commit.GetDescription()]))
+
+            sql = "REPLACE INTO %s" \
+                  "  (type,ci_when,whoid,repositoryid,dirid,fileid,revision," \
+                  "   stickytag,branchid,addedlines,removedlines,descid)" \
+                  "  VALUES (%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s,%%s)" \
+                  % (self.GetCommitsTable())
+            cursor.executemany(sql, rows)
+        except Exception:
+            ## forget ids which may have been rolled back (if the tables
+            ## are transactional), and add the commits one by one to
+            ## report the one which failed
+            self.db.rollback()
+            self._get_id_cache = {}
+            self._desc_id_cache = {}
+            for commit in commit_list:
+                self.AddCommit(commit)
+        else:
+            self.db.commit()
 
     def AddCommit(self, commit):
         ci_when = dbi.DateTimeFromTicks(commit.GetTime() or 0.0)
@@ -472,39 +704,54 @@ class CheckinDatabase:
         cursor.execute(sql)
         query.SetExecuted()
         row_count = 0
-        
-        while 1:
-            row = cursor.fetchone()
-            if not row:
+
+        ## the rows are fetched a batch at a time, and the names of the
+        ## authors, files, etc. they refer to looked up for the whole
+        ## batch at once, rather than by each commit as it is used
+        while not query.limit_reached:
+            rows = cursor.fetchmany(QUERY_FETCH_SIZE)
+            if not rows:
                 break
-            row_count = row_count + 1
-            if query.limit and (row_count > query.limit):
+            if query.limit and (row_count + len(rows) > query.limit):
+                rows = rows[:query.limit - row_count]
                 query.SetLimitReached()
-                break
-            
-            (dbType, dbCI_When, dbAuthorID, dbRepositoryID, dbDirID,
-             dbFileID, dbRevision, dbStickyTag, dbBranchID, dbAddedLines,
-             dbRemovedLines, dbDescID) = row
-
-            commit = LazyCommit(self)
-            if dbType == 'Add':
-              commit.SetTypeAdd()
-            elif dbType == 'Remove':
-              commit.SetTypeRemove()
-            else:
-              commit.SetTypeChange()
-            commit.SetTime(dbi.TicksFromDateTime(dbCI_When))
-            commit.SetFileID(dbFileID)
-            commit.SetDirectoryID(dbDirID)
-            commit.SetRevision(dbRevision)
-            commit.SetRepositoryID(dbRepositoryID)
-            commit.SetAuthorID(dbAuthorID)
-            commit.SetBranchID(dbBranchID)
-            commit.SetPlusCount(dbAddedLines)
-            commit.SetMinusCount(dbRemovedLines)
-            commit.SetDescriptionID(dbDescID)
-
-            query.AddCommit(commit)
+            row_count = row_count + len(rows)
+
+            self.cache_values("people", "who", _column(rows, 2))
+            self.cache_values("repositories", "repository",
+                                _column(rows, 3))
+            self.cache_values("dirs", "dir", _column(rows, 4))
+            self.cache_values("files", "file", _column(rows, 5))
+            self.cache_values("branches", "branch", _column(rows, 8))
+            self.cache_values("descs", "description", _column(rows, 11))
+
+            for row in rows:
+                query.AddCommit(self._query_row_commit(row))
+
+    def _query_row_commit(self, row):
+        (dbType, dbCI_When, dbAuthorID, dbRepositoryID, dbDirID,
+         dbFileID, dbRevision, dbStickyTag, dbBranchID, dbAddedLines,
+         dbRemovedLines, dbDescID) = row
+
+        commit = LazyCommit(self)
+        if dbType == 'Add':
+          commit.SetTypeAdd()
+        elif dbType == 'Remove':
+          commit.SetTypeRemove()
+        else:
+          commit.SetTypeChange()
+        commit.SetTime(dbi.TicksFromDateTime(dbCI_When))
+        commit.SetFileID(dbFileID)
+        commit.SetDirectoryID(dbDirID)
+        commit.SetRevision(dbRevision)
+        commit.SetRepositoryID(dbRepositoryID)
+        commit.SetAuthorID(dbAuthorID)
+        commit.SetBranchID(dbBranchID)
+        commit.SetPlusCount(dbAddedLines)
+        commit.SetMinusCount(dbRemovedLines)
+        commit.SetDescriptionID(dbDescID)
+
+        return commit
 
     def CheckCommit(self, commit):
         repository_id = self.GetRepositoryID(commit.GetRepository(), 0)
@@ -541,6 +788,109 @@ class CheckinDatabase:
 
         return commit
 
+    def GetRecordedCommits(self, repository, directory=None):
+        """Return a dictionary whose keys are the (directory id, file id,
+        revision) tuples of the commits recorded for REPOSITORY, limited
+        to those in DIRECTORY, if given, for FilterUnrecordedCommits().
+        This takes one query, where CheckCommit() takes several for each
+        commit; the names of the directories and files found are cached
+        along with their ids, saving FilterUnrecordedCommits() from
+        looking them up."""
+        commits_table = self.GetCommitsTable()
+        sql = "SELECT %s.dirid, %s.fileid, %s.revision, dirs.dir, " \
+              "  files.file FROM %s, repositories, dirs, files WHERE " \
+              "  %s.repositoryid=repositories.id " \
+              "  AND %s.dirid=dirs.id " \
+              "  AND %s.fileid=files.id " \
+              "  AND repositories.repository=%%s" \
+              % ((commits_table, ) * 7)
+        sql_args = [repository]
+        if directory is not None:
+            sql = sql + " AND dirs.dir=%s"
+            sql_args.append(directory)
+
+        dir_cache = self._get_id_cache.setdefault('dirs', {}) \
+                    .setdefault('dir', {})
+        file_cache = self._get_id_cache.setdefault('files', {}) \
+                     .setdefault('file', {})
+        recorded = {}
+        cursor = self.db.cursor()
+        cursor.execute(sql, tuple(sql_args))
+        for (dirid, fileid, revision, dir, file) in cursor.fetchall():
+            dirid = dir_cache[dir] = str(int(dirid))
+            fileid = file_cache[file] = str(int(fileid))
+            recorded[(dirid, fileid, revision)] = None
+        return recorded
+
+    def FilterUnrecordedCommits(self, commits, recorded=None):
+        """Return those of COMMITS which aren't among the RECORDED ones
+        (as returned by GetRecordedCommits()), or, if RECORDED is None,
+        which aren't in the database at all.  Commits are matched by
+        the ids of their directories and files, since the database
+        treats names differing only in case or trailing spaces as the
+        same name."""
+        repository_ids = self.get_id_list(
+            'repositories', 'repository',
+            map(lambda x: x.GetRepository(), commits), 0)
+        dir_ids = self.get_id_list(
+            'dirs', 'dir', map(lambda x: x.GetDirectory(), commits), 0)
+        file_ids = self.get_id_list(
+            'files', 'file', map(lambda x: x.GetFile(), commits), 0)
+
+        keys = []
+        for commit in commits:
+            keys.append((repository_ids[commit.GetRepository()],
+                         dir_ids[commit.GetDirectory()],
+                         file_ids[commit.GetFile()],
+                         commit.GetRevision()))
+        if recorded is None:
+            recorded = self.sql_get_recorded(keys)
+
+        unrecorded = []
+        for i in range(len(commits)):
+            if not recorded.has_key(keys[i][1:]):
+                unrecorded.append(commits[i])
+        return unrecorded
+
+    def sql_get_recorded(self, keys):
+        ## return a dictionary whose keys are the (dirid, fileid,
+        ## revision) tuples of those of KEYS, (repositoryid, dirid,
+        ## fileid, revision) tuples, which are recorded; they are looked
+        ## up by the commits table's unique index, the files of each
+        ## directory in a revision together
+        groups = {}
+        for repository_id, dir_id, file_id, revision in keys:
+            if repository_id is None or dir_id is None or file_id is None:
+                continue # not recorded, as its names aren't
+            files = groups.setdefault((repository_id, revision), {}) \
+                    .setdefault(dir_id, {})
+            files[file_id] = None
+
+        recorded = {}
+        cursor = self.db.cursor()
+        for (repository_id, revision), dirs in groups.items():
+            pairs = []
+            for dir_id, files in dirs.items():
+                for file_id in files.keys():
+                    pairs.append((dir_id, file_id))
+            pairs.sort()
+            for i in range(0, len(pairs), SQL_IN_LIMIT):
+                conditions = []
+                sql_args = [repository_id, revision]
+                for dir_id, file_ids in _group_pairs(pairs[i:i+SQL_IN_LIMIT]):
+                    conditions.append("(dirid=%%s AND fileid IN (%s))"
+                                      % ",".join(["%s"] * len(file_ids)))
+                    sql_args.append(dir_id)
+                    sql_args.extend(file_ids)
+                sql = "SELECT dirid, fileid, revision FROM %s " \
+                      "  WHERE repositoryid=%%s AND revision=%%s AND (%s)" \
+                      % (self.GetCommitsTable(), " OR ".join(conditions))
+                cursor.execute(sql, tuple(sql_args))
+                for (dir_id, file_id, revision) in cursor.fetchall():
+                    recorded[(str(int(dir_id)), str(int(file_id)),
+                              revision)] = None
+        return recorded
+
     def sql_delete(self, table, key, value, keep_fkey = None):
         sql = "DELETE FROM %s WHERE %s=%%s" % (table, key)
         sql_args = (value, )
@@ -816,7 +1166,7 @@ class CheckinDatabaseQuery:
         self.commit_list = []
 
         ## commit_cb provides a callback for commits as they
-        ## are added
+        ## are added; if it is set, they aren't kept in commit_list
         self.commit_cb = None
 
         ## has this query been run?
@@ -865,7 +1215,10 @@ class CheckinDatabaseQuery:
         self.limit = limit;
 
     def AddCommit(self, commit):
-        self.commit_list.append(commit)
+        if self.commit_cb:
+            self.commit_cb(commit)
+        else:
+            self.commit_list.append(commit)
 
     def SetExecuted(self):
         self.executed = 1
@@ -882,6 +1235,24 @@ class CheckinDatabaseQuery:
         return self.commit_list
         
 
+def _group_pairs(pairs):
+    ## group the sorted (key, value) PAIRS by key, returning a list of
+    ## (key, values) tuples
+    groups = []
+    for key, value in pairs:
+        if groups and groups[-1][0] == key:
+            groups[-1][1].append(value)
+        else:
+            groups.append((key, [value]))
+    return groups
+
+def _column(rows, index):
+    ## the distinct values of column INDEX of ROWS
+    values = {}
+    for row in rows:
+        values[row[index]] = None
+    return values.keys()
+
 ##
 ## entrypoints
 ##
@@ -899,7 +1270,7 @@ def ConnectDatabase(cfg, readonly=0):
         user = cfg.cvsdb.user
         passwd = cfg.cvsdb.passwd
     db = CheckinDatabase(cfg.cvsdb.host, cfg.cvsdb.port, user, passwd,
-                         cfg.cvsdb.database_name)
+                         cfg.cvsdb.database_name, cfg.cvsdb.commit_batch_size)
     db.Connect()
     return db
 
@@ -945,16 +1316,18 @@ def GetCommitListFromRCSFile(repository, path_parts, revision=None):
 
     return commit_list
 
-def GetUnrecordedCommitList(repository, path_parts, db):
+def GetUnrecordedCommitList(repository, path_parts, db, recorded=None):
+    """Return the commits of the file at PATH_PARTS in REPOSITORY which
+    aren't recorded in DB.  RECORDED may be the result of calling
+    db.GetRecordedCommits() for the file's directory (as is best when
+    checking several files of a directory); otherwise the commits of
+    the directory are looked up here."""
     commit_list = GetCommitListFromRCSFile(repository, path_parts)
+    if recorded is None:
+        recorded = db.GetRecordedCommits(repository.rootpath,
+                                         "/".join(path_parts[:-1]))
 
-    unrecorded_commit_list = []
-    for commit in commit_list:
-        result = db.CheckCommit(commit)
-        if not result:
-            unrecorded_commit_list.append(commit)
-
-    return unrecorded_commit_list
+    return db.FilterUnrecordedCommits(commit_list, recorded)
 
 _re_likechars = re.compile(r"([_%\\])")
 
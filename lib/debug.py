@@ -37,6 +37,7 @@ if SHOW_TIMES:
 
   _timers = { }
   _times = { }
+  _counts = { }
 
   def t_start(which):
     _timers[which] = time.time()
@@ -45,15 +46,17 @@ if SHOW_TIMES:
     t = time.time() - _timers[which]
     if _times.has_key(which):
       _times[which] = _times[which] + t
+      _counts[which] = _counts[which] + 1
     else:
       _times[which] = t
+      _counts[which] = 1
 
   def t_dump(out):
     out.write('<div>')
     names = _times.keys()
     names.sort()
     for name in names:
-      out.write('%s: %.6fs<br/>\n' % (name, _times[name]))
+      out.write('%s: %.6fs (%d)<br/>\n' % (name, _times[name], _counts[name]))
     out.write('</div>')
 
 else:
@@ -236,6 +236,7 @@ import re
 from types import StringType, IntType, FloatType, LongType, TupleType
 import os
 import cgi
+import keyword
 import urllib
 try:
   import cStringIO
@@ -287,6 +288,9 @@ _re_whitespace = re.compile(r'\s\s+')
 # an integer.
 _re_subst = re.compile('%(%|[0-9]+)')
 
+# names which can be used as attribute names in compiled templates
+_re_name = re.compile('^[A-Za-z_][A-Za-z0-9_]*$')
+
 class Template:
 
   def __init__(self, fname=None, compress_whitespace=1,
@@ -312,6 +316,7 @@ class Template:
       text_or_reader = _TextReader(text_or_reader)
 
     self.program = self._parse(text_or_reader, base_format=base_format)
+    self._render = _Compiler().compile(self.program)
 
   def generate(self, fp, data):
     if hasattr(data, '__getitem__') or callable(getattr(data, 'keys', None)):
@@ -326,7 +331,10 @@ class Template:
     ctx.data = data
     ctx.for_iterators = { }
     ctx.defines = { }
-    self._execute(self.program, ctx)
+    if getattr(self, '_render', None):
+      self._render(ctx)
+    else:
+      self._execute(self.program, ctx)
 
   def _parse(self, reader, for_names=None, file_args=(), base_format=None):
     """text -> string object containing the template.
@@ -460,10 +468,7 @@ class Template:
   def _cmd_print(self, valrefs, ctx):
     value = _get_value(valrefs[0], ctx)
     args = map(lambda valref, ctx=ctx: _get_value(valref, ctx), valrefs[1:])
-    try:
-      _write_value(value, args, ctx)
-    except TypeError:
-      raise Exception("Unprintable value type for '%s'" % (str(valrefs[0][0])))
+    _print_value(value, args, ctx, valrefs[0][0])
 
   def _cmd_format(self, formatter, ctx):
     if type(formatter) is TupleType:
@@ -626,6 +631,9 @@ def _get_value((refname, start, rest), ctx):
     except AttributeError:
       raise UnknownReference(refname)
 
+  return _convert_value(ob)
+
+def _convert_value(ob):
   # make sure we return a string instead of some various Python types
   if isinstance(ob, IntType) \
          or isinstance(ob, LongType) \
@@ -642,7 +650,13 @@ def _print_formatted(formatters, ctx, chunk):
   for formatter in formatters:
     chunk = formatter(chunk)
   ctx.fp.write(chunk)
-  
+
+def _print_value(value, args, ctx, refname):
+  try:
+    _write_value(value, args, ctx)
+  except TypeError:
+    raise Exception("Unprintable value type for '%s'" % (str(refname)))
+
 def _write_value(value, args, ctx):
   # value is a callback function, generates its own output
   if callable(value):
@@ -687,6 +701,347 @@ def _write_value(value, args, ctx):
     ctx.formatters = formatters
 
 
+class _Compiler:
+  """Translates a template program (see Template._parse) into the source
+  of a Python function which writes the same output Template._execute
+  would, but without interpreting the program step by step.
+
+  Adjacent literal text is written in one piece, along with any string
+  constants printed by the template.  The items of [for] loops are read
+  from the loops' iterators held in local variables, and when the
+  formatters in effect at a [QUAL_NAME] directive are known at parse
+  time, they are called directly.  Any step the compiler doesn't know
+  (such as a dynamic include) is run by calling its function as
+  _execute would."""
+
+  _kinds = {
+    Template._cmd_print.im_func : 'print',
+    Template._cmd_format.im_func : 'format',
+    Template._cmd_end_format.im_func : 'end_format',
+    Template._cmd_include.im_func : 'include',
+    Template._cmd_if_any.im_func : 'if_any',
+    Template._cmd_if_index.im_func : 'if_index',
+    Template._cmd_is.im_func : 'is',
+    Template._cmd_for.im_func : 'for',
+    Template._cmd_define.im_func : 'define',
+    }
+
+  def __init__(self):
+    self.lines = [ ]
+    self.indent = 1
+    self.count = 0
+    # objects bound to local variables (by default arguments) of the
+    # generated function, and other objects it refers to as globals
+    self.locals = {
+      '_StringType' : StringType,
+      '_iter' : _iter,
+      '_get_value' : _get_value,
+      '_convert_value' : _convert_value,
+      '_print_value' : _print_value,
+      '_lower' : string.lower,
+      '_StringIO' : cStringIO.StringIO,
+      '_UnknownReference' : UnknownReference,
+      '_NeedSequenceError' : NeedSequenceError,
+      }
+    self.globals = { }
+    self.local_names = { }  # id(object) -> name of the variable holding it
+    self.loops = { }        # refname of active [for] -> iterator variable
+    self.shadowed = { }     # refnames of [for] loops nested in themselves
+    self.defines = { }      # names assigned by [define]
+    self.opaque = 0         # are there steps which may do anything?
+    self.formatters = [ ]   # formatters in effect (None if unknown)
+    self.text = [ ]         # literal text not yet written
+
+  def compile(self, program):
+    """Return the function which executes PROGRAM, given an execution
+    context, or None if PROGRAM can't be compiled."""
+    self._scan(program, [ ])
+    self._section(program)
+
+    names = self.locals.keys()
+    names.sort()
+    args = [ 'ctx' ]
+    for name in names:
+      args.append('%s=%s' % (name, name))
+    source = string.join(['def render(%s):' % string.join(args, ', '),
+                          '  write = ctx.fp.write',
+                          '  data = ctx.data',
+                          '  defines = ctx.defines',
+                          '  for_iterators = ctx.for_iterators']
+                         + self.lines, '\n') + '\n'
+    try:
+      code = compile(source, '<ezt template>', 'exec')
+    except SyntaxError:
+      # nested too deeply for Python to compile
+      return None
+    namespace = self.globals.copy()
+    namespace.update(self.locals)
+    exec code in namespace
+    return namespace['render']
+
+  def _scan(self, program, for_names):
+    # find the names which may be defined, and any loops which reuse the
+    # name of an enclosing loop, before code depending on them is emitted
+    for step in program:
+      if isinstance(step, StringType):
+        continue
+      kind = self._kind(step)
+      if kind is None or kind == 'include':
+        self.opaque = 1
+      elif kind == 'for':
+        refname = step[1][0][0][0]
+        if refname in for_names:
+          self.shadowed[refname] = 1
+        self._scan(step[1][2], for_names + [refname])
+      elif kind == 'define':
+        self.defines[step[1][0][0]] = 1
+        if step[1][2] is not None:
+          self._scan(step[1][2], for_names)
+      elif kind in ('if_any', 'if_index', 'is'):
+        for section in step[1][1:]:
+          if section is not None:
+            self._scan(section, for_names)
+
+  def _kind(self, step):
+    return self._kinds.get(getattr(step[0], 'im_func', None))
+
+  def _emit(self, line):
+    self.lines.append('  ' * self.indent + line)
+
+  def _name(self, prefix):
+    self.count = self.count + 1
+    return '%s%d' % (prefix, self.count)
+
+  def _local(self, ob):
+    name = self.local_names.get(id(ob))
+    if name is None:
+      name = self.local_names[id(ob)] = self._name('_f')
+      self.locals[name] = ob
+    return name
+
+  def _global(self, ob):
+    name = self._name('_k')
+    self.globals[name] = ob
+    return name
+
+  def _flush(self):
+    if self.text:
+      self._emit('write(%r)' % string.join(self.text, ''))
+      self.text = [ ]
+
+  def _section(self, program):
+    start = len(self.lines)
+    formatters = self.formatters[:]
+    for step in program:
+      if isinstance(step, StringType):
+        self.text.append(step)
+        continue
+      kind = self._kind(step)
+      if kind is None or kind == 'include':
+        self._flush()
+        step = self._global(step)
+        self._emit('%s[0](%s[1], ctx)' % (step, step))
+        self._emit('write = ctx.fp.write')
+      else:
+        getattr(self, '_compile_' + kind)(step[1])
+    self._flush()
+    self.formatters = formatters
+    if len(self.lines) == start:
+      self._emit('pass')
+
+  def _block(self, section):
+    self.indent = self.indent + 1
+    self._section(section)
+    self.indent = self.indent - 1
+
+  def _attrs(self, expr, attrs):
+    for attr in attrs:
+      if _re_name.match(attr) and not keyword.iskeyword(attr) \
+             and attr != 'None':
+        expr = '%s.%s' % (expr, attr)
+      else:
+        expr = 'getattr(%s, %r)' % (expr, attr)
+    return expr
+
+  def _ref(self, (refname, start, rest), target, convert=1):
+    # emit code which assigns the value of the reference to TARGET,
+    # unconverted (see _convert_value) unless CONVERT is true
+    if rest is None:
+      # a string constant, which is never converted
+      self._emit('%s = %r' % (target, start))
+      return
+    if self.shadowed.has_key(start):
+      # let _get_value sort out which loop is meant
+      self._emit('%s = _get_value(%s, ctx)'
+                 % (target, self._global((refname, start, rest))))
+      return
+    if self.loops.has_key(start):
+      lines = [ '%s = %s' % (target,
+                             self._attrs(self.loops[start] + '.last_item',
+                                         rest)) ]
+    elif self.opaque or self.defines.has_key(start):
+      lines = [ 'if defines.has_key(%r):' % start,
+                '  %s = defines[%r]' % (target, start),
+                'else:',
+                '  %s = %s' % (target, self._attrs('data', [ start ])) ]
+      if rest:
+        lines.append('%s = %s' % (target, self._attrs(target, rest)))
+    else:
+      lines = [ '%s = %s' % (target, self._attrs('data', [ start ] + rest)) ]
+    if self.loops.has_key(start) and not rest:
+      self._emit(lines[0])
+    else:
+      self._emit('try:')
+      for line in lines:
+        self._emit('  ' + line)
+      self._emit('except AttributeError:')
+      self._emit('  raise _UnknownReference(%r)' % refname)
+    if convert:
+      self._emit('if type(%s) is not _StringType:' % target)
+      self._emit('  %s = _convert_value(%s)' % (target, target))
+
+  def _format_chain(self):
+    "Return the list of formatters to apply to printed values, if known."
+    if self.opaque or None in self.formatters:
+      return None
+    chain = [ ]
+    for formatter in self.formatters:
+      if formatter is not _raw_formatter:
+        chain.insert(0, formatter)
+    return chain
+
+  def _if(self, cond, t_section, f_section):
+    if t_section is None:
+      t_section = f_section
+      f_section = None
+    self._emit('if %s:' % cond)
+    self._block(t_section)
+    if f_section:
+      self._emit('else:')
+      self._block(f_section)
+
+  def _compile_print(self, valrefs):
+    chain = self._format_chain()
+    refname, start, rest = valrefs[0]
+    if len(valrefs) > 1 or chain is None:
+      self._flush()
+      self._ref(valrefs[0], '_v')
+      args = [ ]
+      for i in range(1, len(valrefs)):
+        self._ref(valrefs[i], '_a%d' % i)
+        args.append('_a%d' % i)
+      self._emit('_print_value(_v, [%s], ctx, %r)'
+                 % (string.join(args, ', '), refname))
+    elif rest is None and isinstance(start, StringType):
+      for formatter in chain:
+        start = formatter(start)
+      self.text.append(start)
+    else:
+      self._flush()
+      self._ref(valrefs[0], '_v', 0)
+      expr = '_v'
+      for formatter in chain:
+        expr = '%s(%s)' % (self._local(formatter), expr)
+      self._emit('if type(_v) is _StringType:')
+      self._emit('  write(%s)' % expr)
+      self._emit('else:')
+      self._emit('  _print_value(_convert_value(_v), [], ctx, %r)' % refname)
+
+  def _compile_format(self, formatter):
+    if type(formatter) is TupleType:
+      self._flush()
+      self._ref(formatter, '_v')
+      self._emit('ctx.formatters.append(_v)')
+      self.formatters.append(None)
+    else:
+      self._emit('ctx.formatters.append(%s)' % self._local(formatter))
+      self.formatters.append(formatter)
+
+  def _compile_end_format(self, unused):
+    self._emit('ctx.formatters.pop()')
+    if self.formatters:
+      self.formatters.pop()
+
+  def _compile_if_any(self, (valrefs, t_section, f_section)):
+    self._flush()
+    if not valrefs:
+      self._emit('_v = 0')
+    # stop at the first true value
+    indent = self.indent
+    for i in range(len(valrefs)):
+      if i:
+        self._emit('if not _v:')
+        self.indent = self.indent + 1
+      self._ref(valrefs[i], '_v')
+    self.indent = indent
+    self._if('_v', t_section, f_section)
+
+  def _compile_if_index(self, ((valref, value), t_section, f_section)):
+    self._flush()
+    refname = valref[0]
+    if self.loops.has_key(refname) and not self.shadowed.has_key(refname):
+      iterator = self.loops[refname]
+    else:
+      self._emit('_v = for_iterators[%r]' % refname)
+      iterator = '_v'
+    if value == 'even':
+      cond = '%s.index %% 2 == 0' % iterator
+    elif value == 'odd':
+      cond = '%s.index %% 2 == 1' % iterator
+    elif value == 'first':
+      cond = '%s.index == 0' % iterator
+    elif value == 'last':
+      cond = '%s.is_last()' % iterator
+    else:
+      try:
+        cond = '%s.index == %d' % (iterator, int(value))
+      except ValueError:
+        # leave the error for when the directive is executed
+        cond = '%s.index == int(%r)' % (iterator, value)
+    self._if(cond, t_section, f_section)
+
+  def _compile_is(self, ((left_ref, right_ref), t_section, f_section)):
+    self._flush()
+    if right_ref[2] is None and isinstance(right_ref[1], StringType):
+      right = repr(string.lower(right_ref[1]))
+    else:
+      self._ref(right_ref, '_r')
+      right = '_lower(_r)'
+    self._ref(left_ref, '_v')
+    self._if('_lower(_v) == %s' % right, t_section, f_section)
+
+  def _compile_for(self, ((valref,), unused, section)):
+    self._flush()
+    refname = valref[0]
+    self._ref(valref, '_v')
+    self._emit('if isinstance(_v, _StringType):')
+    self._emit('  raise _NeedSequenceError(%r)'
+               % ("The value of '%s' is not a sequence" % refname))
+    iterator = self._name('_i')
+    self._emit('for_iterators[%r] = %s = _iter(_v)' % (refname, iterator))
+    self._emit('for _unused in %s:' % iterator)
+    outer = self.loops.get(refname)
+    self.loops[refname] = iterator
+    self._block(section)
+    if outer:
+      self.loops[refname] = outer
+    else:
+      del self.loops[refname]
+    self._emit('del for_iterators[%r]' % refname)
+
+  def _compile_define(self, ((name,), unused, section)):
+    self._flush()
+    origfp = self._name('_o')
+    self._emit('%s = ctx.fp' % origfp)
+    self._emit('ctx.fp = _StringIO()')
+    self._emit('write = ctx.fp.write')
+    if section is not None:
+      self._section(section)
+    self._emit('defines[%r] = ctx.fp.getvalue()' % name)
+    self._emit('ctx.fp = %s' % origfp)
+    self._emit('write = ctx.fp.write')
+
+
 class Context:
   """A container for the execution context"""
   def __init__(self, fp):
@@ -724,30 +1079,30 @@ class _Iterator:
 
   def __init__(self, sequence):
     self._iter = iter(sequence)
+    self._have_next = 0
+    self.index = -1
 
   def next(self):
-    if hasattr(self, '_next_item'):
+    if self._have_next:
       self.last_item = self._next_item
+      self._have_next = 0
       del self._next_item
     else:
       self.last_item = self._iter.next() # may raise StopIteration
 
-    if hasattr(self, 'index'):
-      self.index = self.index + 1
-    else:
-      self.index = 0
-
+    self.index = self.index + 1
     return self.last_item
 
   def is_last(self):
     """Return true if the current item is the last in the sequence"""
     # the only way we can tell if the current item is last is to call next()
     # and store the return value so it doesn't get lost
-    if not hasattr(self, '_next_item'):
+    if not self._have_next:
       try:
         self._next_item = self._iter.next()
       except StopIteration:
         return 1
+      self._have_next = 1
     return 0
 
   def __iter__(self):
@@ -845,7 +1200,63 @@ def _test(argv):
   verbose = "-v" in argv
   return doctest.testmod(ezt, verbose=verbose)
 
+# --- micro-benchmark ---
+_bench_template = """<table>
+[for rows]<tr class="[if-index rows odd]vc_row_odd[else]vc_row_even[end]">
+<td><a name="[rows.anchor]" href="[rows.view_href]" title="View [rows.name]">\
+[rows.name][is rows.pathtype "dir"]/[end]</a></td>
+[if-any rows.rev]<td><a href="[rows.log_href]"><strong>[rows.rev]</strong></a>\
+</td><td>[rows.ago]</td><td>[rows.author]</td>
+<td>[format "raw"][rows.log][end]</td>[else]<td colspan="4">&nbsp;</td>[end]
+</tr>
+[end]</table>
+"""
+
+class _BenchRow:
+  def __init__(self, i):
+    self.anchor = 'file%d.c' % i
+    self.name = 'file%d.c' % i
+    self.view_href = '/viewvc/trunk/file%d.c?view=log&amp;pathrev=%d' % (i, i)
+    self.log_href = self.view_href
+    self.pathtype = i % 5 and 'file' or 'dir'
+    self.rev = i % 7 and i or None
+    self.ago = '%d days' % (i % 30)
+    self.author = '<user%d>' % (i % 13)
+    self.log = 'Fixed bug #%d & cleaned up' % i
+
+def _bench(argv):
+  """Time the generation of a directory listing of ROWS entries (from
+  the command line, default 2000), interpreted and compiled."""
+  import sys, time
+  rows = 2000
+  if argv:
+    rows = int(argv[0])
+  data = { 'rows' : map(_BenchRow, range(rows)) }
+  template = Template()
+  template.parse(_bench_template, FORMAT_HTML)
+  render = template._render
+  outputs = [ ]
+  for label, func in (('interpreted', None), ('compiled', render)):
+    template._render = func
+    best = None
+    for i in range(5):
+      fp = cStringIO.StringIO()
+      t = time.time()
+      template.generate(fp, data)
+      t = time.time() - t
+      if best is None or t < best:
+        best = t
+    outputs.append(fp.getvalue())
+    sys.stdout.write('%-12s %8.2f ms\n' % (label, best * 1000))
+  if outputs[0] != outputs[1]:
+    sys.stdout.write('OUTPUT DIFFERS\n')
+    return 1
+  return 0
+
 if __name__ == "__main__":
-  # invoke unit test for this module:
   import sys
+  if sys.argv[1:2] == ['bench']:
+    # benchmark template generation: ezt.py bench [ROWS]
+    sys.exit(_bench(sys.argv[2:]))
+  # invoke unit test for this module:
   sys.exit(_test(sys.argv)[0])
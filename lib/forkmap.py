@@ -0,0 +1,270 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+#
+# forkmap.py: a map() which spreads its work across child processes
+#
+# The children are forked from the calling process, so the function
+# being mapped sees all of the caller's state (open repositories,
+# configuration, and so on).  Only the results are passed back, pickled
+# through a pipe.  Where os.fork() is unavailable, the work is simply
+# done in the calling process.
+#
+# forkimap() is the iterator version, which passes each result back as
+# soon as it is ready, so that long-running jobs can be consumed (and
+# their progress reported) as they go.
+#
+# -----------------------------------------------------------------------
+
+import os
+import sys
+import struct
+import select
+import cPickle
+
+
+def forkmap(func, items, jobs):
+  """Return map(FUNC, ITEMS), with the calls to FUNC spread across as
+  many as JOBS child processes.  The results returned by FUNC must be
+  picklable.  If FUNC raises an exception in a child process, that
+  exception (or a RuntimeError describing it, if it can't be pickled)
+  is raised once all of the children have finished."""
+
+  items = list(items)
+  if jobs > len(items):
+    jobs = len(items)
+  if jobs < 2 or not hasattr(os, 'fork'):
+    return map(func, items)
+
+  # flush the stdio buffers, so that the children don't write out
+  # copies of whatever is in them
+  sys.stdout.flush()
+  sys.stderr.flush()
+
+  # child N handles items N, N + JOBS, N + 2 * JOBS, ...
+  children = [ ]
+  try:
+    for i in range(jobs):
+      r, w = os.pipe()
+      pid = os.fork()
+      if not pid:
+        os.close(r)
+        _run_child(w, func, items[i::jobs])
+      os.close(w)
+      children.append((pid, os.fdopen(r, 'rb')))
+  finally:
+    # gather the results of whichever children were started
+    results = [ None ] * len(items)
+    error = None
+    for i in range(len(children)):
+      pid, fp = children[i]
+      data = fp.read()
+      fp.close()
+      os.waitpid(pid, 0)
+      try:
+        ok, value = cPickle.loads(data)
+      except Exception:
+        ok, value = 0, RuntimeError('worker process %d failed' % pid)
+      if not ok:
+        error = error or value
+      else:
+        results[i::jobs] = value
+
+  if error:
+    raise error
+  return results
+
+
+def forkimap(func, items, jobs):
+  """Return an iterator over FUNC(item) for each of ITEMS, with the
+  calls to FUNC spread across as many as JOBS child processes, in
+  whatever order the results become available.  As with forkmap(), the
+  results must be picklable, and an exception raised by FUNC in a
+  child process is raised once all of the children have finished (the
+  rest of that child's ITEMS being left undone).
+
+  If the results aren't all consumed, the iterator's close() method
+  must be called to stop the children and wait for them to exit."""
+
+  items = list(items)
+  if jobs > len(items):
+    jobs = len(items)
+  return _ForkIterator(func, items, jobs)
+
+
+class _ForkIterator:
+  """The iterator returned by forkimap()."""
+
+  def __init__(self, func, items, jobs):
+    self.func = func
+    self.results = [ ]    # results read from the children, not yet returned
+    self.error = None     # the first error reported by a child
+    # map each child's pipe to its pid and any partial result read from it
+    self.children = { }
+    self.items = None
+    if jobs < 2 or not hasattr(os, 'fork'):
+      # do the work here, as the results are asked for
+      self.items = iter(items)
+      return
+    for pid, fd in _fork_children(func, items, jobs):
+      self.children[fd] = (pid, '')
+
+  def __iter__(self):
+    return self
+
+  def next(self):
+    if self.items is not None:
+      return self.func(self.items.next())
+    while not self.results and self.children:
+      self._read()
+    if self.results:
+      value = self.results[0]
+      del self.results[0]
+      return value
+    if self.error:
+      error = self.error
+      self.error = None
+      raise error
+    raise StopIteration
+
+  def close(self):
+    """Stop the children still running, and wait for them to exit.
+    Closing their pipes makes each fail as soon as it next writes a
+    result."""
+    self.items = iter([ ])
+    children = self.children
+    self.children = { }
+    for fd in children.keys():
+      os.close(fd)
+    for pid, data in children.values():
+      os.waitpid(pid, 0)
+
+  def _read(self):
+    """Read whatever the children have written, waiting if need be."""
+    for fd in select.select(self.children.keys(), [], [])[0]:
+      pid, data = self.children[fd]
+      chunk = os.read(fd, 65536)
+      if chunk:
+        records, data = _split_records(data + chunk)
+        self.children[fd] = (pid, data)
+        for ok, value in records:
+          if ok:
+            self.results.append(value)
+          else:
+            self.error = self.error or value
+      else:
+        os.close(fd)
+        del self.children[fd]
+        status = os.waitpid(pid, 0)[1]
+        if data or status:
+          self.error = self.error \
+                       or RuntimeError('worker process %d failed' % pid)
+
+
+def _fork_children(func, items, jobs):
+  """Fork JOBS children, child N streaming the results of FUNC for
+  items N, N + JOBS, N + 2 * JOBS, ... of ITEMS.  Return a list of
+  (pid, fd) pairs, FD being the read end of the child's pipe."""
+
+  # flush the stdio buffers, so that the children don't write out
+  # copies of whatever is in them
+  sys.stdout.flush()
+  sys.stderr.flush()
+
+  children = [ ]
+  try:
+    for i in range(jobs):
+      r, w = os.pipe()
+      pid = os.fork()
+      if not pid:
+        os.close(r)
+        for other_pid, fd in children:
+          os.close(fd)
+        _stream_child(w, func, items[i::jobs])
+      os.close(w)
+      children.append((pid, r))
+  except:
+    # the children already started will die writing to a closed pipe
+    for pid, fd in children:
+      os.close(fd)
+      os.waitpid(pid, 0)
+    raise
+  return children
+
+
+def _split_records(data):
+  """Return a list of the complete records at the start of DATA (as
+  written by _write_record()), and whatever is left of it."""
+  records = [ ]
+  pos = 0
+  while len(data) - pos >= 4:
+    size = struct.unpack('!I', data[pos:pos+4])[0]
+    if len(data) - pos - 4 < size:
+      break
+    records.append(cPickle.loads(data[pos+4:pos+4+size]))
+    pos = pos + 4 + size
+  return records, data[pos:]
+
+
+def _write_record(fp, result):
+  data = _dumps(result)
+  fp.write(struct.pack('!I', len(data)) + data)
+  fp.flush()
+
+
+def _dumps(result):
+  """Pickle RESULT, an (OK, VALUE) pair, replacing it with an error if
+  VALUE can't be pickled."""
+  try:
+    return cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+  except Exception:
+    if result[0]:
+      message = 'worker process returned an unpicklable result'
+    else:
+      message = '%s: %s' % (result[1].__class__.__name__, result[1])
+    return cPickle.dumps((0, RuntimeError(message)), cPickle.HIGHEST_PROTOCOL)
+
+
+def _stream_child(fd, func, items):
+  """Run in a child process: write the pickled result of FUNC for each
+  of ITEMS to file descriptor FD as soon as it is ready, and exit."""
+  status = 1
+  try:
+    fp = os.fdopen(fd, 'wb')
+    try:
+      for item in items:
+        _write_record(fp, (1, func(item)))
+    except Exception, e:
+      _write_record(fp, (0, e))
+    fp.close()
+    status = 0
+  finally:
+    # never return into the caller's code, or run its cleanup handlers
+    os._exit(status)
+
+
+def _run_child(fd, func, items):
+  """Run in a child process: write the pickled results of mapping FUNC
+  over ITEMS to file descriptor FD, and exit."""
+  status = 1
+  try:
+    try:
+      result = (1, map(func, items))
+    except Exception, e:
+      result = (0, e)
+    data = _dumps(result)
+    fp = os.fdopen(fd, 'wb')
+    fp.write(data)
+    fp.close()
+    status = 0
+  finally:
+    # never return into the caller's code, or run its cleanup handlers
+    os._exit(status)
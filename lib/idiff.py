@@ -19,12 +19,54 @@ from __future__ import generators
 import difflib
 import sys
 import re
+import time
 
 from common import _item, _RCSDIFF_NO_CHANGES
+import linediff
 import ezt
 import sapi
 
-def sidebyside(fromlines, tolines, context):
+# Default limits on the intraline comparisons done for a single diff:
+# changed blocks of more than this many characters (both sides
+# together) are shown line by line, as are all blocks once this many
+# seconds have been spent comparing characters.
+MAX_BLOCK_SIZE = 16384
+TIME_LIMIT = 2
+
+class _Budget:
+  """The limits on the intraline comparisons done for a diff, and the
+  time spent on them so far."""
+
+  def __init__(self, max_block_size, time_limit):
+    if max_block_size is None:
+      max_block_size = MAX_BLOCK_SIZE
+    if time_limit is None:
+      time_limit = TIME_LIMIT
+    self.max_block_size = max_block_size
+    self.time_left = time_limit
+
+  def allows(self, fromlines, tolines):
+    """Return true iff FROMLINES and TOLINES may be compared character
+    by character."""
+    if self.time_left <= 0:
+      return 0
+    size = 0
+    for line in fromlines:
+      size = size + len(line)
+    for line in tolines:
+      size = size + len(line)
+    return size <= self.max_block_size
+
+  def compare(self, func, *args):
+    """Return a list of the items FUNC(*ARGS) generates, charging the
+    time taken to the budget."""
+    start = time.time()
+    items = list(apply(func, args))
+    self.time_left = self.time_left - (time.time() - start)
+    return items
+
+def sidebyside(fromlines, tolines, context, max_block_size=None,
+               time_limit=None):
   """Generate side by side diff"""
 
   ### for some reason mdiff chokes on \n's in input lines
@@ -33,8 +75,9 @@ def sidebyside(fromlines, tolines, context):
   tolines = map(line_strip, tolines)
   had_changes = 0
 
+  budget = _Budget(max_block_size, time_limit)
   gap = False
-  for fromdata, todata, flag in difflib._mdiff(fromlines, tolines, context):
+  for fromdata, todata, flag in _mdiff(fromlines, tolines, context, budget):
     if fromdata is None and todata is None and flag is None:
       gap = True
     else:
@@ -46,6 +89,80 @@ def sidebyside(fromlines, tolines, context):
   if not had_changes:
     yield _item(type=_RCSDIFF_NO_CHANGES)
 
+def _mdiff(fromlines, tolines, context, budget):
+  """Generate the rows difflib._mdiff() would, but with the changed
+  blocks found by linediff, and only those blocks which the BUDGET
+  allows marked up with intraline changes."""
+
+  rows = _mdiff_rows(fromlines, tolines, budget)
+  if context is None:
+    for row in rows:
+      yield row
+    return
+
+  # The rest follows difflib._mdiff(), showing CONTEXT rows either side
+  # of the changed ones, and a (None, None, None) row for each gap.
+  context = context + 1
+  while True:
+    index = 0
+    context_rows = [None] * context
+    found_diff = False
+    while not found_diff:
+      row = rows.next()
+      found_diff = row[2]
+      context_rows[index % context] = row
+      index = index + 1
+    if index > context:
+      yield None, None, None
+      lines_to_write = context
+    else:
+      lines_to_write = index
+      index = 0
+    while lines_to_write:
+      yield context_rows[index % context]
+      index = index + 1
+      lines_to_write = lines_to_write - 1
+    lines_to_write = context - 1
+    while lines_to_write:
+      row = rows.next()
+      if row[2]:
+        lines_to_write = context - 1
+      else:
+        lines_to_write = lines_to_write - 1
+      yield row
+
+def _mdiff_rows(fromlines, tolines, budget):
+  # Generate a row for every line of FROMLINES and TOLINES.
+  pos1 = pos2 = 0
+  changes = linediff.get_changes(fromlines, tolines)
+  for i1, i2, j1, j2 in changes + [(len(fromlines), None, len(tolines), None)]:
+    while pos1 < i1:
+      yield (pos1 + 1, fromlines[pos1]), (pos2 + 1, tolines[pos2]), False
+      pos1 = pos1 + 1
+      pos2 = pos2 + 1
+    if i2 is None:
+      break
+    fromblock = fromlines[i1:i2]
+    toblock = tolines[j1:j2]
+    if fromblock and toblock and budget.allows(fromblock, toblock):
+      for fromdata, todata, flag in budget.compare(difflib._mdiff,
+                                                   fromblock, toblock):
+        if fromdata[0] != '':
+          fromdata = fromdata[0] + i1, fromdata[1]
+        if todata[0] != '':
+          todata = todata[0] + j1, todata[1]
+        yield fromdata, todata, flag
+    else:
+      for k in range(max(len(fromblock), len(toblock))):
+        fromdata = todata = ('', '\n')
+        if k < len(fromblock):
+          fromdata = i1 + k + 1, '\0-' + (fromblock[k] or ' ') + '\1'
+        if k < len(toblock):
+          todata = j1 + k + 1, '\0+' + (toblock[k] or ' ') + '\1'
+        yield fromdata, todata, True
+    pos1 = i2
+    pos2 = j2
+
 _re_mdiff = re.compile("\0([+-^])(.*?)\1")
 
 def _mdiff_split(flag, (line_number, text)):
@@ -72,10 +189,11 @@ def _mdiff_split(flag, (line_number, text)):
 
   return _item(segments=segments, line_number=line_number)  
 
-def unified(fromlines, tolines, context):
+def unified(fromlines, tolines, context, max_block_size=None,
+            time_limit=None):
   """Generate unified diff"""
 
-  diff = difflib.Differ().compare(fromlines, tolines)
+  diff = _differ(fromlines, tolines, _Budget(max_block_size, time_limit))
   lastrow = None
   had_changes = 0
 
@@ -97,6 +215,32 @@ def unified(fromlines, tolines, context):
   if not had_changes:
     yield _item(type=_RCSDIFF_NO_CHANGES)
 
+def _differ(fromlines, tolines, budget):
+  """Generate the lines difflib.Differ().compare() would, but with the
+  changed blocks found by linediff, and only those blocks which the
+  BUDGET allows given '? ' guide lines."""
+
+  pos1 = 0
+  changes = linediff.get_changes(fromlines, tolines)
+  for i1, i2, j1, j2 in changes + [(len(fromlines), None, None, None)]:
+    while pos1 < i1:
+      yield "  " + fromlines[pos1]
+      pos1 = pos1 + 1
+    if i2 is None:
+      break
+    fromblock = fromlines[i1:i2]
+    toblock = tolines[j1:j2]
+    if fromblock and toblock and budget.allows(fromblock, toblock):
+      for line in budget.compare(difflib.Differ().compare,
+                                 fromblock, toblock):
+        yield line
+    else:
+      for line in fromblock:
+        yield "- " + line
+      for line in toblock:
+        yield "+ " + line
+    pos1 = i2
+
 def _trim_context(lines, context_size):
   """Trim context lines that don't surround changes from Differ results
 
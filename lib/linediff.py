@@ -0,0 +1,871 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+#
+# linediff: in-process line differences, formatted like GNU diff
+#
+# Both versions of a file are often in memory already, so writing them
+# out and running diff on them is wasteful.  The changes are found here
+# instead, either with Myers' O(ND) algorithm (in linear space, as GNU
+# diff does it, with the same clean-up of change boundaries) or with
+# the patience algorithm, and formatted as GNU diff's unified, context
+# or side-by-side output.
+#
+# -----------------------------------------------------------------------
+
+from __future__ import generators
+
+import re
+
+
+MYERS = 'myers'
+PATIENCE = 'patience'
+
+# Lines starting with these are taken to be function headings (as with
+# GNU diff's --show-c-function option).
+_re_function = re.compile('[A-Za-z$_]')
+
+_BINARY_MESSAGE = 'Binary files %s and %s differ\n'
+_NO_NEWLINE = '\\ No newline at end of file\n'
+
+
+def split_lines(text):
+  """Return the lines of TEXT, each with its trailing newline (if any)."""
+  lines = text.split('\n')
+  last = lines.pop()
+  lines = [line + '\n' for line in lines]
+  if last:
+    lines.append(last)
+  return lines
+
+
+def is_binary(text):
+  """Return true iff diff would take TEXT to be binary data."""
+  return text.find('\0') != -1
+
+
+def get_changes(lines1, lines2, algorithm=MYERS, ignore_white=0,
+                horizon=None):
+  """Return the differences between the lists of lines LINES1 and
+  LINES2 as a list of (I1, I2, J1, J2) tuples, in order, each meaning
+  that LINES1[I1:I2] were replaced by LINES2[J1:J2] (one of which may
+  be empty).  If IGNORE_WHITE is true, lines differing only in white
+  space are taken to be equal.
+
+  If HORIZON is not None, the identical lines at the start and end of
+  the files are left out of the comparison, all but the HORIZON lines
+  next to the differing ones.  GNU diff does this, with a horizon as
+  large as the context shown, and it affects which of several equally
+  short sets of changes is found."""
+
+  # Skip the identical start and end of the files.
+  n1 = len(lines1)
+  n2 = len(lines2)
+  lo = 0
+  hi1 = n1
+  hi2 = n2
+  if horizon is not None:
+    n = min(n1, n2)
+    while lo < n and lines1[lo] == lines2[lo]:
+      lo = lo + 1
+    while hi1 > lo and hi2 > lo and lines1[hi1 - 1] == lines2[hi2 - 1]:
+      hi1 = hi1 - 1
+      hi2 = hi2 - 1
+    if lo == n1 and lo == n2:
+      return []
+    lo = max(0, lo - horizon)
+    hi1 = min(n1, hi1 + horizon)
+    hi2 = min(n2, hi2 + horizon)
+
+  # Number the distinct lines, so the comparisons are of integers.
+  ids = {}
+  seqs = []
+  for lines in lines1[lo:hi1], lines2[lo:hi2]:
+    seq = []
+    for line in lines:
+      if ignore_white:
+        line = ''.join(line.split())
+      seq.append(ids.setdefault(line, len(ids)))
+    seqs.append(seq)
+  seq1, seq2 = seqs
+
+  # Flags for each line (plus a sentinel at either end), set for the
+  # lines which were deleted or inserted.
+  changed1 = [0] * (len(seq1) + 2)
+  changed2 = [0] * (len(seq2) + 2)
+  if algorithm == PATIENCE:
+    _patience(seq1, seq2, 0, len(seq1), 0, len(seq2), changed1, changed2)
+  else:
+    _myers(seq1, seq2, 0, len(seq1), 0, len(seq2), changed1, changed2)
+  _shift_boundaries(seq1, changed1, changed2)
+  _shift_boundaries(seq2, changed2, changed1)
+
+  changes = []
+  n1 = len(seq1)
+  n2 = len(seq2)
+  i = j = 0
+  while i < n1 or j < n2:
+    if i < n1 and j < n2 and not changed1[i + 1] and not changed2[j + 1]:
+      i = i + 1
+      j = j + 1
+      continue
+    i1 = i
+    j1 = j
+    while i < n1 and changed1[i + 1]:
+      i = i + 1
+    while j < n2 and changed2[j + 1]:
+      j = j + 1
+    changes.append((lo + i1, lo + i, lo + j1, lo + j))
+  return changes
+
+
+def _myers(seq1, seq2, lo1, hi1, lo2, hi2, changed1, changed2):
+  # Leave out the lines which cannot be matched, as they are changed
+  # regardless, and those which would only confuse the comparison.
+  counts1 = {}
+  for x in seq1[lo1:hi1]:
+    counts1[x] = counts1.get(x, 0) + 1
+  counts2 = {}
+  for x in seq2[lo2:hi2]:
+    counts2[x] = counts2.get(x, 0) + 1
+  xs, xmap = _discard_lines(seq1, lo1, hi1, counts2, changed1)
+  ys, ymap = _discard_lines(seq2, lo2, hi2, counts1, changed2)
+
+  flags1 = [0] * len(xs)
+  flags2 = [0] * len(ys)
+  too_expensive = 1
+  diags = len(xs) + len(ys) + 3
+  while diags:
+    too_expensive = too_expensive << 1
+    diags = diags >> 2
+  too_expensive = max(256, too_expensive)
+  _compareseq(xs, ys, 0, len(xs), 0, len(ys), flags1, flags2, too_expensive)
+  for k in xrange(len(xs)):
+    if flags1[k]:
+      changed1[xmap[k] + 1] = 1
+  for k in xrange(len(ys)):
+    if flags2[k]:
+      changed2[ymap[k] + 1] = 1
+
+
+def _discard_lines(seq, lo, hi, other_counts, changed):
+  # Flag the lines of SEQ[LO:HI] that are not in the other sequence
+  # (whose line counts are OTHER_COUNTS) as changed, as well as those
+  # which are very common there and lie amid lines that are, as GNU
+  # diff's discard_confusing_lines() does.  Return the remaining
+  # lines, and a list of their indexes in SEQ.
+  end = hi - lo
+  many = 5
+  tem = end / 64
+  tem = tem >> 2
+  while tem > 0:
+    many = many * 2
+    tem = tem >> 2
+
+  # 1 for lines to discard, 2 for those to discard provisionally
+  discards = [0] * end
+  for i in xrange(end):
+    nmatch = other_counts.get(seq[lo + i], 0)
+    if nmatch == 0:
+      discards[i] = 1
+    elif nmatch > many:
+      discards[i] = 2
+
+  # Only discard provisional lines in the middle of runs of discarded
+  # lines, which begin and end with definite ones.
+  i = 0
+  while i < end:
+    if discards[i] == 2:
+      discards[i] = 0
+    elif discards[i]:
+      provisional = 0
+      j = i
+      while j < end and discards[j]:
+        if discards[j] == 2:
+          provisional = provisional + 1
+        j = j + 1
+      while j > i and discards[j - 1] == 2:
+        j = j - 1
+        discards[j] = 0
+        provisional = provisional - 1
+      length = j - i
+
+      if provisional * 4 > length:
+        # too many to be worth discarding
+        while j > i:
+          j = j - 1
+          if discards[j] == 2:
+            discards[j] = 0
+      else:
+        # Keep subruns of MINIMUM or more provisional lines.
+        minimum = 1
+        tem = length >> 2
+        tem = tem >> 2
+        while tem > 0:
+          minimum = minimum << 1
+          tem = tem >> 2
+        minimum = minimum + 1
+        j = consec = 0
+        while j < length:
+          if discards[i + j] != 2:
+            consec = 0
+          else:
+            consec = consec + 1
+            if consec == minimum:
+              j = j - consec
+            elif consec > minimum:
+              discards[i + j] = 0
+          j = j + 1
+
+        # Keep provisional lines near the ends of the run.
+        for k in (i, i + length - 1):
+          if k == i:
+            step = 1
+          else:
+            step = -1
+          consec = 0
+          for j in xrange(length):
+            d = discards[k + j * step]
+            if j >= 8 and d == 1:
+              break
+            if d == 2:
+              consec = 0
+              discards[k + j * step] = 0
+            elif d == 0:
+              consec = 0
+            else:
+              consec = consec + 1
+            if consec == 3:
+              break
+        i = i + length - 1
+    i = i + 1
+
+  kept = []
+  indexes = []
+  for i in xrange(end):
+    if discards[i]:
+      changed[lo + i + 1] = 1
+    else:
+      kept.append(seq[lo + i])
+      indexes.append(lo + i)
+  return kept, indexes
+
+
+def _compareseq(xv, yv, xoff, xlim, yoff, ylim, flags1, flags2,
+                too_expensive):
+  # Mark the lines of XV[XOFF:XLIM] and YV[YOFF:YLIM] which are not in
+  # their longest common subsequence (as found by Myers' algorithm,
+  # splitting the problem at the middle snake of an optimal path).
+  stack = [(xoff, xlim, yoff, ylim)]
+  while stack:
+    xoff, xlim, yoff, ylim = stack.pop()
+    while xoff < xlim and yoff < ylim and xv[xoff] == yv[yoff]:
+      xoff = xoff + 1
+      yoff = yoff + 1
+    while xlim > xoff and ylim > yoff and xv[xlim - 1] == yv[ylim - 1]:
+      xlim = xlim - 1
+      ylim = ylim - 1
+    if xoff == xlim:
+      for y in xrange(yoff, ylim):
+        flags2[y] = 1
+    elif yoff == ylim:
+      for x in xrange(xoff, xlim):
+        flags1[x] = 1
+    else:
+      xmid, ymid = _diag(xv, yv, xoff, xlim, yoff, ylim, too_expensive)
+      stack.append((xmid, xlim, ymid, ylim))
+      stack.append((xoff, xmid, yoff, ymid))
+
+
+def _diag(xv, yv, xoff, xlim, yoff, ylim, too_expensive):
+  # Find the midpoint of the shortest edit script for XV[XOFF:XLIM] and
+  # YV[YOFF:YLIM], searching forwards and backwards at once, and return
+  # it as (XMID, YMID).  Diagonal K (X - Y) is stored at index K - DMIN
+  # + 1 of the FD and BD arrays.
+  dmin = xoff - ylim
+  dmax = xlim - yoff
+  fmid = xoff - yoff
+  bmid = xlim - ylim
+  fmin = fmax = fmid
+  bmin = bmax = bmid
+  odd = (fmid - bmid) & 1
+  base = 1 - dmin
+  big = xlim + ylim + 1
+  fd = [-1] * (dmax - dmin + 3)
+  bd = [big] * (dmax - dmin + 3)
+  fd[fmid + base] = xoff
+  bd[bmid + base] = xlim
+
+  c = 1
+  while 1:
+    # Extend the top-down search by an edit step in each diagonal.
+    if fmin > dmin:
+      fmin = fmin - 1
+      fd[fmin - 1 + base] = -1
+    else:
+      fmin = fmin + 1
+    if fmax < dmax:
+      fmax = fmax + 1
+      fd[fmax + 1 + base] = -1
+    else:
+      fmax = fmax - 1
+    for d in xrange(fmax, fmin - 1, -2):
+      tlo = fd[d - 1 + base]
+      thi = fd[d + 1 + base]
+      if tlo < thi:
+        x = thi
+      else:
+        x = tlo + 1
+      y = x - d
+      while x < xlim and y < ylim and xv[x] == yv[y]:
+        x = x + 1
+        y = y + 1
+      fd[d + base] = x
+      if odd and bmin <= d <= bmax and bd[d + base] <= x:
+        return x, y
+
+    # Similarly extend the bottom-up search.
+    if bmin > dmin:
+      bmin = bmin - 1
+      bd[bmin - 1 + base] = big
+    else:
+      bmin = bmin + 1
+    if bmax < dmax:
+      bmax = bmax + 1
+      bd[bmax + 1 + base] = big
+    else:
+      bmax = bmax - 1
+    for d in xrange(bmax, bmin - 1, -2):
+      tlo = bd[d - 1 + base]
+      thi = bd[d + 1 + base]
+      if tlo < thi:
+        x = tlo
+      else:
+        x = thi - 1
+      y = x - d
+      while xoff < x and yoff < y and xv[x - 1] == yv[y - 1]:
+        x = x - 1
+        y = y - 1
+      bd[d + base] = x
+      if not odd and fmin <= d <= fmax and x <= fd[d + base]:
+        return x, y
+
+    # If this is getting too costly, give up on finding the optimal
+    # path, and split at the furthest point reached by either search.
+    if c >= too_expensive:
+      fxybest = -1
+      for d in xrange(fmax, fmin - 1, -2):
+        x = min(fd[d + base], xlim)
+        y = x - d
+        if ylim < y:
+          x = ylim + d
+          y = ylim
+        if fxybest < x + y:
+          fxybest = x + y
+          fxbest = x
+      bxybest = big * 2
+      for d in xrange(bmax, bmin - 1, -2):
+        x = max(xoff, bd[d + base])
+        y = x - d
+        if y < yoff:
+          x = yoff + d
+          y = yoff
+        if x + y < bxybest:
+          bxybest = x + y
+          bxbest = x
+      if (xlim + ylim) - bxybest < fxybest - (xoff + yoff):
+        return fxbest, fxybest - fxbest
+      return bxbest, bxybest - bxbest
+    c = c + 1
+
+
+def _patience(seq1, seq2, lo1, hi1, lo2, hi2, changed1, changed2):
+  # Match up the lines which occur exactly once in each of the ranges,
+  # in the longest run that keeps their order in both, and diff the
+  # ranges between those anchors.  Where there are no such lines, fall
+  # back to Myers' algorithm.
+  stack = [(lo1, hi1, lo2, hi2)]
+  while stack:
+    lo1, hi1, lo2, hi2 = stack.pop()
+    while lo1 < hi1 and lo2 < hi2 and seq1[lo1] == seq2[lo2]:
+      lo1 = lo1 + 1
+      lo2 = lo2 + 1
+    while lo1 < hi1 and lo2 < hi2 and seq1[hi1 - 1] == seq2[hi2 - 1]:
+      hi1 = hi1 - 1
+      hi2 = hi2 - 1
+    if lo1 == hi1 or lo2 == hi2:
+      for i in xrange(lo1, hi1):
+        changed1[i + 1] = 1
+      for j in xrange(lo2, hi2):
+        changed2[j + 1] = 1
+      continue
+
+    anchors = _unique_lcs(seq1, seq2, lo1, hi1, lo2, hi2)
+    if not anchors:
+      _myers(seq1, seq2, lo1, hi1, lo2, hi2, changed1, changed2)
+      continue
+    prev1 = lo1
+    prev2 = lo2
+    for i, j in anchors + [(hi1, hi2)]:
+      if prev1 < i or prev2 < j:
+        stack.append((prev1, i, prev2, j))
+      prev1 = i + 1
+      prev2 = j + 1
+
+
+def _unique_lcs(seq1, seq2, lo1, hi1, lo2, hi2):
+  # Return the (I, J) pairs of the longest increasing run of lines
+  # which occur exactly once in each of SEQ1[LO1:HI1] and SEQ2[LO2:HI2].
+  where1 = {}
+  for i in xrange(lo1, hi1):
+    x = seq1[i]
+    if where1.has_key(x):
+      where1[x] = -1
+    else:
+      where1[x] = i
+  where2 = {}
+  for j in xrange(lo2, hi2):
+    x = seq2[j]
+    if where1.get(x, -1) != -1:
+      if where2.has_key(x):
+        where2[x] = -1
+      else:
+        where2[x] = j
+  pairs = []
+  for i in xrange(lo1, hi1):
+    j = where2.get(seq1[i], -1)
+    if j != -1 and where1[seq1[i]] == i:
+      pairs.append((i, j))
+  if not pairs:
+    return pairs
+
+  # Patience sorting: TOPS holds the index (into PAIRS) of the top card
+  # of each pile, and BACK the top card of the previous pile at the
+  # time each card was placed.
+  tops = []
+  back = [None] * len(pairs)
+  for k in xrange(len(pairs)):
+    j = pairs[k][1]
+    lo = 0
+    hi = len(tops)
+    while lo < hi:
+      mid = (lo + hi) / 2
+      if pairs[tops[mid]][1] < j:
+        lo = mid + 1
+      else:
+        hi = mid
+    if lo:
+      back[k] = tops[lo - 1]
+    if lo == len(tops):
+      tops.append(k)
+    else:
+      tops[lo] = k
+  result = []
+  k = tops[-1]
+  while k is not None:
+    result.append(pairs[k])
+    k = back[k]
+  result.reverse()
+  return result
+
+
+def _shift_boundaries(seq, changed, other_changed):
+  # Slide each run of changes in SEQ as far down as it will go, merging
+  # it with any runs it meets, then back up to line up with a run of
+  # changes in the other file, if possible -- as GNU diff does, so the
+  # runs start and end in the same places theirs would.  CHANGED and
+  # OTHER_CHANGED have a sentinel at either end, so line I's flag is
+  # at index I + 1.
+  i = j = 1
+  i_end = len(seq) + 1
+  while 1:
+    # Scan forwards to find the beginning of another run of changes,
+    # keeping track of the corresponding point in the other file.
+    while i < i_end and not changed[i]:
+      while other_changed[j]:
+        j = j + 1
+      j = j + 1
+      i = i + 1
+    if i == i_end:
+      break
+    start = i
+
+    # Find the end of this run of changes.
+    i = i + 1
+    while changed[i]:
+      i = i + 1
+    while other_changed[j]:
+      j = j + 1
+
+    while 1:
+      runlength = i - start
+
+      # Move the run back while the previous unchanged line matches the
+      # last changed one, merging it with any previous runs.
+      while start > 1 and seq[start - 2] == seq[i - 2]:
+        start = start - 1
+        changed[start] = 1
+        i = i - 1
+        changed[i] = 0
+        while changed[start - 1]:
+          start = start - 1
+        j = j - 1
+        while other_changed[j]:
+          j = j - 1
+
+      # CORRESPONDING is the end of the run at the last point where it
+      # lines up with a run of changes in the other file.
+      if other_changed[j - 1]:
+        corresponding = i
+      else:
+        corresponding = i_end
+
+      # Move the run forward while its first changed line matches the
+      # following unchanged one, merging it with any following runs.
+      while i != i_end and seq[start - 1] == seq[i - 1]:
+        changed[start] = 0
+        start = start + 1
+        changed[i] = 1
+        i = i + 1
+        while changed[i]:
+          i = i + 1
+        j = j + 1
+        while other_changed[j]:
+          j = j + 1
+          corresponding = i
+
+      if runlength == i - start:
+        break
+
+    # Move the fully merged run back to a corresponding run in the
+    # other file, if there is one.
+    while corresponding < i:
+      start = start - 1
+      changed[start] = 1
+      i = i - 1
+      changed[i] = 0
+      j = j - 1
+      while other_changed[j]:
+        j = j - 1
+
+
+def _group_changes(changes, context):
+  # Yield lists of the CHANGES close enough together (no more than
+  # twice CONTEXT unchanged lines apart) to be shown in one hunk.
+  group = []
+  for change in changes:
+    if group and context is not None \
+       and change[0] - group[-1][1] > 2 * context:
+      yield group
+      group = []
+    group.append(change)
+  if group:
+    yield group
+
+
+def _hunk_bounds(group, context, n1, n2):
+  # Return the (FIRST1, LAST1, FIRST2, LAST2) line ranges, including
+  # CONTEXT lines of context, of the hunk showing the changes in GROUP.
+  i1, i2, j1, j2 = group[0]
+  if context is None:
+    first1 = 0
+  else:
+    first1 = max(i1 - context, 0)
+  first2 = j1 - (i1 - first1)
+  i1, i2, j1, j2 = group[-1]
+  if context is None:
+    last1 = n1
+  else:
+    last1 = min(i2 + context, n1)
+  last2 = j2 + (last1 - i2)
+  return first1, last1, first2, last2
+
+
+def _line(prefix, line):
+  if line[-1:] == '\n':
+    return prefix + line
+  return prefix + line + '\n' + _NO_NEWLINE
+
+
+class _FunctionFinder:
+  """Finds the function headings shown in hunk headers."""
+
+  def __init__(self, lines):
+    self.lines = lines
+    self.last_search = 0
+    self.last_match = None
+
+  def find(self, first):
+    """Return the nearest function heading above line FIRST, as GNU
+    diff shows it, or None."""
+    lines = self.lines
+    last_search = self.last_search
+    self.last_search = first
+    for i in xrange(first - 1, last_search - 1, -1):
+      if _re_function.match(lines[i]):
+        self.last_match = i
+        break
+    if self.last_match is None:
+      return None
+    return ' ' + lines[self.last_match].rstrip('\n')[:40].rstrip()
+
+
+def _unified_range(first, last):
+  if last - first == 1:
+    return '%d' % last
+  if last == first:
+    return '%d,0' % first
+  return '%d,%d' % (first + 1, last - first)
+
+
+def _context_range(first, last):
+  if last - first <= 1:
+    return '%d' % last
+  return '%d,%d' % (first + 1, last)
+
+
+def unified_diff(lines1, lines2, label1, label2, changes, context=3,
+                 funout=0):
+  """Generate the lines of a unified diff of the lists of lines LINES1
+  and LINES2, labeled LABEL1 and LABEL2, showing CHANGES (as returned
+  by get_changes()) with CONTEXT lines of context (all of them, if
+  None), and if FUNOUT is true, the function each hunk is in."""
+  if not changes:
+    return
+  yield '--- %s\n' % label1
+  yield '+++ %s\n' % label2
+  finder = funout and _FunctionFinder(lines1)
+  for group in _group_changes(changes, context):
+    first1, last1, first2, last2 = \
+      _hunk_bounds(group, context, len(lines1), len(lines2))
+    header = '@@ -%s +%s @@' % (_unified_range(first1, last1),
+                                _unified_range(first2, last2))
+    function = finder and finder.find(first1)
+    if function:
+      header = header + function
+    yield header + '\n'
+    pos = first1
+    for i1, i2, j1, j2 in group:
+      for line in lines1[pos:i1]:
+        yield _line(' ', line)
+      for line in lines1[i1:i2]:
+        yield _line('-', line)
+      for line in lines2[j1:j2]:
+        yield _line('+', line)
+      pos = i2
+    for line in lines1[pos:last1]:
+      yield _line(' ', line)
+
+
+def context_diff(lines1, lines2, label1, label2, changes, context=3,
+                 funout=0):
+  """Generate the lines of a context diff, with the same arguments as
+  unified_diff()."""
+  if not changes:
+    return
+  yield '*** %s\n' % label1
+  yield '--- %s\n' % label2
+  finder = funout and _FunctionFinder(lines1)
+  for group in _group_changes(changes, context):
+    first1, last1, first2, last2 = \
+      _hunk_bounds(group, context, len(lines1), len(lines2))
+    header = '***************'
+    function = finder and finder.find(first1)
+    if function:
+      header = header + function
+    yield header + '\n'
+
+    yield '*** %s ****\n' % _context_range(first1, last1)
+    for i1, i2, j1, j2 in group:
+      if i2 > i1:
+        pos = first1
+        for i1, i2, j1, j2 in group:
+          for line in lines1[pos:i1]:
+            yield _line('  ', line)
+          prefix = (j2 > j1) and '! ' or '- '
+          for line in lines1[i1:i2]:
+            yield _line(prefix, line)
+          pos = i2
+        for line in lines1[pos:last1]:
+          yield _line('  ', line)
+        break
+
+    yield '--- %s ----\n' % _context_range(first2, last2)
+    for i1, i2, j1, j2 in group:
+      if j2 > j1:
+        pos = first2
+        for i1, i2, j1, j2 in group:
+          for line in lines2[pos:j1]:
+            yield _line('  ', line)
+          prefix = (i2 > i1) and '! ' or '+ '
+          for line in lines2[j1:j2]:
+            yield _line(prefix, line)
+          pos = j2
+        for line in lines2[pos:last2]:
+          yield _line('  ', line)
+        break
+
+
+def side_by_side_diff(lines1, lines2, changes, width=130, tabsize=8):
+  """Generate the lines of a side-by-side diff of the lists of lines
+  LINES1 and LINES2 showing CHANGES (as returned by get_changes()),
+  WIDTH columns wide, laid out as GNU diff lays it out."""
+  off = (width + tabsize + 3) / (2 * tabsize) * tabsize
+  half_width = max(0, min(off - 3, width - off))
+  if half_width:
+    column2 = off
+  else:
+    column2 = width
+  layout = (half_width, column2, (half_width + column2 - 1) / 2, tabsize)
+
+  pos1 = pos2 = 0
+  for i1, i2, j1, j2 in changes + [(len(lines1), None, len(lines2), None)]:
+    while pos1 < i1:
+      yield _side_by_side_line(lines1[pos1], ' ', lines2[pos2], layout)
+      pos1 = pos1 + 1
+      pos2 = pos2 + 1
+    if i2 is None:
+      break
+    while pos1 < i2 and pos2 < j2:
+      yield _side_by_side_line(lines1[pos1], '|', lines2[pos2], layout)
+      pos1 = pos1 + 1
+      pos2 = pos2 + 1
+    while pos2 < j2:
+      yield _side_by_side_line(None, '>', lines2[pos2], layout)
+      pos2 = pos2 + 1
+    while pos1 < i2:
+      yield _side_by_side_line(lines1[pos1], '<', None, layout)
+      pos1 = pos1 + 1
+
+
+def _tab_from_to(out, col, to, tabsize):
+  tab = col + tabsize - col % tabsize
+  while tab <= to:
+    out.append('\t')
+    col = tab
+    tab = tab + tabsize
+  if col < to:
+    out.append(' ' * (to - col))
+  return to
+
+
+def _side_by_side_line(left, sep, right, layout):
+  half_width, column2, sep_column, tabsize = layout
+  out = []
+  col = 0
+  put_newline = 0
+  if left is not None:
+    put_newline = left[-1:] == '\n'
+    col = _half_line(out, left, 0, half_width, tabsize)
+  if sep != ' ':
+    col = _tab_from_to(out, col, sep_column, tabsize) + 1
+    if sep == '|' and put_newline != (right[-1:] == '\n'):
+      sep = put_newline and '/' or '\\'
+    out.append(sep)
+  if right is not None:
+    put_newline = put_newline or right[-1:] == '\n'
+    if right[:1] != '\n':
+      col = _tab_from_to(out, col, column2, tabsize)
+      _half_line(out, right, col, half_width, tabsize)
+  if put_newline:
+    out.append('\n')
+  return ''.join(out)
+
+
+def _half_line(out, line, indent, bound, tabsize):
+  # Append as much of LINE as fits within BOUND columns to OUT, and
+  # return the column reached.  Characters are taken to be UTF-8
+  # encoded and one column wide.
+  in_pos = out_pos = 0
+  n = len(line)
+  k = 0
+  while k < n:
+    c = line[k]
+    k = k + 1
+    if c == '\n':
+      break
+    elif c == '\t':
+      spaces = tabsize - in_pos % tabsize
+      if in_pos == out_pos:
+        tabstop = out_pos + spaces
+        if tabstop < bound:
+          out_pos = tabstop
+          out.append(c)
+      in_pos = in_pos + spaces
+    elif c == '\r':
+      out.append(c)
+      _tab_from_to(out, 0, indent, tabsize)
+      in_pos = out_pos = 0
+    elif c == '\b':
+      if in_pos != 0:
+        in_pos = in_pos - 1
+        if in_pos < bound:
+          if out_pos <= in_pos:
+            out.append(' ' * (in_pos - out_pos))
+            out_pos = in_pos
+          else:
+            out_pos = in_pos
+            out.append(c)
+    elif ' ' <= c <= '~' or c >= '\xc0':
+      # a printable character, or the start of a multibyte one
+      if c >= '\xc0':
+        while k < n and '\x80' <= line[k] < '\xc0':
+          c = c + line[k]
+          k = k + 1
+      in_pos = in_pos + 1
+      if in_pos <= bound:
+        out_pos = in_pos
+        out.append(c)
+    elif in_pos < bound:
+      # other control characters take up no room
+      out.append(c)
+  return out_pos
+
+
+class DiffFile:
+  """File object reading the lines generated by one of the diff
+  generators above."""
+
+  def __init__(self, lines):
+    self.lines = iter(lines)
+    self.buffer = ''
+
+  def readline(self):
+    while self.buffer.find('\n') == -1 and self.lines is not None:
+      try:
+        self.buffer = self.buffer + self.lines.next()
+      except StopIteration:
+        self.lines = None
+    pos = self.buffer.find('\n') + 1 or len(self.buffer)
+    line = self.buffer[:pos]
+    self.buffer = self.buffer[pos:]
+    return line
+
+  def read(self, size=-1):
+    chunks = [self.buffer]
+    length = len(self.buffer)
+    while self.lines is not None and (size < 0 or length < size):
+      try:
+        line = self.lines.next()
+      except StopIteration:
+        self.lines = None
+        break
+      chunks.append(line)
+      length = length + len(line)
+    data = ''.join(chunks)
+    if size < 0:
+      size = len(data)
+    self.buffer = data[size:]
+    return data[:size]
+
+  def close(self):
+    self.lines = None
+    self.buffer = ''
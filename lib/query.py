@@ -378,19 +378,41 @@ def build_commit(server, cfg, desc, files, cvsroots, viewvc_link):
 
     return ob
 
+class _CommitGrouper:
+    """Gathers the commits found by a checkin database query, passed to
+    add() as they are read, into commit objects, grouping consecutive
+    commits with the same description."""
+
+    def __init__(self, server, cfg, cvsroots, viewvc_link):
+        self.server = server
+        self.cfg = cfg
+        self.cvsroots = cvsroots
+        self.viewvc_link = viewvc_link
+        self.commits = [ ]
+        self._files = [ ]
+        self._desc = None
+
+    def add(self, commit):
+        desc = commit.GetDescription()
+        if self._files and desc != self._desc:
+            self._build_commit()
+        self._desc = desc
+        self._files.append(commit)
+
+    def finish(self):
+        """Gather the last group of commits, if any."""
+        if self._files:
+            self._build_commit()
+
+    def _build_commit(self):
+        self.commits.append(build_commit(self.server, self.cfg, self._desc,
+                                         self._files, self.cvsroots,
+                                         self.viewvc_link))
+        self._files = [ ]
+
 def run_query(server, cfg, form_data, viewvc_link):
     query = form_to_cvsdb_query(cfg, form_data)
     db = cvsdb.ConnectDatabaseReadOnly(cfg)
-    db.RunQuery(query)
-
-    commit_list = query.GetCommitList()
-    if not commit_list:
-        return [ ], 0
-
-    row_limit_reached = query.GetLimitReached()
-
-    commits = [ ]
-    files = [ ]
 
     cvsroots = {}
     viewvc.expand_root_parents(cfg)
@@ -398,22 +420,17 @@ def run_query(server, cfg, form_data, viewvc_link):
     for key, value in rootitems:
         cvsroots[cvsdb.CleanRepository(value)] = key
 
-    current_desc = commit_list[0].GetDescription()
-    for commit in commit_list:
-        desc = commit.GetDescription()
-        if current_desc == desc:
-            files.append(commit)
-            continue
-
-        commits.append(build_commit(server, cfg, current_desc, files,
-                                    cvsroots, viewvc_link))
+    ## the commits are grouped as they are read
+    grouper = _CommitGrouper(server, cfg, cvsroots, viewvc_link)
+    query.commit_cb = grouper.add
+    db.RunQuery(query)
+    grouper.finish()
 
-        files = [ commit ]
-        current_desc = desc
+    commits = grouper.commits
+    if not commits:
+        return [ ], 0
 
-    ## add the last file group to the commit list
-    commits.append(build_commit(server, cfg, current_desc, files,
-                                cvsroots, viewvc_link))
+    row_limit_reached = query.GetLimitReached()
 
     # Strip out commits that don't have any files attached to them.  The
     # files probably aren't present because they've been blocked via
@@ -474,3 +491,6 @@ def main(server, cfg, viewvc_link):
     exc_info = debug.GetExceptionData()
     server.header(status=exc_info['status'])
     debug.PrintException(server, exc_info) 
+
+  # the page is complete, so send whatever output is still buffered
+  server.flush()
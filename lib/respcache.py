@@ -0,0 +1,375 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+#
+# respcache: on-disk caches of ViewVC output
+#
+# Views of a file (or diff) at fixed revisions produce the same output
+# every time, so their responses can be generated once, stored, and
+# served again from disk.  A ResponseRecorder stands in for the server
+# object while a view runs, capturing the response, which is stored
+# gzip-compressed in a ResponseCache whose total size is bounded by
+# evicting the least recently used entries.
+#
+# The syntax-highlighted lines of file contents, which are the costly
+# part of the markup and annotate views, are kept in a HighlightCache
+# in the same way.
+#
+# Subversion revision properties can change after the fact, though, so
+# the svn-revcache-hook script gives a revision's properties (or, when
+# run for a whole repository, the repository's) a new generation in the
+# cache directory whenever they do, and the keys of responses from
+# Subversion repositories include the generations of the repository and
+# of the revisions they are requested at.
+#
+# -----------------------------------------------------------------------
+
+import os
+import time
+import gzip
+import zlib
+import tempfile
+import cStringIO
+import cPickle
+
+from vclib.svn.revcache import get_generation, new_generation
+
+try:
+  from hashlib import md5
+except ImportError:
+  from md5 import md5
+
+
+# Bump this whenever the layout of cached responses changes, so that
+# stale cache files are ignored rather than misinterpreted.
+_CACHE_FORMAT = 1
+
+# Seconds between checks of the cache's total size.
+_PRUNE_INTERVAL = 60
+
+# Headers which are regenerated each time a response is served.
+_FRESHNESS_HEADERS = ('etag', 'last-modified', 'expires', 'cache-control')
+
+
+class CachedResponse:
+  """A complete (status 200) response: the content type passed to the
+  server's header() method, the freshness validators, any other
+  headers, and the gzip-compressed body."""
+
+  def __init__(self, content_type, etag, last_modified, headers, body):
+    self.content_type = content_type
+    self.etag = etag                    # value of the ETag header
+    self.last_modified = last_modified  # value of the Last-Modified header
+    self.headers = headers              # list of (name, value) tuples
+    self.body = body
+
+  def get_body(self):
+    """Return the uncompressed body."""
+    return gzip.GzipFile('', 'rb', 9, cStringIO.StringIO(self.body)).read()
+
+
+class DiskCache:
+  """On-disk cache of picklable values, at most MAX_SIZE bytes in all,
+  in CACHE_DIR.
+
+  Each value gets its own cache file, named after a hash of its key.
+  Cache files are replaced atomically, so concurrent ViewVC processes
+  may share a single cache directory.  Problems reading or writing the
+  cache are never fatal; they simply cause the value to be generated
+  again."""
+
+  def __init__(self, cache_dir, max_size):
+    self.cache_dir = cache_dir
+    self.max_size = max_size
+    # no single entry may take more than this much of the cache
+    self.max_entry_size = max_size / 8
+
+  def get_value(self, key):
+    """Return the value stored under KEY (a string), or None."""
+    cache_path = self._cache_path(key)
+    try:
+      fp = open(cache_path, 'rb')
+    except IOError:
+      return None
+    try:
+      try:
+        format, cached_key, value = cPickle.load(fp)
+      except Exception:
+        return None
+    finally:
+      fp.close()
+    if format != _CACHE_FORMAT or cached_key != key:
+      return None
+    # mark the entry as recently used
+    try:
+      os.utime(cache_path, None)
+    except OSError:
+      pass
+    return value
+
+  def put_value(self, key, value):
+    """Store VALUE under KEY, evicting old entries if the cache has
+    grown too large."""
+    cache_path = self._cache_path(key)
+    try:
+      fd, temp_path = tempfile.mkstemp('.tmp', '', self.cache_dir)
+    except (IOError, OSError):
+      return
+    try:
+      fp = os.fdopen(fd, 'wb')
+      try:
+        cPickle.dump((_CACHE_FORMAT, key, value), fp, cPickle.HIGHEST_PROTOCOL)
+      finally:
+        fp.close()
+      if os.name != 'posix' and os.path.exists(cache_path):
+        os.remove(cache_path)
+      os.rename(temp_path, cache_path)
+    except (IOError, OSError, cPickle.PicklingError):
+      try:
+        os.remove(temp_path)
+      except OSError:
+        pass
+      return
+    self._maybe_prune()
+
+  def prune(self):
+    """Remove the least recently used entries until the cache is no
+    larger than its maximum size."""
+    now = time.time()
+    entries = []
+    total = 0
+    for name in os.listdir(self.cache_dir):
+      path = os.path.join(self.cache_dir, name)
+      try:
+        st = os.stat(path)
+      except OSError:
+        continue
+      if name[-4:] == '.tmp':
+        # leftovers of a failed write (but maybe still being written)
+        if st.st_mtime < now - 3600:
+          self._remove(path)
+        continue
+      if name[0] != '.':
+        entries.append((st.st_mtime, st.st_size, path))
+        total = total + st.st_size
+    entries.sort()
+    for mtime, size, path in entries:
+      if total <= self.max_size:
+        break
+      self._remove(path)
+      total = total - size
+
+  def _maybe_prune(self):
+    # Checking the total size means statting every entry, so it's only
+    # done every so often, as recorded by the mtime of a stamp file.
+    stamp_path = os.path.join(self.cache_dir, '.pruned')
+    try:
+      if os.stat(stamp_path).st_mtime > time.time() - _PRUNE_INTERVAL:
+        return
+      os.utime(stamp_path, None)
+    except OSError:
+      try:
+        open(stamp_path, 'wb').close()
+      except IOError:
+        return
+    self.prune()
+
+  def _remove(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+  def _cache_path(self, key):
+    return os.path.join(self.cache_dir, md5(key).hexdigest())
+
+
+class ResponseCache(DiskCache):
+  """On-disk cache of CachedResponse objects."""
+
+  def get(self, key):
+    """Return the CachedResponse stored under KEY (a string), or None."""
+    state = self.get_value(key)
+    if state is None:
+      return None
+    return apply(CachedResponse, state)
+
+  def put(self, key, response):
+    """Store RESPONSE under KEY."""
+    self.put_value(key, (response.content_type, response.etag,
+                         response.last_modified, response.headers,
+                         response.body))
+
+
+class HighlightCache(DiskCache):
+  """On-disk cache of the marked-up lines of file contents, stored
+  zlib-compressed."""
+
+  def get(self, key):
+    """Return the list of lines stored under KEY (a string), or None."""
+    data = self.get_value(key)
+    if data is None:
+      return None
+    try:
+      return cPickle.loads(zlib.decompress(data))
+    except Exception:
+      return None
+
+  def put(self, key, lines):
+    """Store the list of LINES under KEY, unless they take up too much
+    of the cache."""
+    data = zlib.compress(cPickle.dumps(lines, cPickle.HIGHEST_PROTOCOL))
+    if len(data) <= self.max_entry_size:
+      self.put_value(key, data)
+
+
+def get_revprops_generation(cache_dir, uuid, rev=None):
+  """Return the generation of the properties of revision REV (or, if
+  REV is None, of all revisions) of the Subversion repository with UUID
+  UUID, as kept in CACHE_DIR."""
+  return get_generation(_revprops_generation_path(cache_dir, uuid, rev))
+
+def new_revprops_generation(cache_dir, uuid, rev=None):
+  """Give the properties of revision REV (or, if REV is None, of all
+  revisions) of the Subversion repository with UUID UUID a new
+  generation in CACHE_DIR, and return it."""
+  path = _revprops_generation_path(cache_dir, uuid, rev)
+  if not os.path.isdir(os.path.dirname(path)):
+    os.mkdir(os.path.dirname(path))
+  return new_generation(path)
+
+def _revprops_generation_path(cache_dir, uuid, rev):
+  # The directory's name starts with a '.', so prune() leaves it alone.
+  if rev is None:
+    name = 'generation'
+  else:
+    name = str(int(rev))
+  return os.path.join(cache_dir, '.revprops-' + uuid, name)
+
+
+class ResponseRecorder:
+  """Stand-in for a sapi.Server, which records the response written to
+  it instead of sending it to the client.
+
+  SERVER is the real server object.  Once more than MAX_SIZE bytes of
+  body have been written, recording is abandoned and the response is
+  passed through to SERVER, gzip-compressed at COMPRESS_LEVEL (if
+  non-zero).  Whatever isn't recorded here is handled by SERVER."""
+
+  def __init__(self, server, compress_level, max_size):
+    self.server = server
+    self.compress_level = compress_level
+    self.max_size = max_size
+    self.headers = []
+    self.header_args = None
+    self.buffer = cStringIO.StringIO()
+    self.size = 0
+    self.fp = None       # the real response file, once passing through
+
+  def __getattr__(self, name):
+    return getattr(self.server, name)
+
+  def addheader(self, name, value):
+    self.headers.append((name, value))
+
+  def header(self, *args, **kwargs):
+    if self.header_args is None:
+      self.header_args = (args, kwargs)
+
+  def file(self):
+    return _RecorderFile(self)
+
+  def write(self, s):
+    if self.fp:
+      self.fp.write(s)
+      return
+    self.buffer.write(s)
+    self.size = self.size + len(s)
+    if self.size > self.max_size:
+      self._pass_through(self.compress_level)
+
+  def flush(self):
+    if self.fp:
+      self.fp.flush()
+
+  def finish(self):
+    """Return the recorded response as a CachedResponse, if it is a
+    complete one.  Otherwise, send what was recorded on to the real
+    server (if that hasn't happened already) and return None."""
+    if self.fp:
+      if isinstance(self.fp, gzip.GzipFile):
+        self.fp.close()
+      return None
+    args, kwargs = self.header_args or ((), {})
+    args = list(args) + [None, None]
+    content_type = kwargs.get('content_type', args[0])
+    status = kwargs.get('status', args[1])
+    if status is not None or self.header_args is None:
+      # not a complete response (a "304 Not Modified", say), so send it
+      # on exactly as it was generated
+      self._pass_through(0)
+      return None
+
+    etag = last_modified = None
+    headers = []
+    for name, value in self.headers:
+      lname = name.lower()
+      if lname == 'etag':
+        etag = value
+      elif lname == 'last-modified':
+        last_modified = value
+      elif lname not in _FRESHNESS_HEADERS and lname != 'content-length':
+        headers.append((name, value))
+    body = cStringIO.StringIO()
+    fp = gzip.GzipFile('', 'wb', 9, body)
+    fp.write(self.buffer.getvalue())
+    fp.close()
+    return CachedResponse(content_type, etag, last_modified, headers,
+                          body.getvalue())
+
+  def _pass_through(self, compress_level):
+    server = self.server
+    for name, value in self.headers:
+      if not (compress_level and name.lower() == 'content-length'):
+        server.addheader(name, value)
+    if compress_level:
+      server.addheader('Content-Encoding', 'gzip')
+    if self.header_args is not None:
+      args, kwargs = self.header_args
+      apply(server.header, args, kwargs)
+    self.fp = server.file()
+    if compress_level:
+      self.fp = gzip.GzipFile('', 'wb', compress_level, self.fp)
+    self.fp.write(self.buffer.getvalue())
+    self.buffer = None
+
+
+class _RecorderFile:
+  """The file object returned by ResponseRecorder.file()."""
+
+  def __init__(self, recorder):
+    self.recorder = recorder
+    self.closed = 0
+    self.mode = 'w'
+    self.softspace = 0
+
+  def write(self, s):
+    self.recorder.write(s)
+
+  def writelines(self, lines):
+    for s in lines:
+      self.recorder.write(s)
+
+  def flush(self):
+    self.recorder.flush()
+
+  def close(self):
+    pass
@@ -26,6 +26,9 @@ import cgi
 # or a proxy to an AspServer or ModPythonServer object.
 server = None
 
+# default size of the chunks in which buffered output is sent
+DEFAULT_BUFFER_SIZE = 32768
+
 
 # Simple HTML string escaping.  Note that we always escape the
 # double-quote character -- ViewVC shouldn't ever need to preserve
@@ -105,6 +108,32 @@ class ThreadedServerProxy:
     delattr(self.self(), key)
 
 
+class OutputBuffer:
+  """Coalesces the many small writes which make up a page into chunks
+  of at least BUFFER_SIZE bytes, which are passed to the SEND function.
+  Whatever is left over is sent by flush(), which must be called once
+  the page is complete."""
+
+  def __init__(self, send, buffer_size=DEFAULT_BUFFER_SIZE):
+    self.send = send
+    self.buffer_size = buffer_size
+    self.pieces = []
+    self.size = 0
+
+  def write(self, s):
+    self.pieces.append(s)
+    self.size = self.size + len(s)
+    if self.size >= self.buffer_size:
+      self.flush()
+
+  def flush(self):
+    if self.pieces:
+      data = ''.join(self.pieces)
+      self.pieces = []
+      self.size = 0
+      self.send(data)
+
+
 class File:
   def __init__(self, server):
     self.closed = 0
@@ -131,11 +160,12 @@ class File:
 
 
 class CgiServer(Server):
-  def __init__(self, inheritableOut = 1):
+  def __init__(self, inheritableOut = 1, buffer_size = DEFAULT_BUFFER_SIZE):
     Server.__init__(self)
     self.headerSent = 0
     self.headers = []
     self.inheritableOut = inheritableOut
+    self._output = OutputBuffer(self._send, buffer_size)
     self.iis = os.environ.get('SERVER_SOFTWARE', '')[:13] == 'Microsoft-IIS'
 
     if sys.platform == "win32" and inheritableOut:
@@ -164,14 +194,14 @@ class CgiServer(Server):
       else:
         status = 'Status: %s\r\n' % status
 
-      sys.stdout.write('%sContent-Type: %s\r\n%s\r\n'
-                       % (status, content_type, extraheaders))
+      self.write('%sContent-Type: %s\r\n%s\r\n'
+                 % (status, content_type, extraheaders))
 
   def redirect(self, url):
     if self.iis: url = fix_iis_url(self, url)
     self.addheader('Location', url)
     self.header(status='301 Moved')
-    sys.stdout.write('This document is located <a href="%s">here</a>.\n' % url)
+    self.write('This document is located <a href="%s">here</a>.\n' % url)
 
   def getenv(self, name, value=None):
     ret = os.environ.get(name, value)
@@ -188,23 +218,43 @@ class CgiServer(Server):
                             keep_blank_values, strict_parsing)
 
   def write(self, s):
-    sys.stdout.write(s)
+    self._output.write(s)
 
   def flush(self):
+    self._output.flush()
     sys.stdout.flush()
 
   def file(self):
-    return sys.stdout
+    return File(self)
+
+  def _send(self, data):
+    # look sys.stdout up each time, as it may be replaced (see
+    # bin/standalone.py)
+    sys.stdout.write(data)
 
 
 class WsgiServer(Server):
-  def __init__(self, environ, start_response):
+  """Server for WSGI applications.  The application must return the
+  value of the response() method once ViewVC has handled the request.
+
+  By default, the response body is passed in chunks to the write()
+  callable returned by START_RESPONSE, as it is generated.  If ITERABLE
+  is true, the chunks are kept instead, and returned by response() for
+  the WSGI server to send.  That avoids the write() callable, which
+  some WSGI servers implement poorly, at the cost of holding the whole
+  response in memory."""
+
+  def __init__(self, environ, start_response,
+               buffer_size=DEFAULT_BUFFER_SIZE, iterable=False):
     Server.__init__(self)
 
     self._environ = environ
     self._start_response = start_response;
     self._headers = []
     self._wsgi_write = None
+    self._chunks = []
+    self._iterable = iterable
+    self._output = OutputBuffer(self._send, buffer_size)
     self.headerSent = False
 
     global server
@@ -227,7 +277,7 @@ class WsgiServer(Server):
     """
     self.addheader('Location', url)
     self.header(status='301 Moved')
-    self._wsgi_write('This document is located <a href="%s">here</a>.' % url)
+    self.write('This document is located <a href="%s">here</a>.' % url)
 
   def getenv(self, name, value=None):
     return self._environ.get(name, value)
@@ -242,14 +292,28 @@ class WsgiServer(Server):
                             strict_parsing)
 
   def write(self, s):
-    self._wsgi_write(s)
+    self._output.write(s)
 
   def flush(self):
-    pass
+    self._output.flush()
 
   def file(self):
     return File(self)
 
+  def response(self):
+    """Send any buffered output, and return the iterable to be returned
+    to the WSGI server."""
+    self._output.flush()
+    chunks = self._chunks
+    self._chunks = []
+    return chunks
+
+  def _send(self, data):
+    if self._iterable:
+      self._chunks.append(data)
+    else:
+      self._wsgi_write(data)
+
 
 class AspServer(ThreadedServer):
   def __init__(self, Server, Request, Response, Application):
@@ -339,10 +403,11 @@ _re_status = re.compile("\\d+")
 
 
 class ModPythonServer(ThreadedServer):
-  def __init__(self, request):
+  def __init__(self, request, buffer_size=DEFAULT_BUFFER_SIZE):
     ThreadedServer.__init__(self)
     self.request = request
     self.headerSent = 0
+    self._output = OutputBuffer(request.write, buffer_size)
     
   def addheader(self, name, value):
     self.request.headers_out.add(name, value)
@@ -363,8 +428,8 @@ class ModPythonServer(ThreadedServer):
     import mod_python.apache
     self.request.headers_out['Location'] = url
     self.request.status = mod_python.apache.HTTP_MOVED_TEMPORARILY
-    self.request.write("You are being redirected to <a href=\"%s\">%s</a>"
-                       % (url, url))
+    self.write("You are being redirected to <a href=\"%s\">%s</a>"
+               % (url, url))
 
   def getenv(self, name, value = None):
     try:
@@ -385,10 +450,14 @@ class ModPythonServer(ThreadedServer):
     return mod_python.util.FieldStorage(self.request, keep_blank_values, strict_parsing)
 
   def write(self, s):
-    self.request.write(s)
+    self._output.write(s)
 
   def flush(self):
-    pass
+    self._output.flush()
+
+  def close(self):
+    self._output.flush()
+    ThreadedServer.close(self)
 
 
 def fix_iis_url(server, url):
@@ -40,6 +40,28 @@ class GenericViewVCAuthorizer:
     repository ROOTNAME."""
     pass
 
+  def get_stamp(self):
+    """Return a value which changes whenever the rules applied by this
+    authorizer change other than through its parameters (because they
+    are read from a file, say), or None if there is no such value."""
+    return None
+
+  def check_paths_access(self, rootname, parent_parts, names, kinds, rev=None):
+    """Return a list of flags, one for each name in NAMES, each set iff
+    the associated username is permitted to read revision REV of the
+    path PARENT_PARTS + [NAME] (of the corresponding type in KINDS) in
+    repository ROOTNAME.
+
+    This implementation calls check_path_access() for each path in
+    turn; authorizers may override it to check a whole directory's
+    worth of paths more cheaply."""
+    results = []
+    for i in range(len(names)):
+      results.append(self.check_path_access(rootname,
+                                            list(parent_parts) + [names[i]],
+                                            kinds[i], rev))
+    return results
+
 
 
 ##############################################################################
@@ -54,3 +76,6 @@ class ViewVCAuthorizer(GenericViewVCAuthorizer):
     
   def check_path_access(self, rootname, path_parts, pathtype, rev=None):
     return 1
+
+  def check_paths_access(self, rootname, parent_parts, names, kinds, rev=None):
+    return [1] * len(names)
@@ -40,7 +40,25 @@ class ViewVCAuthorizer(vcauth.GenericViewVCAuthorizer):
       return 1
 
     # At this point we're looking at a directory path.
-    module = path_parts[0]
+    return self._check_module_access(path_parts[0])
+
+  def check_paths_access(self, rootname, parent_parts, names, kinds, rev=None):
+    # Only directories are of interest, and of those, only the
+    # top-level module, which is the same for every path below the root.
+    results = []
+    module_access = None
+    for i in range(len(names)):
+      if kinds[i] != vclib.DIR:
+        results.append(1)
+      elif not parent_parts:
+        results.append(self._check_module_access(names[i]))
+      else:
+        if module_access is None:
+          module_access = self._check_module_access(parent_parts[0])
+        results.append(module_access)
+    return results
+
+  def _check_module_access(self, module):
     default = 1
     for pat in self.forbidden:
       if pat[0] == '!':
@@ -24,14 +24,55 @@ def _split_regexp(restr):
   return re.compile(restr), 0
 
 
+# Regular expression syntax which cannot survive being combined with
+# other expressions: references to groups by number or name.
+_re_group_ref = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+def _combine_regexps(regexps):
+  """Return a compiled regular expression which matches wherever any of
+  the compiled regular expressions REGEXPS does, or None if they cannot
+  safely be combined (because they use flags or group references)."""
+  patterns = []
+  for regexp in regexps:
+    if regexp.flags or _re_group_ref.search(regexp.pattern):
+      return None
+    patterns.append('(?:%s)' % regexp.pattern)
+  try:
+    return re.compile('|'.join(patterns))
+  except re.error:
+    return None
+
+
 class ViewVCAuthorizer(vcauth.GenericViewVCAuthorizer):
   """A simple regular-expression-based authorizer."""
   def __init__(self, username, params={}):
     forbidden = params.get('forbiddenre', '')
     self.forbidden = map(lambda x: _split_regexp(x.strip()),
                          filter(None, forbidden.split(',')))
+
+    # The regexps are searched in order, the first match deciding, but
+    # most paths match none of them and get the default.  One search of
+    # all of them combined is enough to find that out.
+    negations = map(lambda x: x[1], self.forbidden)
+    self.default = 1
+    if 1 in negations:
+      self.default = 0
+    self.combined = None
+    if self.forbidden:
+      self.combined = _combine_regexps(map(lambda x: x[0], self.forbidden))
+    if 0 not in negations:
+      self.matched = 1      # only negated regexps: any match allows
+    elif 1 not in negations:
+      self.matched = 0      # no negated regexps: any match forbids
+    else:
+      self.matched = None   # a match needs the regexps searched in order
                          
   def _check_root_path_access(self, root_path):
+    if self.combined:
+      if not self.combined.search(root_path):
+        return self.default
+      if self.matched is not None:
+        return self.matched
     default = 1
     for forbidden, negated in self.forbidden:
       if negated:
@@ -62,3 +103,18 @@ class ViewVCAuthorizer(vcauth.GenericViewVCAuthorizer):
       root_path = root_path + '/'
     return self._check_root_path_access(root_path)
     
+
+  def check_paths_access(self, rootname, parent_parts, names, kinds, rev=None):
+    if not self.forbidden:
+      return [1] * len(names)
+    if parent_parts:
+      prefix = rootname + '/' + '/'.join(parent_parts) + '/'
+    else:
+      prefix = rootname + '/'
+    results = []
+    for i in range(len(names)):
+      root_path = prefix + names[i]
+      if kinds[i] == vclib.DIR:
+        root_path = root_path + '/'
+      results.append(self._check_root_path_access(root_path))
+    return results
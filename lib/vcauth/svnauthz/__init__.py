@@ -12,258 +12,348 @@
 # (c) 2006 Sergey Lapin <slapin@dataart.com>
 
 import vcauth
+import os
 import os.path
 import debug
 
 from ConfigParser import ConfigParser
 
-class ViewVCAuthorizer(vcauth.GenericViewVCAuthorizer):
-  """Subversion authz authorizer module"""
-  
-  def __init__(self, username, params={}):
-    self.rootpaths = { }  # {root -> { paths -> access boolean for USERNAME }}
-    
-    # Get the authz file location from a passed-in parameter.
-    self.authz_file = params.get('authzfile')
-    if not self.authz_file:
-      raise debug.ViewVCException("No authzfile configured")
-    if not os.path.exists(self.authz_file):
-      raise debug.ViewVCException("Configured authzfile file not found")
 
-    # See if the admin wants us to do case normalization of usernames.
-    self.force_username_case = params.get('force_username_case')
-    if self.force_username_case == "upper":
-      self.username = username and username.upper() or username
-    elif self.force_username_case == "lower":
-      self.username = username and username.lower() or username
-    elif not self.force_username_case:
-      self.username = username
-    else:
-      raise debug.ViewVCException("Invalid value for force_username_case "
-                                  "option")
+# Compiled rules, shared by all the authorizers in this process.
+# {authz file path -> ((mtime, size), AuthzRules)}
+_rules_cache = { }
 
-  def _get_paths_for_root(self, rootname):
-    if self.rootpaths.has_key(rootname):
-      return self.rootpaths[rootname]
 
-    paths_for_root = { }
-    
+def get_rules(authz_file):
+  """Return the AuthzRules compiled from AUTHZ_FILE, parsing the file
+  only if it has changed since it was last compiled."""
+  try:
+    st = os.stat(authz_file)
+  except OSError:
+    raise debug.ViewVCException("Configured authzfile file not found")
+  stamp = (st.st_mtime, st.st_size)
+  cached = _rules_cache.get(authz_file)
+  if cached and cached[0] == stamp:
+    return cached[1]
+  rules = AuthzRules(authz_file)
+  _rules_cache[authz_file] = (stamp, rules)
+  return rules
+
+
+class AuthzRules:
+  """The rules of a Subversion authz file, compiled for evaluation
+  without parsing the file again.
+
+  Access sections are indexed by the user specifications they contain,
+  so that working out what a user may read only looks at the entries
+  which could apply to that user.  The outcome, for each user and
+  root, is a RootAccess, which is remembered for as long as the rules
+  themselves."""
+
+  def __init__(self, authz_file):
     # Parse the authz file, replacing ConfigParser's optionxform()
     # method with something that won't futz with the case of the
     # option names.
     cp = ConfigParser()
     cp.optionxform = lambda x: x
     try:
-      cp.read(self.authz_file)
+      cp.read(authz_file)
+      self._compile(cp)
     except:
       raise debug.ViewVCException("Unable to parse configured authzfile file")
+    self._access = { }     # {(username, rootname) -> RootAccess}
+    self._decisions = { }  # {username -> {section index -> allow}}
 
-    # Figure out if there are any aliases for the current username
-    aliases = []
+  def _compile(self, cp):
+    # [(alias, value)]
+    self.aliases = [ ]
     if cp.has_section('aliases'):
       for alias in cp.options('aliases'):
-        entry = cp.get('aliases', alias)
-        if entry == self.username:
-          aliases.append(alias)
+        self.aliases.append((alias, cp.get('aliases', alias)))
 
-    # Figure out which groups USERNAME has a part of.
-    groups = []
+    # [groupname], in definition order, and {groupname -> [entry]}
+    self.group_names = [ ]
+    self.groups = { }
     if cp.has_section('groups'):
-      all_groups = []
-
-      def _process_group(groupname):
-        """Inline function to handle groups within groups.
-        
-        For a group to be within another group in SVN, the group
-        definitions must be in the correct order in the config file.
-        ie. If group A is a member of group B then group A must be
-        defined before group B in the [groups] section.
-        
-        Unfortunately, the ConfigParser class provides no way of
-        finding the order in which groups were defined so, for reasons
-        of practicality, this function lets you get away with them
-        being defined in the wrong order.  Recursion is guarded
-        against though."""
-        
-        # If we already know the user is part of this already-
-        # processed group, return that fact.
-        if groupname in groups:
-          return 1
-        # Otherwise, ensure we don't process a group twice.
-        if groupname in all_groups:          
-          return 0
-        # Store the group name in a global list so it won't be processed again
-        all_groups.append(groupname)
-        group_member = 0
-        groupname = groupname.strip()
-        entries = cp.get('groups', groupname).split(',')
-        for entry in entries:
-          entry = entry.strip()
-          if entry == self.username:
-            group_member = 1
-            break
-          elif entry[0:1] == "@" and _process_group(entry[1:]):
-            group_member = 1
-            break
-          elif entry[0:1] == "&" and entry[1:] in aliases:
-            group_member = 1
-            break
-        if group_member:
-          groups.append(groupname)
-        return group_member
-      
-      # Process the groups
       for group in cp.options('groups'):
-        _process_group(group)
-
-    def _userspec_matches_user(userspec):
-      # If there is an inversion character, recurse and return the
-      # opposite result.
-      if userspec[0:1] == '~':
-        return not _userspec_matches_user(userspec[1:])
-
-      # See if the userspec applies to our current user.
-      return userspec == '*' \
-             or userspec == self.username \
-             or (self.username is not None and userspec == "$authenticated") \
-             or (self.username is None and userspec == "$anonymous") \
-             or (userspec[0:1] == "@" and userspec[1:] in groups) \
-             or (userspec[0:1] == "&" and userspec[1:] in aliases)
-      
-    def _process_access_section(section):
-      """Inline function for determining user access in a single
-      config secction.  Return a two-tuple (ALLOW, DENY) containing
-      the access determination for USERNAME in a given authz file
-      SECTION (if any)."""
-  
-      # Figure if this path is explicitly allowed or denied to USERNAME.
-      allow = deny = 0
-      for user in cp.options(section):
-        user = user.strip()
-        if _userspec_matches_user(user):
-          # See if the 'r' permission is among the ones granted to
-          # USER.  If so, we can stop looking.  (Entry order is not
-          # relevant -- we'll use the most permissive entry, meaning
-          # one 'allow' is all we need.)
-          allow = cp.get(section, user).find('r') != -1
-          deny = not allow
-          if allow:
-            break
-      return allow, deny
-    
-    # Read the other (non-"groups") sections, and figure out in which
-    # repositories USERNAME or his groups have read rights.  We'll
-    # first check groups that have no specific repository designation,
-    # then superimpose those that have a repository designation which
-    # matches the one we're asking about.
-    root_sections = []
-    for section in cp.sections():
+        entries = map(lambda x: x.strip(), cp.get('groups', group).split(','))
+        self.group_names.append(group)
+        self.groups[group] = entries
 
-      # Skip the "groups" section -- we handled that already.
-      if section == 'groups':
-        continue
-      
-      if section == 'aliases':
+    # Access sections, as [(rootname or None, path_parts)].  The
+    # entries in them are indexed by user specification:
+    # {userspec -> [(section index, allow)]}, with inverted ("~")
+    # specifications kept aside as [(userspec, section index, allow)].
+    self.sections = [ ]
+    self.rules = { }
+    self.inverted_rules = [ ]
+    for section in cp.sections():
+      if section == 'groups' or section == 'aliases':
         continue
-
-      # Process root-agnostic access sections; skip (but remember)
-      # root-specific ones that match our root; ignore altogether
-      # root-specific ones that don't match our root.  While we're at
-      # it, go ahead and figure out the repository path we're talking
-      # about.
       if section.find(':') == -1:
-        path = section
+        name, path = None, section
       else:
         name, path = section.split(':', 1)
+      index = len(self.sections)
+      self.sections.append((name, tuple(filter(None, path.split('/')))))
+      for user in cp.options(section):
+        user = user.strip()
+        allow = cp.get(section, user).find('r') != -1
+        if user[0:1] == '~':
+          self.inverted_rules.append((user, index, allow))
+        else:
+          self.rules.setdefault(user, []).append((index, allow))
+
+  def _get_groups(self, username, aliases):
+    """Return the list of groups USERNAME (with ALIASES) is a part of."""
+    groups = { }
+    all_groups = { }
+
+    def _process_group(groupname):
+      """Inline function to handle groups within groups.
+
+      For a group to be within another group in SVN, the group
+      definitions must be in the correct order in the config file.
+      ie. If group A is a member of group B then group A must be
+      defined before group B in the [groups] section.
+
+      Unfortunately, the ConfigParser class provides no way of
+      finding the order in which groups were defined so, for reasons
+      of practicality, this function lets you get away with them
+      being defined in the wrong order.  Recursion is guarded
+      against though."""
+
+      # If we already know the user is part of this already-
+      # processed group, return that fact.
+      if groups.has_key(groupname):
+        return 1
+      # Otherwise, ensure we don't process a group twice.
+      if all_groups.has_key(groupname):
+        return 0
+      # Store the group name in a global list so it won't be processed again
+      all_groups[groupname] = None
+      group_member = 0
+      groupname = groupname.strip()
+      for entry in self.groups.get(groupname, []):
+        if entry == username:
+          group_member = 1
+          break
+        elif entry[0:1] == "@" and _process_group(entry[1:]):
+          group_member = 1
+          break
+        elif entry[0:1] == "&" and entry[1:] in aliases:
+          group_member = 1
+          break
+      if group_member:
+        groups[groupname] = None
+      return group_member
+
+    for group in self.group_names:
+      _process_group(group)
+    return groups.keys()
+
+  def _get_decisions(self, username):
+    """Return a dictionary mapping the indexes of the access sections
+    which say anything about USERNAME's access to whether they allow
+    USERNAME to read."""
+    decisions = self._decisions.get(username)
+    if decisions is not None:
+      return decisions
+
+    # Work out every user specification that matches USERNAME.
+    aliases = []
+    for alias, value in self.aliases:
+      if value == username:
+        aliases.append(alias)
+    userspecs = { '*' : None }
+    if username is None:
+      userspecs['$anonymous'] = None
+    else:
+      userspecs['$authenticated'] = None
+      userspecs[username] = None
+    for group in self._get_groups(username, aliases):
+      userspecs['@' + group] = None
+    for alias in aliases:
+      userspecs['&' + alias] = None
+
+    # Within a section, one matching entry which grants read access is
+    # enough to allow access, regardless of the entry order.
+    decisions = { }
+    for userspec in userspecs.keys():
+      for index, allow in self.rules.get(userspec, []):
+        decisions[index] = decisions.get(index) or allow
+    for userspec, index, allow in self.inverted_rules:
+      inverted = 0
+      while userspec[0:1] == '~':
+        inverted = not inverted
+        userspec = userspec[1:]
+      if userspecs.has_key(userspec) != inverted:
+        decisions[index] = decisions.get(index) or allow
+
+    self._decisions[username] = decisions
+    return decisions
+
+  def get_root_access(self, username, rootname):
+    """Return the RootAccess of USERNAME to the repository ROOTNAME."""
+    key = (username, rootname)
+    root_access = self._access.get(key)
+    if root_access is None:
+      decisions = self._get_decisions(username)
+      indexes = decisions.keys()
+      indexes.sort()
+
+      # Root-agnostic sections come first, then those specific to
+      # ROOTNAME are superimposed on them.
+      paths = { }
+      for index in indexes:
+        name, path_parts = self.sections[index]
+        if name is None:
+          paths[path_parts] = decisions[index]
+      for index in indexes:
+        name, path_parts = self.sections[index]
         if name == rootname:
-          root_sections.append(section)
-        continue
+          paths[path_parts] = decisions[index]
+      root_access = self._access[key] = RootAccess(paths)
+    return root_access
+
+
+class RootAccess:
+  """One user's access to one repository: the explicit access
+  determinations for that user, arranged as a tree of path components
+  so that a path's access can be found in a single walk down it."""
 
-      # Check for a specific access determination.
-      allow, deny = _process_access_section(section)
-          
-      # If we got an explicit access determination for this path and this
-      # USERNAME, record it.
-      if allow or deny:
-        if path != '/':
-          path = '/' + '/'.join(filter(None, path.split('/')))
-        paths_for_root[path] = allow
-
-    # Okay.  Superimpose those root-specific values now.
-    for section in root_sections:
-
-      # Get the path again.
-      name, path = section.split(':', 1)
-      
-      # Check for a specific access determination.
-      allow, deny = _process_access_section(section)
-                
-      # If we got an explicit access determination for this path and this
-      # USERNAME, record it.
-      if allow or deny:
-        if path != '/':
-          path = '/' + '/'.join(filter(None, path.split('/')))
-        paths_for_root[path] = allow
+  def __init__(self, paths):
+    # Each node is a list [ALLOW or None, {component -> node}].
+    self.tree = [None, { }]
+    found_allow = found_deny = 0
+    for path_parts, allow in paths.items():
+      node = self.tree
+      for part in path_parts:
+        children = node[1]
+        node = children.get(part)
+        if node is None:
+          node = children[part] = [None, { }]
+      node[0] = allow
+      if allow:
+        found_allow = 1
+      else:
+        found_deny = 1
 
     # If the root isn't readable, there's no point in caring about all
-    # the specific paths the user can't see.  Just point the rootname
-    # to a None paths dictionary.
-    root_is_readable = 0
-    for path in paths_for_root.keys():
-      if paths_for_root[path]:
-        root_is_readable = 1
+    # the specific paths the user can't see.
+    self.readable = found_allow
+
+    # If there's a mix of allowances and denials, we can't claim a
+    # universal access determination.  Allowances only is only a
+    # universal allowance if read access is granted to the root
+    # directory.
+    if not self.readable:
+      self.universal = 0
+    elif found_deny:
+      self.universal = None
+    elif self.tree[0] is not None:
+      self.universal = 1
+    else:
+      self.universal = None
+
+  def _walk(self, path_parts):
+    # Return the node for PATH_PARTS (or None if it has none) and the
+    # access determination of the nearest path at or above it with one
+    # (or None if none has).
+    node = self.tree
+    access = node[0]
+    for part in path_parts:
+      node = node[1].get(part)
+      if node is None:
         break
-    if not root_is_readable:
-      paths_for_root = None
-      
-    self.rootpaths[rootname] = paths_for_root
-    return paths_for_root
+      if node[0] is not None:
+        access = node[0]
+    return node, access
 
-  def check_root_access(self, rootname):
-    paths = self._get_paths_for_root(rootname)
-    return (paths is not None) and 1 or 0
-  
-  def check_universal_access(self, rootname):
-    paths = self._get_paths_for_root(rootname)
-    if not paths: # None or empty.
+  def check_path(self, path_parts):
+    """Return the access determination for PATH_PARTS: that of the
+    nearest path at or above it with one, or 0 if none has."""
+    node, access = self._walk(path_parts)
+    if access is None:
       return 0
+    return access
 
-    # Search the access determinations.  If there's a mix, we can't
-    # claim a universal access determination.
-    found_allow = 0
-    found_deny = 0
-    for access in paths.values():
-      if access:
-        found_allow = 1
+  def check_names(self, parent_parts, names):
+    """Return a list of the access determinations for each name in
+    NAMES within the directory PARENT_PARTS."""
+    node, parent_access = self._walk(parent_parts)
+    if parent_access is None:
+      parent_access = 0
+    if node is None or not node[1]:
+      return [parent_access] * len(names)
+    children = node[1]
+    results = []
+    for name in names:
+      child = children.get(name)
+      if child is None or child[0] is None:
+        results.append(parent_access)
       else:
-        found_deny = 1
-      if found_allow and found_deny:
-        return None
+        results.append(child[0])
+    return results
 
-    # We didn't find both allowances and denials, so we must have
-    # found one or the other.  Denials only is a universal denial.
-    if found_deny:
-      return 0
 
-    # ... but allowances only is only a universal allowance if read
-    # access is granted to the root directory.
-    if found_allow and paths.has_key('/'):
-      return 1
+class ViewVCAuthorizer(vcauth.GenericViewVCAuthorizer):
+  """Subversion authz authorizer module"""
+  
+  def __init__(self, username, params={}):
+    self.rootaccess = { }  # {root -> RootAccess for USERNAME}
+    
+    # Get the authz file location from a passed-in parameter.
+    self.authz_file = params.get('authzfile')
+    if not self.authz_file:
+      raise debug.ViewVCException("No authzfile configured")
+    if not os.path.exists(self.authz_file):
+      raise debug.ViewVCException("Configured authzfile file not found")
+
+    # See if the admin wants us to do case normalization of usernames.
+    self.force_username_case = params.get('force_username_case')
+    if self.force_username_case == "upper":
+      self.username = username and username.upper() or username
+    elif self.force_username_case == "lower":
+      self.username = username and username.lower() or username
+    elif not self.force_username_case:
+      self.username = username
+    else:
+      raise debug.ViewVCException("Invalid value for force_username_case "
+                                  "option")
+
+  def _get_root_access(self, rootname):
+    root_access = self.rootaccess.get(rootname)
+    if root_access is None:
+      rules = get_rules(self.authz_file)
+      root_access = rules.get_root_access(self.username, rootname)
+      self.rootaccess[rootname] = root_access
+    return root_access
 
-    # Anything else is indeterminable.
-    return None
+  def get_stamp(self):
+    try:
+      st = os.stat(self.authz_file)
+    except OSError:
+      return None
+    return (self.authz_file, st.st_mtime, st.st_size)
+
+  def check_root_access(self, rootname):
+    return self._get_root_access(rootname).readable and 1 or 0
+  
+  def check_universal_access(self, rootname):
+    return self._get_root_access(rootname).universal
     
   def check_path_access(self, rootname, path_parts, pathtype, rev=None):
-    # Crawl upward from the path represented by PATH_PARTS toward to
-    # the root of the repository, looking for an explicitly grant or
+    # Walk down from the root of the repository along the path
+    # represented by PATH_PARTS, keeping the deepest explicit grant or
     # denial of access.
-    paths = self._get_paths_for_root(rootname)
-    if paths is None:
+    root_access = self._get_root_access(rootname)
+    if not root_access.readable:
       return 0
-    parts = path_parts[:]
-    while parts:
-      path = '/' + '/'.join(parts)
-      if paths.has_key(path):
-        return paths[path]
-      del parts[-1]
-    return paths.get('/', 0)
+    return root_access.check_path(path_parts)
+
+  def check_paths_access(self, rootname, parent_parts, names, kinds, rev=None):
+    root_access = self._get_root_access(rootname)
+    if not root_access.readable:
+      return [0] * len(names)
+    return root_access.check_names(parent_parts, names)
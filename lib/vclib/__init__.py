@@ -345,6 +345,7 @@ class NonTextualFileContents(Error):
 import popen
 import os
 import time
+import linediff
 
 def _diff_args(type, options):
   """generate argument list to pass to diff or rcsdiff"""
@@ -416,9 +417,51 @@ class _diff_fp:
   def __del__(self):
     self.close()
 
-  def _label(self, (path, date, rev)):
-    date = date and time.strftime('%Y/%m/%d %H:%M:%S', time.gmtime(date))
-    return "%s\t%s\t%s" % (path, date, rev)
+  def _label(self, info):
+    return _diff_label(info)
+
+def _diff_label((path, date, rev)):
+  date = date and time.strftime('%Y/%m/%d %H:%M:%S', time.gmtime(date))
+  return "%s\t%s\t%s" % (path, date, rev)
+
+def _diff_text(text1, text2, info1, info2, type, options):
+  """Return a file object reading the differences between the file
+  contents TEXT1 and TEXT2 (described by the (path, date, revision)
+  tuples INFO1 and INFO2), as diff run with the arguments _diff_args()
+  makes of TYPE and OPTIONS would report them, but computed in-process.
+
+  The 'diff_algorithm' option, if given, selects the algorithm used:
+  linediff.MYERS (the default) or linediff.PATIENCE."""
+
+  label1 = _diff_label(info1)
+  label2 = _diff_label(info2)
+  if linediff.is_binary(text1) or linediff.is_binary(text2):
+    if text1 == text2:
+      return linediff.DiffFile([])
+    return linediff.DiffFile([linediff._BINARY_MESSAGE % (label1, label2)])
+
+  funout = options.get('funout', 0)
+  context = options.get('context', 3)
+  horizon = context
+  if type == SIDE_BY_SIDE:
+    horizon = 0
+  lines1 = linediff.split_lines(text1)
+  lines2 = linediff.split_lines(text2)
+  changes = linediff.get_changes(lines1, lines2,
+                                 options.get('diff_algorithm',
+                                             linediff.MYERS),
+                                 options.get('ignore_white', 0), horizon)
+  if type == CONTEXT:
+    lines = linediff.context_diff(lines1, lines2, label1, label2, changes,
+                                  context, funout)
+  elif type == UNIFIED:
+    lines = linediff.unified_diff(lines1, lines2, label1, label2, changes,
+                                  context, funout)
+  elif type == SIDE_BY_SIDE:
+    lines = linediff.side_by_side_diff(lines1, lines2, changes, 164)
+  else:
+    raise NotImplementedError
+  return linediff.DiffFile(lines)
 
 
 def check_root_access(repos):
@@ -442,3 +485,58 @@ def check_path_access(repos, path_parts, pathtype=None, rev=None):
     pathtype = repos.itemtype(path_parts, rev)
   return auth.check_path_access(repos.rootname(), path_parts, pathtype, rev)
 
+def check_paths_access(repos, parent_parts, names, kinds=None, rev=None):
+  """Return a list of flags, one for each name in NAMES, each set iff
+  the associated username is permitted to read revision REV of the path
+  PARENT_PARTS + [NAME] (of the corresponding type in KINDS, if given)
+  in repository REPOS, as determined by consulting REPOS's Authorizer
+  object (if any)."""
+
+  auth = repos.authorizer()
+  if not auth:
+    return [1] * len(names)
+  if kinds is None:
+    kinds = [None] * len(names)
+  kinds = list(kinds)
+  for i in range(len(names)):
+    if not kinds[i]:
+      kinds[i] = repos.itemtype(list(parent_parts) + [names[i]], rev)
+  return auth.check_paths_access(repos.rootname(), parent_parts, names,
+                                 kinds, rev)
+
+def check_path_list_access(repos, paths):
+  """Return a list of flags, one for each (PATH_PARTS, PATHTYPE, REV)
+  tuple in PATHS, each set iff the associated username is permitted to
+  read revision REV of the path PATH_PARTS (of type PATHTYPE) in
+  repository REPOS.  Paths sharing a parent directory and revision are
+  checked together."""
+
+  if not repos.authorizer():
+    return [1] * len(paths)
+  results = [1] * len(paths)
+  batches = {}   # (parent_parts, rev) -> [index, ...]
+  order = []
+  for i in range(len(paths)):
+    path_parts, pathtype, rev = paths[i]
+    if not path_parts:
+      results[i] = check_path_access(repos, path_parts, pathtype, rev)
+      continue
+    key = (tuple(path_parts[:-1]), rev)
+    batch = batches.get(key)
+    if batch is None:
+      batch = batches[key] = []
+      order.append(key)
+    batch.append(i)
+  for key in order:
+    parent_parts, rev = key
+    batch = batches[key]
+    names = []
+    kinds = []
+    for i in batch:
+      names.append(paths[i][0][-1])
+      kinds.append(paths[i][1])
+    flags = check_paths_access(repos, list(parent_parts), names, kinds, rev)
+    for j in range(len(batch)):
+      results[batch[j]] = flags[j]
+  return results
+
@@ -57,11 +57,13 @@ def find_root_in_parent(parent_path, rootname):
   return None
 
 
-def CVSRepository(name, rootpath, authorizer, utilities, use_rcsparse):
+def CVSRepository(name, rootpath, authorizer, utilities, use_rcsparse,
+                  rcsparse_cache_dir=None):
   rootpath = canonicalize_rootpath(rootpath)
   if use_rcsparse:
     import ccvs
-    return ccvs.CCVSRepository(name, rootpath, authorizer, utilities)
+    return ccvs.CCVSRepository(name, rootpath, authorizer, utilities,
+                               rcsparse_cache_dir)
   else:
     import bincvs
     return bincvs.BinCVSRepository(name, rootpath, authorizer, utilities)
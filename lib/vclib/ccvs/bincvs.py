@@ -24,6 +24,7 @@ import calendar
 
 # ViewVC libs
 import popen
+import forkmap
 import vclib.ccvs
 
 def _path_join(path_parts):
@@ -102,8 +103,7 @@ class BaseCVSRepository(vclib.Repository):
         name = file
       if not name:
         continue
-      if vclib.check_path_access(self, path_parts + [name], kind, rev):
-        data.append(CVSDirEntry(name, kind, errors, 0))
+      data.append(CVSDirEntry(name, kind, errors, 0))
 
     full_name = os.path.join(full_name, 'Attic')
     if os.path.isdir(full_name):
@@ -117,10 +117,16 @@ class BaseCVSRepository(vclib.Repository):
           name = file
         if not name:
           continue
-        if vclib.check_path_access(self, path_parts + [name], kind, rev):
-          data.append(CVSDirEntry(name, kind, errors, 1))
-
-    return data
+        data.append(CVSDirEntry(name, kind, errors, 1))
+
+    readable = vclib.check_paths_access(self, path_parts,
+                                        map(lambda x: x.name, data),
+                                        map(lambda x: x.kind, data), rev)
+    entries = [ ]
+    for i in range(len(data)):
+      if readable[i]:
+        entries.append(data[i])
+    return entries
     
   def _getpath(self, path_parts):
     return apply(os.path.join, (self.rootpath,) + tuple(path_parts))
@@ -250,6 +256,10 @@ class BinCVSRepository(BaseCVSRepository):
         boolean. true to fetch logs of the most recently modified file in each
         subdirectory
 
+      cvs_jobs, cvs_jobs_threshold
+        integers. the number of worker processes to spread the work
+        across, and the number of entries below which not to bother
+
     Option values returned by this implementation:
 
       cvs_tags, cvs_branches
@@ -261,10 +271,15 @@ class BinCVSRepository(BaseCVSRepository):
 
     subdirs = options.get('cvs_subdirs', 0)
     entries_to_fetch = []
-    for entry in entries:
-      if vclib.check_path_access(self, path_parts + [entry.name], None, rev):
-        entries_to_fetch.append(entry)
-    alltags = _get_logs(self, path_parts, entries_to_fetch, rev, subdirs)
+    readable = vclib.check_paths_access(self, path_parts,
+                                        map(lambda x: x.name, entries),
+                                        map(lambda x: x.kind, entries), rev)
+    for i in range(len(entries)):
+      if readable[i]:
+        entries_to_fetch.append(entries[i])
+    jobs = _dirlogs_jobs(options, len(entries_to_fetch))
+    alltags = _get_logs(self, path_parts, entries_to_fetch, rev, subdirs,
+                        jobs)
     branches = options['cvs_branches'] = []
     tags = options['cvs_tags'] = []
     for name, rev in alltags.items():
@@ -955,36 +970,55 @@ def _file_log(revs, taginfo, lockinfo, cur_branch, filter):
   
   return filtered_revs
 
-def _get_logs(repos, dir_path_parts, entries, view_tag, get_dirs):
+def _get_logs(repos, dir_path_parts, entries, view_tag, get_dirs, jobs=1):
   alltags = {           # all the tags seen in the files of this dir
     'MAIN' : '',
     'HEAD' : '1.1'
     }
 
-  entries_idx = 0
-  entries_len = len(entries)
-  max_args = 100
-
-  while 1:
-    chunk = []
+  dirpath = repos._getpath(dir_path_parts)
+  files = []
+  for entry in entries:
+    path = _log_path(entry, dirpath, get_dirs)
+    if path:
+      entry.path = path
+      files.append(entry)
 
-    while len(chunk) < max_args and entries_idx < entries_len:
-      entry = entries[entries_idx]
-      path = _log_path(entry, repos._getpath(dir_path_parts), get_dirs)
-      if path:
-        entry.path = path
-        entry.idx = entries_idx
-        chunk.append(entry)
+    # set properties even if we don't retrieve logs
+    entry.rev = entry.date = entry.author = None
+    entry.dead = entry.log = entry.lockinfo = None
 
-      # set properties even if we don't retrieve logs
-      entry.rev = entry.date = entry.author = None
-      entry.dead = entry.log = entry.lockinfo = None
+  # run rlog on at most max_args files at a time, and when using worker
+  # processes, split the files evenly between them
+  max_args = 100
+  if jobs > 1:
+    max_args = min(max_args, (len(files) + jobs - 1) / jobs) or 1
+  chunks = []
+  for i in range(0, len(files), max_args):
+    chunks.append(files[i:i+max_args])
+
+  if jobs > 1 and len(chunks) > 1:
+    def get_chunk_logs(chunk, repos=repos, view_tag=view_tag):
+      chunk_tags = {}
+      _get_chunk_logs(repos, chunk, view_tag, chunk_tags)
+      return map(_get_log_attrs, chunk), chunk_tags
+    results = forkmap.forkmap(get_chunk_logs, chunks, jobs)
+    for i in range(len(chunks)):
+      attrs, chunk_tags = results[i]
+      map(_set_log_attrs, chunks[i], attrs)
+      alltags.update(chunk_tags)
+  else:
+    for chunk in chunks:
+      _get_chunk_logs(repos, chunk, view_tag, alltags)
 
-      entries_idx = entries_idx + 1
+  return alltags
 
-    if not chunk:
-      return alltags
+def _get_chunk_logs(repos, chunk, view_tag, alltags):
+  """Run rlog on the files in CHUNK (a list of directory entries), and
+  set the entries' properties from its output.  Add all the tags seen
+  to the ALLTAGS dictionary."""
 
+  while chunk:
     args = []
     if not view_tag:
       # NOTE: can't pass tag on command line since a tag may contain "-"
@@ -994,7 +1028,9 @@ def _get_logs(repos, dir_path_parts, entries, view_tag, get_dirs):
     args.extend(map(lambda x: x.path, chunk))
     rlog = repos.rcs_popen('rlog', args, 'rt')
 
-    # consume each file found in the resulting log
+    # consume each file found in the resulting log.  if rlog gives up
+    # early, start it again on the rest of the files
+    rest = []
     chunk_idx = 0
     while chunk_idx < len(chunk):
       file = chunk[chunk_idx]
@@ -1012,9 +1048,7 @@ def _get_logs(repos, dir_path_parts, entries, view_tag, get_dirs):
 
         # if current file has errors, restart on the next one
         if file.errors:
-          chunk_idx = chunk_idx + 1
-          if chunk_idx < len(chunk):
-            entries_idx = chunk[chunk_idx].idx
+          rest = chunk[chunk_idx + 1:]
           break
 
         # otherwise just error out
@@ -1105,6 +1139,26 @@ def _get_logs(repos, dir_path_parts, entries, view_tag, get_dirs):
       chunk_idx = chunk_idx + 1
 
     rlog.close()
+    chunk = rest
+
+def _dirlogs_jobs(options, count):
+  """Return the number of worker processes dirlogs should use to fetch
+  the logs of COUNT entries, according to the dirlogs OPTIONS."""
+  if count < options.get('cvs_jobs_threshold', 0):
+    return 1
+  return options.get('cvs_jobs', 1)
+
+# properties of a directory entry set by dirlogs, which worker processes
+# pass back to the main process
+_LOG_ATTRS = ('rev', 'date', 'author', 'dead', 'absent', 'log', 'lockinfo',
+              'errors')
+
+def _get_log_attrs(entry):
+  return map(lambda attr, entry=entry: getattr(entry, attr, None), _LOG_ATTRS)
+
+def _set_log_attrs(entry, values):
+  for attr, value in map(None, _LOG_ATTRS, values):
+    setattr(entry, attr, value)
 
 def _log_path(entry, dirpath, getdirs):
   path = name = None
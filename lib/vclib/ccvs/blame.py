@@ -30,6 +30,7 @@ import re
 import time
 import math
 import rcsparse
+import rcsdelta
 import vclib
 
 class CVSParser(rcsparse.Sink):
@@ -37,15 +38,16 @@ class CVSParser(rcsparse.Sink):
   trunk_rev   = re.compile('^[0-9]+\\.[0-9]+$')
   last_branch = re.compile('(.*)\\.[0-9]+')
   is_branch   = re.compile('^(.*)\\.0\\.([0-9]+)$')
-  d_command   = re.compile('^d(\d+)\\s(\\d+)')
-  a_command   = re.compile('^a(\d+)\\s(\\d+)')
 
   SECONDS_PER_DAY = 86400
 
-  def __init__(self):
+  def __init__(self, opt_rev=None, opt_m_timestamp=None):
+    self.opt_rev = opt_rev
+    self.opt_m_timestamp = opt_m_timestamp
     self.Reset()
 
   def Reset(self):
+    self.head_revision = None
     self.last_revision = {}
     self.prev_revision = {}
     self.revision_date = {}
@@ -58,10 +60,17 @@ class CVSParser(rcsparse.Sink):
     self.revision_ctime = {}
     self.revision_age = {}
     self.revision_log = {}
-    self.revision_deltatext = {}
-    self.revision_map = []    # map line numbers to revisions
-    self.lines_added  = {}
-    self.lines_removed = {}
+    self.revision = None      # the revision being annotated
+
+    # Annotation state.  Lines are tracked as integer indexes into
+    # line_text and line_owner; see tree_completed() for the rest.
+    self.line_text = []       # text of each line
+    self.line_owner = []      # revision which introduced each line
+    self.text = None          # PieceText of trunk text, down to the anchor
+    self.older = None         # PieceText of line indexes, below the anchor
+    self.newer = None         # PieceText of line indexes, up the branch
+    self.last_trunk = None    # the trunk revision self.older represents
+    self.pending = {}         # branch deltatexts received out of order
 
   # Map a tag to a numerical revision number.  The tag can be a symbolic
   # branch tag, a symbolic revision tag, or an ordinary numerical
@@ -76,6 +85,9 @@ class CVSParser(rcsparse.Sink):
           return self.last_revision[branch]
         else:
           return match.group(1)
+      elif revision.count('.') % 2 == 0:
+        # a non-magic branch number, such as a vendor branch
+        return self.last_revision.get(revision, '')
       else:
         return revision
     except:
@@ -97,66 +109,6 @@ class CVSParser(rcsparse.Sink):
 
     return ancestors
 
-  # Split deltatext specified by rev to each line.
-  def deltatext_split(self, rev):
-    lines = self.revision_deltatext[rev].split('\n')
-    if lines[-1] == '':
-      del lines[-1]
-    return lines
-
-  # Extract the given revision from the digested RCS file.
-  # (Essentially the equivalent of cvs up -rXXX)
-  def extract_revision(self, revision):
-    path = []
-    add_lines_remaining = 0
-    start_line = 0
-    count = 0
-    while revision:
-      path.append(revision)
-      revision = self.prev_delta.get(revision)
-    path.reverse()
-    path = path[1:]  # Get rid of head revision
-
-    text = self.deltatext_split(self.head_revision)
-
-    # Iterate, applying deltas to previous revision
-    for revision in path:
-      adjust = 0
-      diffs = self.deltatext_split(revision)
-      self.lines_added[revision]   = 0
-      self.lines_removed[revision] = 0
-      lines_added_now = 0
-      lines_removed_now = 0
-
-      for command in diffs:
-        dmatch = self.d_command.match(command)
-        amatch = self.a_command.match(command)
-        if add_lines_remaining > 0:
-          # Insertion lines from a prior "a" command
-          text.insert(start_line + adjust, command)
-          add_lines_remaining = add_lines_remaining - 1
-          adjust = adjust + 1
-        elif dmatch:
-          # "d" - Delete command
-          start_line = int(dmatch.group(1))
-          count      = int(dmatch.group(2))
-          begin = start_line + adjust - 1
-          del text[begin:begin + count]
-          adjust = adjust - count
-          lines_removed_now = lines_removed_now + count
-        elif amatch:
-          # "a" - Add command
-          start_line = int(amatch.group(1))
-          count      = int(amatch.group(2))
-          add_lines_remaining = count
-          lines_added_now = lines_added_now + count
-        else:
-          raise RuntimeError, 'Error parsing diff commands'
-
-      self.lines_added[revision]   = self.lines_added[revision]   + lines_added_now
-      self.lines_removed[revision] = self.lines_removed[revision] + lines_removed_now
-    return text
-
   def set_head_revision(self, revision):
     self.head_revision = revision
 
@@ -238,27 +190,139 @@ class CVSParser(rcsparse.Sink):
       else:
         self.prev_revision[next] = revision
 
-  # Construct associative arrays containing info about individual revisions.
+  # Annotation happens while the deltatexts stream in, so that each
+  # deltatext can be discarded as soon as it has been applied.
+  #
+  # The deltatexts arrive head revision first, then trunk revisions in
+  # descending order, with the revisions of each branch (in ascending
+  # order) following the trunk revision they sprout from.  Trunk
+  # deltas transform a revision into its predecessor; branch deltas
+  # transform a revision into its successor.
   #
-  # The following associative arrays are created, keyed by revision number:
-  #   revision_log        -- log message
-  #   revision_deltatext  -- Either the complete text of the revision,
-  #                          in the case of the head revision, or the
-  #                          encoded delta between this revision and another.
-  #                          The delta is either with respect to the successor
-  #                          revision if this revision is on the trunk or
-  #                          relative to its immediate predecessor if this
-  #                          revision is on a branch.
+  # The "anchor" is the trunk revision from which the requested
+  # revision is reached: the requested revision itself if it is on
+  # the trunk, or else the trunk revision its branch sprouts from.
+  # Trunk deltas are applied to real text (self.text) from the head
+  # down to the anchor.  Once there, each line of the anchor's text
+  # becomes an index into line_text/line_owner, and two things happen
+  # independently:
+  #
+  #   * Deltas of trunk revisions below the anchor are applied to a
+  #     list of line indexes (self.older).  Lines they delete were
+  #     introduced by the revision above them.  Lines that survive
+  #     down to the primordial revision were introduced there.
+  #
+  #   * Deltas of the branch revisions leading to the requested
+  #     revision are applied to another list of line indexes
+  #     (self.newer).  Lines they add are owned by their revision.
+
+  def tree_completed(self):
+    if self.head_revision is None:
+      raise RuntimeError, 'error: no revisions exist'
+    if self.opt_rev in [None, '', 'HEAD']:
+      # Explicitly specified topmost revision in tree
+      revision = self.head_revision
+    else:
+      # Symbolic tag or specific revision number specified.
+      revision = self.map_tag_to_revision(self.opt_rev)
+      if not self.timestamp.has_key(revision):
+        raise RuntimeError, 'error: -r: No such revision: ' + self.opt_rev
+    self.revision = revision
+
+    # Don't display file at all, if -m option is specified and no
+    # changes have been made in the specified file.
+    if self.opt_m_timestamp and self.timestamp[revision] < self.opt_m_timestamp:
+      raise rcsparse.RCSStopParser
+
+    # The branch revisions leading from the anchor to REVISION, in the
+    # order their deltas must be applied.
+    self.branch_path = []
+    while not self.trunk_rev.match(revision):
+      self.branch_path.append(revision)
+      revision = self.prev_revision[revision]
+    self.branch_path.reverse()
+    self.anchor = revision
+
   def set_revision_info(self, revision, log, text):
     self.revision_log[revision] = log
-    self.revision_deltatext[revision] = text
+
+    if revision == self.head_revision:
+      lines = text.split('\n')
+      if lines[-1] == '':
+        del lines[-1]
+      self.text = rcsdelta.PieceText(lines)
+    elif self.trunk_rev.match(revision):
+      if self.text is not None:
+        # still on our way down to the anchor
+        self.text.apply(text)
+      elif self.older is not None:
+        self.older.apply(text, self._lines_deleted, self._lines_added)
+        self.last_trunk = revision
+    elif revision in self.branch_path:
+      self.pending[revision] = text
+      self._apply_branch_deltas()
+
+    if revision == self.anchor:
+      self._start_annotation()
+
+  def _start_annotation(self):
+    self.line_text = self.text.lines()
+    self.line_owner = [None] * len(self.line_text)
+    self.text = None
+    indexes = range(len(self.line_text))
+    self.older = rcsdelta.PieceText(indexes)
+    self.newer = rcsdelta.PieceText(indexes)
+    self.last_trunk = self.anchor
+    self._apply_branch_deltas()
+
+  def _apply_branch_deltas(self):
+    if self.newer is None:
+      return
+    while self.branch_path and self.pending.has_key(self.branch_path[0]):
+      self.branch_revision = self.branch_path.pop(0)
+      text = self.pending[self.branch_revision]
+      del self.pending[self.branch_revision]
+      self.newer.apply(text, None, self._branch_lines_added)
+
+  def _lines_deleted(self, buf, start, end):
+    # lines of the newer trunk revision missing from the older one
+    owner = self.line_owner
+    for idx in buf[start:end]:
+      if idx is not None:
+        owner[idx] = self.last_trunk
+
+  def _lines_added(self, lines):
+    # lines of the older trunk revision missing from the newer one are
+    # of no interest
+    return [None] * len(lines)
+
+  def _branch_lines_added(self, lines):
+    start = len(self.line_text)
+    self.line_text.extend(lines)
+    self.line_owner.extend([self.branch_revision] * len(lines))
+    return range(start, start + len(lines))
+
+  def parse_completed(self):
+    if self.newer is None:
+      raise RuntimeError, 'error: revision %s not found' % self.anchor
+    if self.branch_path:
+      raise RuntimeError, 'error: revision %s not found' % self.branch_path[0]
+
+    # whatever lines have not been claimed by a later trunk revision
+    # were introduced in the primordial one
+    owner = self.line_owner
+    for idx in self.older.lines():
+      if idx is not None and owner[idx] is None:
+        owner[idx] = self.last_trunk
+
+    self.revision_map = self.newer.lines()
+    self.older = self.newer = None
 
   def parse_cvs_file(self, rcs_pathname, opt_rev = None, opt_m_timestamp = None):
     # Args in:  opt_rev - requested revision
     #           opt_m - time since modified
-    # Args out: revision_map
+    # Args out: revision_map (line indexes into line_text/line_owner)
     #           timestamp
-    #           revision_deltatext
 
     # CheckHidden(rcs_pathname)
     try:
@@ -267,165 +331,28 @@ class CVSParser(rcsparse.Sink):
       raise RuntimeError, ('error: %s appeared to be under CVS control, ' +
               'but the RCS file is inaccessible.') % rcs_pathname
 
-    rcsparse.parse(rcsfile, self)
-    rcsfile.close()
-
-    if opt_rev in [None, '', 'HEAD']:
-      # Explicitly specified topmost revision in tree
-      revision = self.head_revision
-    else:
-      # Symbolic tag or specific revision number specified.
-      revision = self.map_tag_to_revision(opt_rev)
-      if revision == '':
-        raise RuntimeError, 'error: -r: No such revision: ' + opt_rev
-
-    # The primordial revision is not always 1.1!  Go find it.
-    primordial = revision
-    while self.prev_revision.get(primordial):
-      primordial = self.prev_revision[primordial]
-
-    # Don't display file at all, if -m option is specified and no
-    # changes have been made in the specified file.
-    if opt_m_timestamp and self.timestamp[revision] < opt_m_timestamp:
-      return ''
-
-    # Figure out how many lines were in the primordial, i.e. version 1.1,
-    # check-in by moving backward in time from the head revision to the
-    # first revision.
-    line_count = 0
-    if self.revision_deltatext.get(self.head_revision):
-      tmp_array = self.deltatext_split(self.head_revision)
-      line_count = len(tmp_array)
-
-    skip = 0
-
-    rev = self.prev_revision.get(self.head_revision)
-    while rev:
-      diffs = self.deltatext_split(rev)
-      for command in diffs:
-        dmatch = self.d_command.match(command)
-        amatch = self.a_command.match(command)
-        if skip > 0:
-          # Skip insertion lines from a prior "a" command
-          skip = skip - 1
-        elif dmatch:
-          # "d" - Delete command
-          start_line = int(dmatch.group(1))
-          count      = int(dmatch.group(2))
-          line_count = line_count - count
-        elif amatch:
-          # "a" - Add command
-          start_line = int(amatch.group(1))
-          count      = int(amatch.group(2))
-          skip       = count
-          line_count = line_count + count
-        else:
-          raise RuntimeError, 'error: illegal RCS file'
-
-      rev = self.prev_revision.get(rev)
-
-    # Now, play the delta edit commands *backwards* from the primordial
-    # revision forward, but rather than applying the deltas to the text of
-    # each revision, apply the changes to an array of revision numbers.
-    # This creates a "revision map" -- an array where each element
-    # represents a line of text in the given revision but contains only
-    # the revision number in which the line was introduced rather than
-    # the line text itself.
-    #
-    # Note: These are backward deltas for revisions on the trunk and
-    # forward deltas for branch revisions.
-
-    # Create initial revision map for primordial version.
-    self.revision_map = [primordial] * line_count
-
-    ancestors = [revision, ] + self.ancestor_revisions(revision)
-    ancestors = ancestors[:-1]  # Remove "1.1"
-    last_revision = primordial
-    ancestors.reverse()
-    for revision in ancestors:
-      is_trunk_revision = self.trunk_rev.match(revision) is not None
-
-      if is_trunk_revision:
-        diffs = self.deltatext_split(last_revision)
-
-        # Revisions on the trunk specify deltas that transform a
-        # revision into an earlier revision, so invert the translation
-        # of the 'diff' commands.
-        for command in diffs:
-          if skip > 0:
-            skip = skip - 1
-          else:
-            dmatch = self.d_command.match(command)
-            amatch = self.a_command.match(command)
-            if dmatch:
-              start_line = int(dmatch.group(1))
-              count      = int(dmatch.group(2))
-              temp = []
-              while count > 0:
-                temp.append(revision)
-                count = count - 1
-              self.revision_map = (self.revision_map[:start_line - 1] +
-                      temp + self.revision_map[start_line - 1:])
-            elif amatch:
-              start_line = int(amatch.group(1))
-              count      = int(amatch.group(2))
-              del self.revision_map[start_line:start_line + count]
-              skip = count
-            else:
-              raise RuntimeError, 'Error parsing diff commands'
-
-      else:
-        # Revisions on a branch are arranged backwards from those on
-        # the trunk.  They specify deltas that transform a revision
-        # into a later revision.
-        adjust = 0
-        diffs = self.deltatext_split(revision)
-        for command in diffs:
-          if skip > 0:
-            skip = skip - 1
-          else:
-            dmatch = self.d_command.match(command)
-            amatch = self.a_command.match(command)
-            if dmatch:
-              start_line = int(dmatch.group(1))
-              count      = int(dmatch.group(2))
-              adj_begin  = start_line + adjust - 1
-              adj_end    = start_line + adjust - 1 + count
-              del self.revision_map[adj_begin:adj_end]
-              adjust = adjust - count
-            elif amatch:
-              start_line = int(amatch.group(1))
-              count      = int(amatch.group(2))
-              skip = count
-              temp = []
-              while count > 0:
-                temp.append(revision)
-                count = count - 1
-              self.revision_map = (self.revision_map[:start_line + adjust] +
-                      temp + self.revision_map[start_line + adjust:])
-              adjust = adjust + skip
-            else:
-              raise RuntimeError, 'Error parsing diff commands'
-
-      last_revision = revision
-
-    return revision
+    self.Reset()
+    self.opt_rev = opt_rev
+    self.opt_m_timestamp = opt_m_timestamp
+    try:
+      try:
+        rcsparse.parse(rcsfile, self)
+      except rcsparse.RCSStopParser:
+        return ''
+    finally:
+      rcsfile.close()
+    return self.revision
 
 
 class BlameSource:
   def __init__(self, rcs_file, opt_rev=None, include_text=False):
-    # Parse the CVS file
+    # Parse the CVS file, annotating as we go
     parser = CVSParser()
     revision = parser.parse_cvs_file(rcs_file, opt_rev)
-    count = len(parser.revision_map)
-    lines = parser.extract_revision(revision)
-    if len(lines) != count:
-      raise RuntimeError, 'Internal consistency error'
 
     # set up some state variables
     self.revision = revision
-    self.lines = lines
-    self.num_lines = count
+    self.num_lines = len(parser.revision_map)
     self.parser = parser
     self.include_text = include_text
 
@@ -442,13 +369,14 @@ class BlameSource:
       raise BlameSequencingError()
 
     # Get the line and metadata for it.
-    rev = self.parser.revision_map[idx]
+    line_idx = self.parser.revision_map[idx]
+    rev = self.parser.line_owner[line_idx]
     prev_rev = self.parser.prev_revision.get(rev)
     line_number = idx + 1
     author = self.parser.revision_author[rev]
-    thisline = self.lines[idx]
-    if not self.include_text:
-      thisline = None
+    thisline = None
+    if self.include_text:
+      thisline = self.parser.line_text[line_idx]
     ### TODO:  Put a real date in here.
     item = vclib.Annotation(thisline, line_number, rev, prev_rev, author, None)
     self.last = item
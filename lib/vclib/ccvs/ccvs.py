@@ -11,20 +11,34 @@
 # -----------------------------------------------------------------------
 
 import os
-import re
 import cStringIO
-import tempfile
 
 import vclib
+import forkmap
 import rcsparse
+import rcscache
+import rcsdelta
 import blame
 
 ### The functionality shared with bincvs should probably be moved to a
 ### separate module
-from bincvs import BaseCVSRepository, Revision, Tag, _file_log, _log_path, _logsort_date_cmp, _logsort_rev_cmp, _path_join
+from bincvs import BaseCVSRepository, Revision, Tag, _file_log, _log_path, _logsort_date_cmp, _logsort_rev_cmp, _path_join, _dirlogs_jobs, _get_log_attrs, _set_log_attrs
 
 
 class CCVSRepository(BaseCVSRepository):
+  def __init__(self, name, rootpath, authorizer, utilities, cache_dir=None):
+    BaseCVSRepository.__init__(self, name, rootpath, authorizer, utilities)
+    self.rcscache = cache_dir and rcscache.RCSInfoCache(cache_dir) or None
+
+  def _parse(self, path, sink):
+    """Parse the RCS file at PATH into SINK, using the RCS metadata
+    cache (if enabled) in place of a real parse.  SINK must not need
+    the revision texts."""
+    if self.rcscache:
+      self.rcscache.get(path).replay(sink)
+    else:
+      rcsparse.parse(open(path, 'rb'), sink)
+
   def dirlogs(self, path_parts, rev, entries, options):
     """see vclib.Repository.dirlogs docstring
 
@@ -37,6 +51,15 @@ class CCVSRepository(BaseCVSRepository):
         boolean. true to fetch logs of the most recently modified file in each
         subdirectory
 
+      cvs_logs
+        boolean, default true. set to false if the log messages of the
+        entries are not needed, so that only the headers of the RCS files
+        are read
+
+      cvs_jobs, cvs_jobs_threshold
+        integers. the number of worker processes to spread the work
+        across, and the number of entries below which not to bother
+
     Option values returned by this implementation:
 
       cvs_tags, cvs_branches
@@ -46,11 +69,15 @@ class CCVSRepository(BaseCVSRepository):
       raise vclib.Error("Path '%s' is not a directory."
                         % (part2path(path_parts)))
     entries_to_fetch = []
-    for entry in entries:
-      if vclib.check_path_access(self, path_parts + [entry.name], None, rev):
-        entries_to_fetch.append(entry)
+    readable = vclib.check_paths_access(self, path_parts,
+                                        map(lambda x: x.name, entries),
+                                        map(lambda x: x.kind, entries), rev)
+    for i in range(len(entries)):
+      if readable[i]:
+        entries_to_fetch.append(entries[i])
 
     subdirs = options.get('cvs_subdirs', 0)
+    logs = options.get('cvs_logs', 1)
 
     dirpath = self._getpath(path_parts)
     alltags = {           # all the tags seen in the files of this dir
@@ -58,20 +85,29 @@ class CCVSRepository(BaseCVSRepository):
       'HEAD' : '1.1'
     }
 
+    files = []
     for entry in entries_to_fetch:
       entry.rev = entry.date = entry.author = None
       entry.dead = entry.absent = entry.log = entry.lockinfo = None
       path = _log_path(entry, dirpath, subdirs)
       if path:
         entry.path = path
-        try:
-          rcsparse.parse(open(path, 'rb'), InfoSink(entry, rev, alltags))
-        except IOError, e:
-          entry.errors.append("rcsparse error: %s" % e)
-        except RuntimeError, e:
-          entry.errors.append("rcsparse error: %s" % e)
-        except rcsparse.RCSStopParser:
-          pass
+        files.append(entry)
+
+    jobs = _dirlogs_jobs(options, len(entries_to_fetch))
+    if jobs > 1:
+      def get_info(entry, self=self, rev=rev, logs=logs):
+        entry_tags = {}
+        self._get_info(entry, rev, entry_tags, logs)
+        return _get_log_attrs(entry), entry_tags
+      results = forkmap.forkmap(get_info, files, jobs)
+      for i in range(len(files)):
+        attrs, entry_tags = results[i]
+        _set_log_attrs(files[i], attrs)
+        alltags.update(entry_tags)
+    else:
+      for entry in files:
+        self._get_info(entry, rev, alltags, logs)
 
     branches = options['cvs_branches'] = []
     tags = options['cvs_tags'] = []
@@ -81,6 +117,17 @@ class CCVSRepository(BaseCVSRepository):
       else:
         tags.append(name)
 
+  def _get_info(self, entry, rev, alltags, logs):
+    """Set the properties of directory entry ENTRY from its RCS file."""
+    try:
+      self._parse(entry.path, InfoSink(entry, rev, alltags, logs))
+    except IOError, e:
+      entry.errors.append("rcsparse error: %s" % e)
+    except RuntimeError, e:
+      entry.errors.append("rcsparse error: %s" % e)
+    except rcsparse.RCSStopParser:
+      pass
+
   def itemlog(self, path_parts, rev, sortby, first, limit, options):
     """see vclib.Repository.itemlog docstring
 
@@ -98,7 +145,7 @@ class CCVSRepository(BaseCVSRepository):
 
     path = self.rcsfile(path_parts, 1)
     sink = TreeSink()
-    rcsparse.parse(open(path, 'rb'), sink)
+    self._parse(path, sink)
     filtered_revs = _file_log(sink.revs.values(), sink.tags, sink.lockinfo,
                               sink.default_branch, rev)
     for rev in filtered_revs:
@@ -123,10 +170,8 @@ class CCVSRepository(BaseCVSRepository):
     if self.itemtype(path_parts2, rev2) != vclib.FILE:  # does auth-check
       raise vclib.Error("Path '%s' is not a file." % (_path_join(path_parts2)))
     
-    temp1 = tempfile.mktemp()
-    open(temp1, 'wb').write(self.openfile(path_parts1, rev1, {})[0].getvalue())
-    temp2 = tempfile.mktemp()
-    open(temp2, 'wb').write(self.openfile(path_parts2, rev2, {})[0].getvalue())
+    text1 = self.openfile(path_parts1, rev1, {})[0].getvalue()
+    text2 = self.openfile(path_parts2, rev2, {})[0].getvalue()
 
     r1 = self.itemlog(path_parts1, rev1, vclib.SORTBY_DEFAULT, 0, 0, {})[-1]
     r2 = self.itemlog(path_parts2, rev2, vclib.SORTBY_DEFAULT, 0, 0, {})[-1]
@@ -134,10 +179,7 @@ class CCVSRepository(BaseCVSRepository):
     info1 = (self.rcsfile(path_parts1, root=1, v=0), r1.date, r1.string)
     info2 = (self.rcsfile(path_parts2, root=1, v=0), r2.date, r2.string)
 
-    diff_args = vclib._diff_args(type, options)
-
-    return vclib._diff_fp(temp1, temp2, info1, info2,
-                          self.utilities.diff or 'diff', diff_args)
+    return vclib._diff_text(text1, text2, info1, info2, type, options)
 
   def annotate(self, path_parts, rev=None, include_text=False):
     if self.itemtype(path_parts, rev) != vclib.FILE:  # does auth-check
@@ -155,7 +197,7 @@ class CCVSRepository(BaseCVSRepository):
     sink = COSink(rev)
     rcsparse.parse(open(path, 'rb'), sink)
     revision = sink.last and sink.last.string
-    return cStringIO.StringIO('\n'.join(sink.sstext.text)), revision
+    return cStringIO.StringIO(sink.sstext.text()), revision
 
 class MatchingSink(rcsparse.Sink):
   """Superclass for sinks that search for revisions based on tag or number"""
@@ -188,7 +230,10 @@ class MatchingSink(rcsparse.Sink):
           pass
 
 class InfoSink(MatchingSink):
-  def __init__(self, entry, tag, alltags):
+  # the revision texts are never used
+  parse_mode = rcsparse.PARSE_LOGS
+
+  def __init__(self, entry, tag, alltags, logs=1):
     MatchingSink.__init__(self, tag)
     self.entry = entry
     self.alltags = alltags
@@ -196,6 +241,9 @@ class InfoSink(MatchingSink):
     self.perfect_match = 0
     self.lockinfo = { }
     self.saw_revision = False
+    if not logs:
+      # nor are the log messages
+      self.parse_mode = rcsparse.PARSE_TREE
 
   def define_tag(self, name, revision):
     MatchingSink.define_tag(self, name, revision)
@@ -242,24 +290,28 @@ class InfoSink(MatchingSink):
       self.matching_rev = rev
       self.perfect_match = perfect
 
+  def tree_completed(self):
+    if self.parse_mode == rcsparse.PARSE_TREE and self.matching_rev:
+      self._set_entry(None)
+
   def set_revision_info(self, revision, log, text):
     if self.matching_rev:
       if revision == self.matching_rev.string:
-        self.entry.rev = self.matching_rev.string
-        self.entry.date = self.matching_rev.date
-        self.entry.author = self.matching_rev.author
-        self.entry.dead = self.matching_rev.dead
-        self.entry.lockinfo = self.matching_rev.lockinfo
-        self.entry.absent = 0
-        self.entry.log = log
+        self._set_entry(log)
         raise rcsparse.RCSStopParser
     else:
       raise rcsparse.RCSStopParser
 
-class TreeSink(rcsparse.Sink):
-  d_command = re.compile('^d(\d+)\\s(\\d+)')
-  a_command = re.compile('^a(\d+)\\s(\\d+)')
+  def _set_entry(self, log):
+    self.entry.rev = self.matching_rev.string
+    self.entry.date = self.matching_rev.date
+    self.entry.author = self.matching_rev.author
+    self.entry.dead = self.matching_rev.dead
+    self.entry.lockinfo = self.matching_rev.lockinfo
+    self.entry.absent = 0
+    self.entry.log = log
 
+class TreeSink(rcsparse.Sink):
   def __init__(self):
     self.revs = { }
     self.tags = { }
@@ -285,78 +337,26 @@ class TreeSink(rcsparse.Sink):
     self.revs[revision] = Revision(revision, date, author, state == "dead")
 
   def set_revision_info(self, revision, log, text):
+    counts = None
+    if self.head != revision:
+      counts = rcscache.delta_counts(text)
+    self.set_revision_counts(revision, log, counts)
+
+  def set_revision_counts(self, revision, log, counts):
     # check revs.has_key(revision)
     rev = self.revs[revision]
     rev.log = log
 
     changed = None
-    added = 0
-    deled = 0
-    if self.head != revision:
+    if counts:
+      added, deled = counts
       changed = 1
-      lines = text.split('\n')
-      idx = 0
-      while idx < len(lines):
-        command = lines[idx]
-        dmatch = self.d_command.match(command)
-        idx = idx + 1
-        if dmatch:
-          deled = deled + int(dmatch.group(2))
-        else:
-          amatch = self.a_command.match(command)
-          if amatch:
-            count = int(amatch.group(2))
-            added = added + count
-            idx = idx + count
-          elif command:
-            raise "error while parsing deltatext: %s" % command
 
     if len(rev.number) == 2:
       rev.next_changed = changed and "+%i -%i" % (deled, added)
     else:
       rev.changed = changed and "+%i -%i" % (added, deled)
 
-class StreamText:
-  d_command = re.compile('^d(\d+)\\s(\\d+)')
-  a_command = re.compile('^a(\d+)\\s(\\d+)')
-
-  def __init__(self, text):
-    self.text = text.split('\n')
-
-  def command(self, cmd):
-    adjust = 0
-    add_lines_remaining = 0
-    diffs = cmd.split('\n')
-    if diffs[-1] == "":
-      del diffs[-1]
-    if len(diffs) == 0:
-      return
-    if diffs[0] == "":
-      del diffs[0]
-    for command in diffs:
-      if add_lines_remaining > 0:
-        # Insertion lines from a prior "a" command
-        self.text.insert(start_line + adjust, command)
-        add_lines_remaining = add_lines_remaining - 1
-        adjust = adjust + 1
-        continue
-      dmatch = self.d_command.match(command)
-      amatch = self.a_command.match(command)
-      if dmatch:
-        # "d" - Delete command
-        start_line = int(dmatch.group(1))
-        count      = int(dmatch.group(2))
-        begin = start_line + adjust - 1
-        del self.text[begin:begin + count]
-        adjust = adjust - count
-      elif amatch:
-        # "a" - Add command
-        start_line = int(amatch.group(1))
-        count      = int(amatch.group(2))
-        add_lines_remaining = count
-      else:
-        raise RuntimeError, 'Error parsing diff commands'
-
 def secondnextdot(s, start):
   # find the position the second dot after the start index.
   return s.find('.', s.find('.', start) + 1)
@@ -387,16 +387,16 @@ class COSink(MatchingSink):
 
     if rev.number == self.head.number:
       assert self.sstext is None
-      self.sstext = StreamText(text)
+      self.sstext = rcsdelta.PieceText(text.split('\n'))
     elif (depth == 2 and tag.number and rev.number >= tag.number[:depth]):
       assert len(self.last.number) == 2
       assert rev.number < self.last.number
-      self.sstext.command(text)
+      self.sstext.apply(text)
     elif (depth > 2 and rev.number[:depth-1] == tag.number[:depth-1] and
           (rev.number <= tag.number or len(tag.number) == depth-1)):
       assert len(rev.number) - len(self.last.number) in (0, 2)
       assert rev.number > self.last.number
-      self.sstext.command(text)
+      self.sstext.apply(text)
     else:
       rev = None
 
@@ -0,0 +1,225 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+
+"""rcscache.py: persistent on-disk cache of parsed RCS file metadata.
+
+The rcsparse-based CVS driver needs the admin section and revision
+tree of every ,v file it lists, and re-parsing those on each request
+is expensive for large directories.  This module records everything
+but the revision texts themselves -- head, principal branch, tags,
+locks, revision tree entries, log messages, and per-revision delta
+line counts -- in an RCSInfo object, and stores that object on disk
+keyed by the RCS file's path, inode, modification time and size.  A
+cached RCSInfo can be replayed into (most) rcsparse Sinks in place of
+a real parse.
+"""
+
+import os
+import re
+import tempfile
+import cPickle
+
+try:
+  from hashlib import md5
+except ImportError:
+  from md5 import md5
+
+import rcsparse
+import debug
+
+
+# Bump this whenever the layout of RCSInfo state changes, so that
+# stale cache files are ignored rather than misinterpreted.
+_CACHE_FORMAT = 1
+
+_d_command = re.compile('^d(\d+)\\s(\\d+)')
+_a_command = re.compile('^a(\d+)\\s(\\d+)')
+
+
+def delta_counts(text):
+  """Return a 2-tuple of the number of lines added and deleted by the
+  RCS deltatext TEXT."""
+  lines = text.split('\n')
+  added = deled = 0
+  idx = 0
+  while idx < len(lines):
+    command = lines[idx]
+    dmatch = _d_command.match(command)
+    idx = idx + 1
+    if dmatch:
+      deled = deled + int(dmatch.group(2))
+    else:
+      amatch = _a_command.match(command)
+      if amatch:
+        count = int(amatch.group(2))
+        added = added + count
+        idx = idx + count
+      elif command:
+        raise RuntimeError, 'error while parsing deltatext: %s' % command
+  return added, deled
+
+
+class RCSInfo(rcsparse.Sink):
+  """Sink which records the parsed metadata (everything but the
+  revision texts) of an RCS file."""
+
+  def __init__(self, state=None):
+    if state is None:
+      state = (None, None, [], [], [], [], {}, {})
+    (self.head, self.principal_branch, self.tags, self.lockers,
+     self.revisions, self.deltatexts, self.logs, self.counts) = state
+
+  def get_state(self):
+    """Return the recorded metadata as plain (picklable) data."""
+    return (self.head, self.principal_branch, self.tags, self.lockers,
+            self.revisions, self.deltatexts, self.logs, self.counts)
+
+  def set_head_revision(self, revision):
+    self.head = revision
+
+  def set_principal_branch(self, branch_name):
+    self.principal_branch = branch_name
+
+  def define_tag(self, name, revision):
+    self.tags.append((name, revision))
+
+  def set_locker(self, revision, locker):
+    self.lockers.append((revision, locker))
+
+  def define_revision(self, revision, timestamp, author, state,
+                      branches, next):
+    self.revisions.append((revision, timestamp, author, state,
+                           branches, next))
+
+  def set_revision_info(self, revision, log, text):
+    self.deltatexts.append(revision)
+    self.logs[revision] = log
+    if revision != self.head:
+      self.counts[revision] = delta_counts(text)
+
+  def replay(self, sink):
+    """Feed the recorded metadata to SINK, calling its callbacks in the
+    same order rcsparse.parse() would.
+
+    Revision texts are not recorded, so set_revision_info() is called
+    with a TEXT of None.  Sinks that need to know how many lines each
+    delta changed may instead implement set_revision_counts(REVISION,
+    LOG, COUNTS), which is called in place of set_revision_info() with
+    COUNTS set to an (added, deleted) tuple, or None for the head
+    revision.  As with a real parse, SINK may raise RCSStopParser to
+    end the replay early, and the replay ends after tree_completed()
+    if SINK's parse_mode is PARSE_TREE."""
+
+    if self.head is not None:
+      sink.set_head_revision(self.head)
+    if self.principal_branch is not None:
+      sink.set_principal_branch(self.principal_branch)
+    for name, revision in self.tags:
+      sink.define_tag(name, revision)
+    for revision, locker in self.lockers:
+      sink.set_locker(revision, locker)
+    sink.admin_completed()
+    for revision, timestamp, author, state, branches, next in self.revisions:
+      sink.define_revision(revision, timestamp, author, state,
+                           branches[:], next)
+    sink.tree_completed()
+    if sink.parse_mode != rcsparse.PARSE_TREE:
+      set_counts = getattr(sink, 'set_revision_counts', None)
+      for revision in self.deltatexts:
+        if set_counts:
+          set_counts(revision, self.logs[revision], self.counts.get(revision))
+        else:
+          sink.set_revision_info(revision, self.logs[revision], None)
+    sink.parse_completed()
+
+
+class RCSInfoCache:
+  """On-disk cache of RCSInfo objects.
+
+  Each RCS file gets its own cache file in CACHE_DIR, named after a
+  hash of the RCS file's path.  Cache files are replaced atomically,
+  so concurrent ViewVC processes may share a single cache directory.
+  Problems reading or writing the cache are never fatal; they simply
+  cause the RCS file to be parsed again."""
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+
+  def get(self, rcs_path):
+    """Return an RCSInfo object for the RCS file at RCS_PATH, parsing
+    the file only if there is no up-to-date cached copy of its
+    metadata.  Raise IOError if the file can't be read, as parsing it
+    would."""
+
+    try:
+      st = os.stat(rcs_path)
+    except OSError, e:
+      # (the file may have been removed since it was listed, say)
+      raise IOError(e.errno, e.strerror, e.filename)
+    stamp = (_CACHE_FORMAT, rcs_path, st.st_ino, st.st_mtime, st.st_size)
+    cache_path = os.path.join(self.cache_dir, md5(rcs_path).hexdigest())
+
+    debug.t_start('rcscache-read')
+    state = self._read(cache_path, stamp)
+    debug.t_end('rcscache-read')
+    if state is not None:
+      debug.t_start('rcscache-hit')
+      info = RCSInfo(state)
+      debug.t_end('rcscache-hit')
+      return info
+
+    debug.t_start('rcscache-miss')
+    info = RCSInfo()
+    fp = open(rcs_path, 'rb')
+    try:
+      rcsparse.parse(fp, info)
+    finally:
+      fp.close()
+    self._write(cache_path, stamp, info.get_state())
+    debug.t_end('rcscache-miss')
+    return info
+
+  def _read(self, cache_path, stamp):
+    try:
+      fp = open(cache_path, 'rb')
+    except IOError:
+      return None
+    try:
+      try:
+        cached_stamp, state = cPickle.load(fp)
+      except Exception:
+        return None
+    finally:
+      fp.close()
+    if cached_stamp != stamp:
+      return None
+    return state
+
+  def _write(self, cache_path, stamp, state):
+    try:
+      fd, temp_path = tempfile.mkstemp('.tmp', '', self.cache_dir)
+    except (IOError, OSError):
+      return
+    try:
+      fp = os.fdopen(fd, 'wb')
+      try:
+        cPickle.dump((stamp, state), fp, cPickle.HIGHEST_PROTOCOL)
+      finally:
+        fp.close()
+      if os.name != 'posix' and os.path.exists(cache_path):
+        os.remove(cache_path)
+      os.rename(temp_path, cache_path)
+    except (IOError, OSError, cPickle.PicklingError):
+      try:
+        os.remove(temp_path)
+      except OSError:
+        pass
@@ -0,0 +1,159 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+
+"""rcsdelta.py: application of RCS deltatext edit scripts.
+
+RCS stores all but one revision of a file as an edit script of "dL N"
+(delete N lines starting at line L) and "aL N" (append the N lines
+that follow after line L) commands, with line numbers referring to
+the text the script is applied to.  Applying those scripts by
+inserting into and deleting from a list of lines shifts the list on
+every command, which is quadratic for long files with long histories.
+
+PieceText instead represents the text as a list of pieces -- slices
+of the line lists from which the text was built -- and applies each
+edit script in a single pass over that piece list, without touching
+the lines themselves.  The line list is only materialized on demand.
+"""
+
+import re
+
+
+_command = re.compile('^([ad])(\\d+)\\s(\\d+)')
+
+
+class PieceText:
+  """A text built by applying RCS edit scripts to an initial text."""
+
+  # Walking the piece list costs a little Python work per piece, while
+  # flattening it costs a (fast) copy of every line, so the pieces are
+  # collapsed into one whenever there get to be this many of them.
+  MAX_PIECES = 256
+
+  def __init__(self, lines):
+    """Initialize with the list of LINES (without line terminators) of
+    the starting text."""
+    # each piece is a (lines, start, end) tuple, meaning lines[start:end]
+    self.pieces = [(lines, 0, len(lines))]
+    self.length = len(lines)
+
+  def apply(self, deltatext, deleted=None, added=None):
+    """Apply the RCS edit script DELTATEXT.  Return a 2-tuple of the
+    number of lines added and deleted.
+
+    If DELETED is provided, it is called as DELETED(BUF, START, END)
+    for each piece BUF[START:END] of the old text that the script
+    deletes.  If ADDED is provided, it is called as ADDED(LINES) with
+    the lines added by each "a" command, and the list it returns is
+    inserted in place of those lines.  Together these allow the text
+    to be a list of arbitrary line tokens rather than line strings."""
+
+    delta = deltatext.split('\n')
+    old = self.pieces
+    new = [ ]
+    nadded = ndeleted = 0
+
+    # cursor into the old piece list: the current piece, and the number
+    # of lines of that piece already consumed
+    state = [0, 0]
+
+    def advance(count, keep, old=old, new=new, state=state, deleted=deleted):
+      pi, used = state
+      while count:
+        buf, start, end = old[pi]
+        avail = end - start - used
+        if avail <= 0:
+          pi = pi + 1
+          used = 0
+          continue
+        if avail > count:
+          avail = count
+        if keep:
+          append_piece(new, buf, start + used, start + used + avail)
+        elif deleted:
+          deleted(buf, start + used, start + used + avail)
+        used = used + avail
+        count = count - avail
+      state[0] = pi
+      state[1] = used
+
+    pos = 0   # number of lines of the old text consumed so far
+    idx = 0
+    ndelta = len(delta)
+    while idx < ndelta:
+      command = delta[idx]
+      idx = idx + 1
+      if not command:
+        continue
+      match = _command.match(command)
+      if not match:
+        raise RuntimeError, 'Error parsing diff commands'
+      line = int(match.group(2))
+      count = int(match.group(3))
+      if match.group(1) == 'd':
+        # "d" - Delete command
+        begin = line - 1
+        if begin < pos or begin + count > self.length:
+          raise RuntimeError, 'Error parsing diff commands'
+        advance(begin - pos, 1)
+        advance(count, 0)
+        pos = begin + count
+        ndeleted = ndeleted + count
+      else:
+        # "a" - Add command
+        if line < pos or line > self.length or idx + count > ndelta:
+          raise RuntimeError, 'Error parsing diff commands'
+        advance(line - pos, 1)
+        pos = line
+        if count:
+          if added:
+            lines = added(delta[idx:idx + count])
+            append_piece(new, lines, 0, len(lines))
+          else:
+            append_piece(new, delta, idx, idx + count)
+        idx = idx + count
+        nadded = nadded + count
+
+    # copy whatever remains of the old text
+    advance(self.length - pos, 1)
+
+    self.pieces = new
+    self.length = self.length + nadded - ndeleted
+    if len(new) > self.MAX_PIECES:
+      self.pieces = [(self.lines(), 0, self.length)]
+    return nadded, ndeleted
+
+  def lines(self):
+    """Return the current text as a list of lines."""
+    pieces = self.pieces
+    if len(pieces) == 1:
+      buf, start, end = pieces[0]
+      return buf[start:end]
+    lines = [ ]
+    for buf, start, end in pieces:
+      lines.extend(buf[start:end])
+    return lines
+
+  def text(self):
+    """Return the current text as a string."""
+    return '\n'.join(self.lines())
+
+
+def append_piece(pieces, buf, start, end):
+  """Append the piece BUF[START:END] to the list of PIECES, merging it
+  with the last piece if they are adjacent slices of the same list."""
+  if pieces:
+    last_buf, last_start, last_end = pieces[-1]
+    if last_buf is buf and last_end == start:
+      pieces[-1] = (buf, last_start, end)
+      return
+  pieces.append((buf, start, end))
@@ -29,7 +29,7 @@ except ImportError:
   try:
     from texttools import Parser
   except ImportError:
-    from default import Parser
+    from fast import Parser
 
   def parse(file, sink):
     """Parse an RCS file.
@@ -15,6 +15,11 @@
 import calendar
 import string
 
+# How much of an RCS file a sink needs to see; see Sink.parse_mode.
+PARSE_ALL = 0     # everything
+PARSE_LOGS = 1    # everything but the revision texts
+PARSE_TREE = 2    # only the admin section and the revision tree
+
 class Sink:
   """Interface to be implemented by clients.  The RCS parser calls this as
   it parses the RCS file.
@@ -22,6 +27,15 @@ class Sink:
   All these methods have stub implementations that do nothing, so you only
   have to override the callbacks that you care about.
   """
+
+  # Set this to PARSE_LOGS in sinks which never need the revision texts,
+  # so that set_revision_info() is called with a TEXT of None, and the
+  # parser skips over the texts as quickly as it can.  Set it to
+  # PARSE_TREE in sinks which need neither texts nor log messages, so
+  # that the parser stops after tree_completed(), calling only
+  # parse_completed() after that.
+  parse_mode = PARSE_ALL
+
   def set_head_revision(self, revision):
     """Reports the head revision for this RCS file.
 
@@ -212,6 +226,36 @@ class Sink:
     pass
 
 
+# --------------------------------------------------------------------------
+#
+# LAZY REVISION TEXTS
+#
+
+class RCSText(object):
+  """A string token which has been located in, but not yet copied out
+  of, the buffer holding an RCS file."""
+
+  __slots__ = ('buf', 'start', 'end', 'escaped')
+
+  def __init__(self, buf, start, end, escaped):
+    """The string is BUF[START:END], with each '@' doubled if ESCAPED
+    is true."""
+    self.buf = buf
+    self.start = start
+    self.end = end
+    self.escaped = escaped
+
+  def __len__(self):
+    "Return the length of the string, or an upper bound if escaped."
+    return self.end - self.start
+
+  def __str__(self):
+    text = self.buf[self.start:self.end]
+    if self.escaped:
+      text = text.replace('@@', '@')
+    return text
+
+
 # --------------------------------------------------------------------------
 #
 # EXCEPTIONS USED BY RCSPARSE
@@ -435,11 +479,23 @@ class _Parser:
     self.sink.set_description(self.ts.get())
 
   def parse_rcs_deltatext(self):
+    skip_text = self.sink.parse_mode == PARSE_LOGS
+    if skip_text:
+      # if the token stream can do so, get the texts as RCSText objects,
+      # which are cheaper to throw away than strings
+      get_text = getattr(self.ts, 'get_text', self.ts.get)
     while 1:
       revision = self.ts.get()
       if revision is None:
         # EOF
         break
+      if skip_text:
+        self.ts.match('log')
+        log = self.ts.get()
+        self.ts.match('text')
+        get_text()
+        self.sink.set_revision_info(revision, log, None)
+        continue
       text, sym2, log, sym1 = self.ts.mget(4)
       if sym1 != 'log':
         print `text[:100], sym2[:100], log[:100], sym1[:100]`
@@ -473,8 +529,9 @@ class _Parser:
     # do some work to prep for the arrival of the deltatext
     self.sink.tree_completed()
 
-    self.parse_rcs_description()
-    self.parse_rcs_deltatext()
+    if self.sink.parse_mode != PARSE_TREE:
+      self.parse_rcs_description()
+      self.parse_rcs_deltatext()
 
     # easiest for us to tell the sink it is done, rather than worry about
     # higher level software doing it.
@@ -101,6 +101,42 @@ def time_file(fname):
   t = time.time() - t
   print t
 
+def get_parsers():
+  """Return a list of (NAME, PARSE) tuples for each of the parser
+  backends available, where PARSE is a function like parse()."""
+  parsers = [ ]
+  try:
+    import tparse
+  except ImportError:
+    pass
+  else:
+    parsers.append(('tparse', tparse.parse))
+  for name in ('texttools', 'fast', 'default'):
+    try:
+      module = __import__(name)
+    except ImportError:
+      continue
+    def _parse(file, sink, parser_class=module.Parser):
+      return parser_class().parse(file, sink)
+    parsers.append((name, _parse))
+  return parsers
+
+def compare_file(fname, count=5):
+  """Parse FNAME COUNT times with each available parser backend,
+  printing the best time of each."""
+  for name, parse_func in get_parsers():
+    best = None
+    for i in range(count):
+      f = open(fname, 'rb')
+      s = common.Sink()
+      t = time.time()
+      parse_func(f, s)
+      t = time.time() - t
+      f.close()
+      if best is None or t < best:
+        best = t
+    print '%-10s %.6f' % (name, best)
+
 def _usage():
   print 'This is normally a module for importing, but it has a couple'
   print 'features for testing as an executable script.'
@@ -108,6 +144,8 @@ def _usage():
   print '  where COMMAND is one of:'
   print '    dump: filename is "dumped" to stdout'
   print '    time: filename is parsed with the time written to stdout'
+  print '    compare: filename is parsed by each available parser, with'
+  print '             the times written to stdout'
   sys.exit(1)
 
 if __name__ == '__main__':
@@ -118,5 +156,7 @@ if __name__ == '__main__':
     dump_file(sys.argv[2])
   elif sys.argv[1] == 'time':
     time_file(sys.argv[2])
+  elif sys.argv[1] == 'compare':
+    compare_file(sys.argv[2])
   else:
     _usage()
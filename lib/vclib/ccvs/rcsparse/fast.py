@@ -0,0 +1,188 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+
+"""fast.py: a pure-Python RCS tokenizer which splits whole buffers of
+input into tokens with a compiled regular expression and str.find(),
+rather than examining one character at a time.  For any well-formed
+RCS file it produces exactly the same tokens as the one in default.py.
+
+Where possible, the RCS file is memory mapped rather than read, and
+long strings are only copied out of the mapping when they are asked
+for.  The parser takes advantage of that to skip over the revision
+texts of sinks which don't need them."""
+
+import re
+import string
+
+try:
+  import mmap
+except ImportError:
+  mmap = None
+
+import common
+import default
+
+
+_ws = re.escape(string.whitespace)
+
+# Skip leading whitespace, then match one token: a single-character
+# token, an ordinary token (which, as in default.py, runs up to the
+# next whitespace, ';' or ':'), or the '@' which opens a string.
+# Strings are scanned separately, since str.find() locates their
+# closing '@' far faster than the regular expression engine could.
+_token_re = re.compile('[%s]*([;:]|[^%s;:@][^%s;:]*|@)' % (_ws, _ws, _ws))
+
+
+class _TokenStream(default._TokenStream):
+
+  # Strings at least this long are returned by get_text() as RCSText
+  # objects rather than copied out of the buffer.
+  LAZY_SIZE = 4096
+
+  def __init__(self, file):
+    self.tokens = [ ]   # tokens scanned but not yet returned, reversed
+    self.buf = _map_file(file)
+    if self.buf is None:
+      default._TokenStream.__init__(self, file)
+      self.eof = 0
+    else:
+      # the entire file is at hand, so there is never more to read
+      self.rcsfile = file
+      self.idx = file.tell()
+      self.eof = 1
+
+  def get(self):
+    "Get the next token from the RCS file."
+    while not self.tokens:
+      if not self._scan():
+        # signal EOF by returning None as the token
+        return None
+    token = self.tokens.pop()
+    if type(token) is common.RCSText:
+      return str(token)
+    return token
+
+  def get_text(self):
+    """Get the next token from the RCS file, like get(), except that a
+    long string may be returned as an RCSText object."""
+    while not self.tokens:
+      if not self._scan():
+        return None
+    return self.tokens.pop()
+
+  def _scan(self):
+    """Read more input and tokenize some of the buffered input.  Return
+    0 if there is no more input at all."""
+
+    buf = self.buf
+    pos = self.idx
+    if not self.eof:
+      buf = buf[pos:]
+      pos = 0
+      more = self.rcsfile.read(self.CHUNK_SIZE)
+      if more:
+        buf = buf + more
+      else:
+        self.eof = 1
+
+    tokens = [ ]
+    append = tokens.append
+    match = _token_re.match
+    find = buf.find
+    lbuf = len(buf)
+    # tokenize about a chunk's worth of input at a time, so that a
+    # mapped file is not all tokenized (and copied) at once
+    limit = pos + self.CHUNK_SIZE
+    lazy = self.LAZY_SIZE
+    while pos < limit:
+      m = match(buf, pos)
+      if not m:
+        # nothing but whitespace remains
+        pos = lbuf
+        break
+      token = m.group(1)
+      end = m.end()
+      if token == '@':
+        # find the closing '@', skipping over '@@' escapes
+        start = end
+        escaped = 0
+        while 1:
+          end = find('@', end)
+          if end < 0 or end + 1 == lbuf:
+            if end < 0:
+              end = lbuf
+            if not self.eof:
+              # the string continues beyond the buffer, so read more
+              # and keep looking.  Chunks are gathered until one might
+              # hold the closing '@', and are at least as large as what
+              # we already hold, so that a long string is not copied
+              # over and over again.
+              base = start - 1
+              chunks = [ buf[base:] ]
+              while not self.eof:
+                more = self.rcsfile.read(max(self.CHUNK_SIZE, lbuf - base))
+                if not more:
+                  self.eof = 1
+                  break
+                chunks.append(more)
+                if '@' in more:
+                  break
+              if len(chunks) > 1:
+                # drop the already tokenized input from the buffer
+                buf = string.join(chunks, '')
+                find = buf.find
+                lbuf = len(buf)
+                start = start - base
+                end = end - base
+                limit = lbuf
+                continue
+            if end == lbuf:
+              raise RuntimeError, 'EOF'
+            break
+          if buf[end + 1] != '@':
+            break
+          end = end + 2
+          escaped = 1
+        if end - start >= lazy:
+          token = common.RCSText(buf, start, end, escaped)
+        else:
+          token = buf[start:end]
+          if escaped:
+            token = token.replace('@@', '@')
+        end = end + 1
+      elif end == lbuf and not self.eof and token != ';' and token != ':':
+        # the token may continue beyond the buffer
+        pos = m.start(1)
+        break
+      append(token)
+      pos = end
+
+    self.buf = buf
+    self.idx = pos
+    tokens.reverse()
+    self.tokens = tokens
+    return tokens or not self.eof or pos < lbuf
+
+
+def _map_file(file):
+  """Return a read-only memory map of FILE, or None if it can't be
+  mapped (because it is not a real file, or is empty, say)."""
+  if mmap is None:
+    return None
+  try:
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+  except (AttributeError, EnvironmentError, ValueError, mmap.error):
+    return None
+
+
+class Parser(common._Parser):
+  stream_class = _TokenStream
@@ -32,6 +32,7 @@ sys.path.insert(0, script_dir)
 
 from __init__ import parse
 from parse_rcs_file import LoggingSink
+from debug import get_parsers
 
 
 test_dir = os.path.join(script_dir, 'test-data')
@@ -41,30 +42,31 @@ filelist.sort()
 
 all_tests_ok = 1
 
-for filename in filelist:
-    sys.stderr.write('%s: ' % (filename,))
-    f = StringIO()
-    try:
-        parse(open(filename, 'rb'), LoggingSink(f))
-    except Exception, e:
-        sys.stderr.write('Error parsing file: %s!\n' % (e,))
-        all_tests_ok = 0
-    else:
-        output = f.getvalue()
+for (parser_name, parse) in [('(selected)', parse)] + get_parsers():
+    for filename in filelist:
+        sys.stderr.write('%s %s: ' % (parser_name, filename,))
+        f = StringIO()
+        try:
+            parse(open(filename, 'rb'), LoggingSink(f))
+        except Exception, e:
+            sys.stderr.write('Error parsing file: %s!\n' % (e,))
+            all_tests_ok = 0
+        else:
+            output = f.getvalue()
 
-        expected_output_filename = filename[:-2] + '.out'
-        expected_output = open(expected_output_filename, 'rb').read()
+            expected_output_filename = filename[:-2] + '.out'
+            expected_output = open(expected_output_filename, 'rb').read()
 
-        if output == expected_output:
-            sys.stderr.write('OK\n')
-        else:
-            sys.stderr.write('Output does not match expected output!\n')
-            differ = Differ()
-            for diffline in differ.compare(
-                expected_output.splitlines(1), output.splitlines(1)
-                ):
-                sys.stderr.write(diffline)
-            all_tests_ok = 0
+            if output == expected_output:
+                sys.stderr.write('OK\n')
+            else:
+                sys.stderr.write('Output does not match expected output!\n')
+                differ = Differ()
+                for diffline in differ.compare(
+                    expected_output.splitlines(1), output.splitlines(1)
+                    ):
+                    sys.stderr.write(diffline)
+                all_tests_ok = 0
 
 if all_tests_ok:
     sys.exit(0)
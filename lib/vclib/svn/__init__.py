@@ -91,13 +91,16 @@ def find_root_in_parent(parent_path, rootname):
   return None
 
 
-def SubversionRepository(name, rootpath, authorizer, utilities, config_dir):
+def SubversionRepository(name, rootpath, authorizer, utilities, config_dir,
+                         revinfo_cache_dir=None):
   rootpath = canonicalize_rootpath(rootpath)
   if re.search(_re_url, rootpath):
     import svn_ra
     return svn_ra.RemoteSubversionRepository(name, rootpath, authorizer,
-                                             utilities, config_dir)
+                                             utilities, config_dir,
+                                             revinfo_cache_dir)
   else:
     import svn_repos
     return svn_repos.LocalSubversionRepository(name, rootpath, authorizer,
-                                               utilities, config_dir)
+                                               utilities, config_dir,
+                                               revinfo_cache_dir)
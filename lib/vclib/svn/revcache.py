@@ -0,0 +1,197 @@
+# -*-python-*-
+#
+# Copyright (C) 1999-2013 The ViewCVS Group. All Rights Reserved.
+#
+# By using this file, you agree to the terms and conditions set forth in
+# the LICENSE.html file which can be found at the top level of the ViewVC
+# distribution or at http://viewvc.org/license-1.html.
+#
+# For more information, visit http://viewvc.org/
+#
+# -----------------------------------------------------------------------
+
+"""revcache.py: persistent on-disk cache of Subversion revision info.
+
+Fetching a revision's properties and changed paths costs a log (or
+replay) operation against the repository, and directory listings and
+logs need that information for many revisions at once.  Apart from
+revision properties, which may be changed by a pre-revprop-change hook,
+that information never changes, so it can be shared by all ViewVC
+processes and requests.
+
+Entries are keyed by repository UUID and revision number, and hold the
+raw revision properties and changed paths -- before any authorization
+filtering, which callers must still apply per request.  Each entry is
+kept in its own file, CACHE_DIR/UUID/REV, so that stale entries may be
+removed (by the post-revprop-change hook, say) without locking.
+
+A process which read a revision's properties just before they were
+changed could write them to the cache after the hook removed the old
+entry, though.  So the hook also replaces the revision's generation, a
+random token kept in CACHE_DIR/UUID/REV.generation, and each entry
+records the generation read before its information was fetched.
+Entries of any other generation are ignored.  When all of a
+repository's entries are removed, the repository's own generation,
+kept in CACHE_DIR/UUID/.generation and recorded in each entry too, is
+replaced instead.
+"""
+
+import os
+import re
+import binascii
+import tempfile
+import cPickle
+
+
+# Bump this whenever the layout of cache entries changes, so that
+# stale cache files are ignored rather than misinterpreted.
+_CACHE_FORMAT = 3
+
+_GENERATION_FILE = '.generation'
+_REV_GENERATION_SUFFIX = '.generation'
+
+_re_uuid = re.compile('^[0-9A-Za-z-]+$')
+
+
+class RevInfoCache:
+  """On-disk cache of raw Subversion revision information.
+
+  Cache files are replaced atomically, so concurrent ViewVC processes
+  may share a single cache directory.  Problems reading or writing the
+  cache are never fatal; they simply cause the information to be
+  fetched from the repository again."""
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self._generations = { }      # uuid -> generation, as first read
+    self._rev_generations = { }  # (uuid, rev) -> generation, as last read
+
+  def get(self, uuid, rev):
+    """Return a 2-tuple of the revision properties (a dictionary) and
+    the changes (a list of tuples, or None if those weren't recorded)
+    cached for revision REV of the repository with UUID UUID, or None
+    if nothing is cached."""
+    cache_path = self._cache_path(uuid, rev)
+    if cache_path is None:
+      return None
+    generations = (self._get_generation(uuid),
+                   get_generation(cache_path + _REV_GENERATION_SUFFIX))
+    self._rev_generations[(uuid, rev)] = generations[1]
+    try:
+      fp = open(cache_path, 'rb')
+    except IOError:
+      return None
+    try:
+      try:
+        format, entry_generations, revprops, changes = cPickle.load(fp)
+      except Exception:
+        return None
+    finally:
+      fp.close()
+    if format != _CACHE_FORMAT or entry_generations != generations:
+      return None
+    return revprops, changes
+
+  def put(self, uuid, rev, revprops, changes):
+    """Cache the revision properties REVPROPS and the CHANGES (or None)
+    of revision REV of the repository with UUID UUID.  The entry is of
+    the repository's generation as it was when this object first looked
+    at it, and of the revision's generation as get() last read it, so
+    callers must try get() before fetching the information they put()."""
+    cache_path = self._cache_path(uuid, rev)
+    rev_generation = self._rev_generations.get((uuid, rev))
+    if cache_path is None or rev_generation is None:
+      return
+    generations = (self._get_generation(uuid), rev_generation)
+    cache_dir = os.path.dirname(cache_path)
+    try:
+      if not os.path.isdir(cache_dir):
+        os.mkdir(cache_dir)
+      fd, temp_path = tempfile.mkstemp('.tmp', '', cache_dir)
+    except (IOError, OSError):
+      return
+    try:
+      fp = os.fdopen(fd, 'wb')
+      try:
+        cPickle.dump((_CACHE_FORMAT, generations, revprops, changes), fp,
+                     cPickle.HIGHEST_PROTOCOL)
+      finally:
+        fp.close()
+      if os.name != 'posix' and os.path.exists(cache_path):
+        os.remove(cache_path)
+      os.rename(temp_path, cache_path)
+    except (IOError, OSError, cPickle.PicklingError):
+      try:
+        os.remove(temp_path)
+      except OSError:
+        pass
+
+  def remove(self, uuid, rev=None):
+    """Remove the entry for revision REV of the repository with UUID
+    UUID from the cache, or all of that repository's entries if REV is
+    None.  The revision (or, if REV is None, the repository) gets a new
+    generation first, so that entries written by processes which
+    fetched the information before now are ignored."""
+    cache_path = self._cache_path(uuid, 0)
+    if cache_path is None:
+      return
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.isdir(cache_dir):
+      os.mkdir(cache_dir)
+    if rev is not None:
+      cache_path = self._cache_path(uuid, rev)
+      new_generation(cache_path + _REV_GENERATION_SUFFIX)
+      if os.path.exists(cache_path):
+        os.remove(cache_path)
+      return
+    new_generation(os.path.join(cache_dir, _GENERATION_FILE))
+    for name in os.listdir(cache_dir):
+      if name != _GENERATION_FILE:
+        os.remove(os.path.join(cache_dir, name))
+
+  def _get_generation(self, uuid):
+    generation = self._generations.get(uuid)
+    if generation is None:
+      generation = get_generation(os.path.join(self.cache_dir, uuid,
+                                               _GENERATION_FILE))
+      self._generations[uuid] = generation
+    return generation
+
+  def _cache_path(self, uuid, rev):
+    if not (uuid and _re_uuid.match(uuid)):
+      return None
+    return os.path.join(self.cache_dir, uuid, str(int(rev)))
+
+
+def get_generation(path):
+  """Return the generation stored in the file at PATH, or '' if there
+  is no such file."""
+  try:
+    fp = open(path, 'rb')
+  except IOError:
+    return ''
+  try:
+    return fp.read()
+  finally:
+    fp.close()
+
+
+def new_generation(path):
+  """Replace the generation stored in the file at PATH with a new one,
+  and return it.  Generations are random, rather than counted, so that
+  two processes replacing one at once can't both pick the same one."""
+  generation = binascii.hexlify(os.urandom(8))
+  fd, temp_path = tempfile.mkstemp('.tmp', '', os.path.dirname(path))
+  try:
+    fp = os.fdopen(fd, 'wb')
+    try:
+      fp.write(generation)
+    finally:
+      fp.close()
+    if os.name != 'posix' and os.path.exists(path):
+      os.remove(path)
+    os.rename(temp_path, path)
+  except:
+    os.remove(temp_path)
+    raise
+  return generation
@@ -19,10 +19,11 @@ import re
 import tempfile
 import time
 import urllib
-from svn_repos import Revision, SVNChangedPath, _datestr_to_date, \
+from svn_repos import Revision, _datestr_to_date, \
                       _compare_paths, _path_parts, _cleanup_path, \
                       _rev2optrev, _fix_subversion_exception, \
-                      _split_revprops, _canonicalize_path
+                      _split_revprops, _canonicalize_path, \
+                      _filter_changes, _get_revinfo_cache
 from svn import core, delta, client, wc, ra
 
 
@@ -213,12 +214,14 @@ class SelfCleanFP:
 
 
 class RemoteSubversionRepository(vclib.Repository):
-  def __init__(self, name, rootpath, authorizer, utilities, config_dir):
+  def __init__(self, name, rootpath, authorizer, utilities, config_dir,
+               revinfo_cache_dir=None):
     self.name = name
     self.rootpath = rootpath
     self.auth = authorizer
     self.diff_cmd = utilities.diff or 'diff'
     self.config_dir = config_dir or None
+    self.revinfo_cache = _get_revinfo_cache(revinfo_cache_dir)
 
     # See if this repository is even viewable, authz-wise.
     if not vclib.check_root_access(self):
@@ -235,6 +238,7 @@ class RemoteSubversionRepository(vclib.Repository):
     self.youngest = ra.svn_ra_get_latest_revnum(self.ra_session)
     self._dirent_cache = { }
     self._revinfo_cache = { }
+    self._uuid = None
 
     # See if a universal read access determination can be made.
     if self.auth and self.auth.check_universal_access(self.name) == 1:
@@ -523,17 +527,26 @@ class RemoteSubversionRepository(vclib.Repository):
     if not dirents_locks:
       tmp_dirents, locks = list_directory(dir_url, _rev2optrev(rev),
                                           _rev2optrev(rev), 0, self.ctx)
-      dirents = {}
+      names = []
+      kinds = []
       for name, dirent in tmp_dirents.items():
-        dirent_parts = path_parts + [name]
-        kind = dirent.kind 
-        if (kind == core.svn_node_dir or kind == core.svn_node_file) \
-           and vclib.check_path_access(self, dirent_parts,
-                                       kind == core.svn_node_dir \
-                                         and vclib.DIR or vclib.FILE, rev):
-          lh_rev, c_rev = self._get_last_history_rev(dirent_parts, rev)
-          dirent.created_rev = lh_rev
-          dirents[name] = dirent
+        kind = dirent.kind
+        if kind == core.svn_node_dir:
+          names.append(name)
+          kinds.append(vclib.DIR)
+        elif kind == core.svn_node_file:
+          names.append(name)
+          kinds.append(vclib.FILE)
+      readable = vclib.check_paths_access(self, path_parts, names, kinds, rev)
+      dirents = {}
+      for i in range(len(names)):
+        if not readable[i]:
+          continue
+        name = names[i]
+        dirent = tmp_dirents[name]
+        lh_rev, c_rev = self._get_last_history_rev(path_parts + [name], rev)
+        dirent.created_rev = lh_rev
+        dirents[name] = dirent
       dirents_locks = [dirents, locks]
       self._dirent_cache[key] = dirents_locks
 
@@ -572,6 +585,9 @@ class RemoteSubversionRepository(vclib.Repository):
       return last_changed_rev, last_changed_rev
     
   def _revinfo_fetch(self, rev, include_changed_paths=0):
+    """Return a 2-tuple of the unfiltered revision properties and
+    changes of revision REV.  The changes are a list of tuples suitable
+    for _filter_changes(), or None if they weren't needed."""
     need_changes = include_changed_paths or self.auth
     revs = []
     
@@ -582,7 +598,7 @@ class RemoteSubversionRepository(vclib.Repository):
         return
       
       revision = log_entry.revision
-      msg, author, date, revprops = _split_revprops(log_entry.revprops)
+      revprops = log_entry.revprops
       action_map = { 'D' : vclib.DELETED,
                      'A' : vclib.ADDED,
                      'R' : vclib.REPLACED,
@@ -592,7 +608,7 @@ class RemoteSubversionRepository(vclib.Repository):
       # Easy out: if we won't use the changed-path info, just return a
       # changes-less tuple.
       if not need_changes:
-        return revs.append([date, author, msg, revprops, None])
+        return revs.append((revprops, None))
 
       # Subversion 1.5 and earlier didn't offer the 'changed_paths2'
       # hash, and in Subversion 1.6, it's offered but broken.
@@ -607,7 +623,6 @@ class RemoteSubversionRepository(vclib.Repository):
       # If we get this far, our caller needs changed-paths, or we need
       # them for authz-related sanitization.
       changes = []
-      found_readable = found_unreadable = 0
       for path in paths:
         change = changed_paths[path]
 
@@ -647,48 +662,48 @@ class RemoteSubversionRepository(vclib.Repository):
           is_copy = 0
           base_path = path
           base_rev = revision - 1
-
-        # Check authz rules (sadly, we have to lie about the path type)
-        parts = _path_parts(path)
-        if vclib.check_path_access(self, parts, vclib.FILE, revision):
-          if is_copy and base_path and (base_path != path):
-            parts = _path_parts(base_path)
-            if not vclib.check_path_access(self, parts, vclib.FILE, base_rev):
-              is_copy = 0
-              base_path = None
-              base_rev = None
-              found_unreadable = 1
-          changes.append(SVNChangedPath(path, revision, pathtype, base_path,
-                                        base_rev, action, is_copy,
-                                        text_modified, props_modified))
-          found_readable = 1
-        else:
-          found_unreadable = 1
-
-        # If our caller doesn't want changed-path stuff, and we have
-        # the info we need to make an authz determination already,
-        # quit this loop and get on with it.
-        if (not include_changed_paths) and found_unreadable and found_readable:
-          break
-
-      # Filter unreadable information.
-      if found_unreadable:
-        msg = None
-        if not found_readable:
-          author = None
-          date = None
-
-      # Drop unrequested changes.
-      if not include_changed_paths:
-        changes = None
+        changes.append((path, pathtype, base_path, base_rev, action,
+                        is_copy, text_modified, props_modified))
 
       # Add this revision information to the "return" array.
-      retval.append([date, author, msg, revprops, changes])
+      retval.append((revprops, changes))
 
     optrev = _rev2optrev(rev)
     client_log(self.rootpath, optrev, optrev, 1, need_changes, 0,
                _log_cb, self.ctx)
-    return tuple(revs[0])
+    return revs[0]
+
+  def _revinfo_helper(self, rev, include_changed_paths=0):
+    # Get the raw revision info from the persistent cache, if there is
+    # one, or else from the repository.
+    cached = None
+    if self.revinfo_cache:
+      uuid = self._get_uuid()
+      cached = self.revinfo_cache.get(uuid, rev)
+    if cached and (cached[1] is not None or not
+                   (include_changed_paths or self.auth)):
+      raw_revprops, raw_changes = cached
+    else:
+      raw_revprops, raw_changes = \
+        self._revinfo_fetch(rev, include_changed_paths)
+      if self.revinfo_cache:
+        self.revinfo_cache.put(uuid, rev, raw_revprops, raw_changes)
+    msg, author, date, revprops = \
+      _split_revprops(raw_revprops and raw_revprops.copy())
+    if raw_changes is None:
+      return date, author, msg, revprops, None
+
+    # Check authz rules (sadly, we have to lie about the path type),
+    # and filter unreadable information.
+    found_readable, found_unreadable, changes = \
+      _filter_changes(self, rev, raw_changes, include_changed_paths,
+                      vclib.FILE)
+    if found_unreadable:
+      msg = None
+      if not found_readable:
+        author = None
+        date = None
+    return date, author, msg, revprops, changes
 
   def _revinfo(self, rev, include_changed_paths=0):
     """Internal-use, cache-friendly revision information harvester."""
@@ -700,14 +715,25 @@ class RemoteSubversionRepository(vclib.Repository):
     cached_info = self._revinfo_cache.get(rev)
     if not cached_info \
        or (include_changed_paths and cached_info[4] is None):
-      cached_info = self._revinfo_fetch(rev, include_changed_paths)
+      cached_info = self._revinfo_helper(rev, include_changed_paths)
       self._revinfo_cache[rev] = cached_info
     return cached_info
 
+  def _get_uuid(self):
+    if self._uuid is None:
+      try:
+        self._uuid = ra.get_uuid2(self.ra_session)
+      except AttributeError:
+        self._uuid = ra.svn_ra_get_uuid(self.ra_session)
+    return self._uuid
+
   ##--- custom --##
 
   def get_youngest_revision(self):
     return self.youngest
+
+  def get_uuid(self):
+    return self._get_uuid()
   
   def get_location(self, path, rev, old_rev):
     try:
@@ -21,6 +21,8 @@ import tempfile
 import popen
 import re
 import urllib
+import thread
+import threading
 from svn import fs, repos, core, client, delta
 
 
@@ -220,6 +222,22 @@ def _get_last_history_rev(fsroot, path):
   history = fs.history_prev(history, 0)
   history_path, history_rev = fs.history_location(history)
   return history_rev
+
+def _get_created_rev(fsroot, path):
+  """Return the same revision as _get_last_history_rev(), but without
+  walking PATH's history: that is the revision in which PATH's node was
+  last changed, unless a later copy (of PATH or one of its parents) put
+  it where it is."""
+  try:
+    copy_root, copy_path = fs.closest_copy(fsroot, path)
+  except AttributeError:
+    return _get_last_history_rev(fsroot, path)
+  created_rev = fs.node_created_rev(fsroot, path)
+  if copy_root:
+    copy_rev = fs.revision_root_revision(copy_root)
+    if copy_rev > created_rev:
+      return copy_rev
+  return created_rev
   
 def temp_checkout(svnrepos, path, rev):
   """Check out file revision to temporary file"""
@@ -345,9 +363,166 @@ class SVNChangedPath(vclib.ChangedPath):
                                base_path_parts, base_rev, action,
                                copied, text_changed, props_changed)
 
-  
+
+# Given the raw CHANGES of revision REV of the repository REPOS -- a
+# list of (path, pathtype, base_path, base_rev, action, is_copy,
+# text_changed, props_changed) tuples -- check authorization for each
+# change and return a 3-tuple: found_readable, found_unreadable, and a
+# list of SVNChangedPath objects for the readable changes.  If
+# CHECK_PATHTYPE is set, it is the path type used for authz checks in
+# place of each change's own.  If WANT_PATHS is false, stop as soon as
+# both readable and unreadable changes have been found, and return
+# None in place of the list.
+def _filter_changes(repos, rev, changes, want_paths=1, check_pathtype=None):
+  # Check all the changed paths at once, then all the readable ones'
+  # copy sources.
+  checks = []
+  for change in changes:
+    checks.append((_path_parts(change[0]), check_pathtype or change[1], rev))
+  readable = vclib.check_path_list_access(repos, checks)
+  base_checks = []
+  for i in range(len(changes)):
+    path, pathtype, base_path, base_rev, action, is_copy = changes[i][:6]
+    if readable[i] and is_copy and base_path and (base_path != path):
+      base_checks.append((_path_parts(base_path), checks[i][1], base_rev))
+  base_readable = vclib.check_path_list_access(repos, base_checks)
+  base_readable.reverse()
+
+  changedpaths = []
+  found_readable = found_unreadable = 0
+  for i in range(len(changes)):
+    path, pathtype, base_path, base_rev, action, is_copy, \
+      text_changed, props_changed = changes[i]
+    if readable[i]:
+      if is_copy and base_path and (base_path != path):
+        if not base_readable.pop():
+          is_copy = 0
+          base_path = None
+          base_rev = None
+          found_unreadable = 1
+      if want_paths:
+        changedpaths.append(SVNChangedPath(path, rev, pathtype, base_path,
+                                           base_rev, action, is_copy,
+                                           text_changed, props_changed))
+      found_readable = 1
+    else:
+      found_unreadable = 1
+    if (not want_paths) and found_readable and found_unreadable:
+      break
+  if not want_paths:
+    changedpaths = None
+  return found_readable, found_unreadable, changedpaths
+
+
+def _get_revinfo_cache(cache_dir):
+  """Return a revcache.RevInfoCache for CACHE_DIR, or None if
+  CACHE_DIR is unset."""
+  if not cache_dir:
+    return None
+  import revcache
+  return revcache.RevInfoCache(cache_dir)
+
+
+# Opening a repository and its revision roots is expensive, so opened
+# repositories are kept for reuse by later requests served by the same
+# process.  Each thread gets its own, as the Subversion objects
+# involved may not be used by more than one thread at a time.
+_OPEN_REPOS_MAX = 16     # opened repositories kept per process
+_OPEN_ROOTS_MAX = 32     # revision roots kept per opened repository
+
+_open_repos = {}         # (thread id, rootpath) -> _OpenRepos
+_open_repos_lru = []     # keys of _open_repos, least recently used first
+_open_repos_lock = threading.Lock()
+
+class _OpenRepos:
+  """An opened repository, along with some of its revision roots."""
+
+  def __init__(self, rootpath):
+    self.rootpath = rootpath
+    self.stamp = _get_repos_stamp(rootpath)
+    self.repos = repos.svn_repos_open(rootpath)
+    self.fs_ptr = repos.svn_repos_fs(self.repos)
+    self.youngest = fs.youngest_rev(self.fs_ptr)
+    self.uuid = None     # fetched on demand, by getuuid()
+    self.roots = {}      # rev -> revision root
+    self.roots_lru = []  # keys of roots, least recently used first
+
+  def refresh(self):
+    """Bring the youngest revision up to date.  Return false if the
+    repository has been replaced (and so must be opened again)."""
+    # A replaced repository (one reloaded from a dump, say) may well
+    # have as many revisions as the old one, and its UUID is cached
+    # by the open filesystem, so look for a new db directory or format
+    # file too.
+    stamp = _get_repos_stamp(self.rootpath)
+    if stamp is None or stamp != self.stamp:
+      return 0
+    try:
+      youngest = fs.youngest_rev(self.fs_ptr)
+    except core.SubversionException:
+      return 0
+    if youngest < self.youngest:
+      return 0
+    # revision roots never change, so those already open remain valid
+    self.youngest = youngest
+    return 1
+
+  def getroot(self, rev):
+    root = self.roots.get(rev)
+    if root is None:
+      root = self.roots[rev] = fs.revision_root(self.fs_ptr, rev)
+      if len(self.roots_lru) >= _OPEN_ROOTS_MAX:
+        del self.roots[self.roots_lru.pop(0)]
+    else:
+      self.roots_lru.remove(rev)
+    self.roots_lru.append(rev)
+    return root
+
+  def getuuid(self):
+    if self.uuid is None:
+      self.uuid = fs.get_uuid(self.fs_ptr)
+    return self.uuid
+
+def _get_repos_stamp(rootpath):
+  """Return a value which changes when the repository at ROOTPATH is
+  replaced, or None if it can't be determined."""
+  try:
+    db_st = os.stat(os.path.join(rootpath, 'db'))
+    format_st = os.stat(os.path.join(rootpath, 'db', 'format'))
+  except OSError:
+    return None
+  return (db_st.st_dev, db_st.st_ino, format_st.st_ino, format_st.st_mtime)
+
+def _get_open_repos(rootpath):
+  """Return an _OpenRepos for the repository at ROOTPATH, reusing one
+  opened by an earlier request where possible."""
+  key = (thread.get_ident(), rootpath)
+  _open_repos_lock.acquire()
+  try:
+    opened = _open_repos.get(key)
+    if opened:
+      del _open_repos[key]
+      _open_repos_lru.remove(key)
+  finally:
+    _open_repos_lock.release()
+
+  if not (opened and opened.refresh()):
+    opened = _OpenRepos(rootpath)
+
+  _open_repos_lock.acquire()
+  try:
+    _open_repos[key] = opened
+    _open_repos_lru.append(key)
+    while len(_open_repos_lru) > _OPEN_REPOS_MAX:
+      del _open_repos[_open_repos_lru.pop(0)]
+  finally:
+    _open_repos_lock.release()
+  return opened
+
+
 class LocalSubversionRepository(vclib.Repository):
-  def __init__(self, name, rootpath, authorizer, utilities, config_dir):
+  def __init__(self, name, rootpath, authorizer, utilities, config_dir,
+               revinfo_cache_dir=None):
     if not (os.path.isdir(rootpath) \
             and os.path.isfile(os.path.join(rootpath, 'format'))):
       raise vclib.ReposNotFound(name)
@@ -358,17 +533,19 @@ class LocalSubversionRepository(vclib.Repository):
     self.auth = authorizer
     self.diff_cmd = utilities.diff or 'diff'
     self.config_dir = config_dir or None
+    self.revinfo_cache = _get_revinfo_cache(revinfo_cache_dir)
 
     # See if this repository is even viewable, authz-wise.
     if not vclib.check_root_access(self):
       raise vclib.ReposNotFound(name)
 
   def open(self):
-    # Open the repository and init some other variables.
-    self.repos = repos.svn_repos_open(self.rootpath)
-    self.fs_ptr = repos.svn_repos_fs(self.repos)
-    self.youngest = fs.youngest_rev(self.fs_ptr)
-    self._fsroots = {}
+    # Open the repository (or reuse an already opened one) and init
+    # some other variables.
+    self._opened = _get_open_repos(self.rootpath)
+    self.repos = self._opened.repos
+    self.fs_ptr = self._opened.fs_ptr
+    self.youngest = self._opened.youngest
     self._revinfo_cache = {}
 
     # See if a universal read access determination can be made.
@@ -414,36 +591,59 @@ class LocalSubversionRepository(vclib.Repository):
     rev = self._getrev(rev)
     fsroot = self._getroot(rev)
     dirents = fs.dir_entries(fsroot, path)
-    entries = [ ]
+    names = [ ]
+    kinds = [ ]
     for entry in dirents.values():
       if entry.kind == core.svn_node_dir:
         kind = vclib.DIR
       elif entry.kind == core.svn_node_file:
         kind = vclib.FILE
-      if vclib.check_path_access(self, path_parts + [entry.name], kind, rev):
-        entries.append(vclib.DirEntry(entry.name, kind))
+      names.append(entry.name)
+      kinds.append(kind)
+    readable = vclib.check_paths_access(self, path_parts, names, kinds, rev)
+    entries = [ ]
+    for i in range(len(names)):
+      if readable[i]:
+        entries.append(vclib.DirEntry(names[i], kinds[i]))
     return entries
 
   def dirlogs(self, path_parts, rev, entries, options):
     path = self._getpath(path_parts)
     if self.itemtype(path_parts, rev) != vclib.DIR:  # does auth-check
       raise vclib.Error("Path '%s' is not a directory." % path)
-    fsroot = self._getroot(self._getrev(rev))
     rev = self._getrev(rev)
-    for entry in entries:
-      entry_path_parts = path_parts + [entry.name]
-      if not vclib.check_path_access(self, entry_path_parts, entry.kind, rev):
+    fsroot = self._getroot(rev)
+    locks = self._get_locks(path)
+
+    # Find the last-changed revision of each readable entry first, so
+    # that the information for each distinct revision is fetched once.
+    readable = []
+    access = vclib.check_paths_access(self, path_parts,
+                                      map(lambda x: x.name, entries),
+                                      map(lambda x: x.kind, entries), rev)
+    for i in range(len(entries)):
+      if not access[i]:
         continue
-      path = self._getpath(entry_path_parts)
-      entry_rev = _get_last_history_rev(fsroot, path)
-      date, author, msg, revprops, changes = self._revinfo(entry_rev)
+      entry = entries[i]
+      entry_path = self._getpath(path_parts + [entry.name])
+      readable.append((entry, entry_path, _get_created_rev(fsroot, entry_path)))
+    revinfos = {}
+    for entry, entry_path, entry_rev in readable:
+      if not revinfos.has_key(entry_rev):
+        revinfos[entry_rev] = self._revinfo(entry_rev)
+
+    for entry, entry_path, entry_rev in readable:
+      date, author, msg, revprops, changes = revinfos[entry_rev]
       entry.rev = str(entry_rev)
       entry.date = date
       entry.author = author
       entry.log = msg
       if entry.kind == vclib.FILE:
-        entry.size = fs.file_length(fsroot, path)
-      lock = fs.get_lock(self.fs_ptr, path)
+        entry.size = fs.file_length(fsroot, entry_path)
+      if locks is None:
+        lock = fs.get_lock(self.fs_ptr, entry_path)
+      else:
+        lock = locks.get(entry_path)
       entry.lockinfo = lock and lock.owner or None
 
   def itemlog(self, path_parts, rev, sortby, first, limit, options):
@@ -580,17 +780,18 @@ class LocalSubversionRepository(vclib.Repository):
   def _revinfo(self, rev, include_changed_paths=0):
     """Internal-use, cache-friendly revision information harvester."""
 
-    def _get_changed_paths(fsroot):
-      """Return a 3-tuple: found_readable, found_unreadable, changed_paths."""
+    def _get_raw_changes(fsroot):
+      """Return the unfiltered changes made in FSROOT, as a list of
+      tuples suitable for _filter_changes()."""
       editor = repos.ChangeCollector(self.fs_ptr, fsroot)
       e_ptr, e_baton = delta.make_editor(editor)
       repos.svn_repos_replay(fsroot, e_ptr, e_baton)
-      changedpaths = {}
       changes = editor.get_changes()
+      actions = {}
+      raw_changes = []
     
-      # Copy the Subversion changes into a new hash, checking
-      # authorization and converting them into ChangedPath objects.
-      found_readable = found_unreadable = 0
+      # Convert the Subversion changes into plain tuples, which may be
+      # cached and are checked for authorization later.
       for path in changes.keys():
         change = changes[path]
         if change.path:
@@ -607,8 +808,7 @@ class LocalSubversionRepository(vclib.Repository):
             replace_check_path = path
             if change.base_path and change.base_rev:
               replace_check_path = change.base_path
-            if changedpaths.has_key(replace_check_path) \
-               and changedpaths[replace_check_path].action == vclib.DELETED:
+            if actions.get(replace_check_path) == vclib.DELETED:
               action = vclib.REPLACED
         else:
           if change.action == repos.CHANGE_ACTION_ADD:
@@ -619,6 +819,7 @@ class LocalSubversionRepository(vclib.Repository):
             action = vclib.REPLACED
           else:
             action = vclib.MODIFIED
+        actions[path] = action
         if (action == vclib.ADDED or action == vclib.REPLACED) \
            and change.base_path \
            and change.base_rev:
@@ -629,26 +830,10 @@ class LocalSubversionRepository(vclib.Repository):
           pathtype = vclib.FILE
         else:
           pathtype = None
-  
-        parts = _path_parts(path)
-        if vclib.check_path_access(self, parts, pathtype, rev):
-          if is_copy and change.base_path and (change.base_path != path):
-            parts = _path_parts(change.base_path)
-            if not vclib.check_path_access(self, parts, pathtype,
-                                           change.base_rev):
-              is_copy = 0
-              change.base_path = None
-              change.base_rev = None
-              found_unreadable = 1
-          changedpaths[path] = SVNChangedPath(path, rev, pathtype,
-                                              change.base_path,
-                                              change.base_rev, action,
-                                              is_copy, change.text_changed,
-                                              change.prop_changes)
-          found_readable = 1
-        else:
-          found_unreadable = 1
-      return found_readable, found_unreadable, changedpaths.values()
+        raw_changes.append((path, pathtype, change.base_path,
+                            change.base_rev, action, is_copy,
+                            change.text_changed, change.prop_changes))
+      return raw_changes
 
     def _get_change_copyinfo(fsroot, path, change):
       # If we know the copyfrom info, return it...
@@ -726,15 +911,28 @@ class LocalSubversionRepository(vclib.Repository):
       return found_readable, found_unreadable
       
     def _revinfo_helper(rev, include_changed_paths):
-      # Get the revision property info.  (Would use
-      # editor.get_root_props(), but something is broken there...)
-      revprops = fs.revision_proplist(self.fs_ptr, rev)
-      msg, author, date, revprops = _split_revprops(revprops)
+      # Get the revision property info (and, if we're lucky, the
+      # changed paths) from the persistent cache, if there is one, or
+      # else from the repository.  (Would use editor.get_root_props()
+      # for the latter, but something is broken there...)
+      cached = None
+      if self.revinfo_cache:
+        uuid = self._opened.getuuid()
+        cached = self.revinfo_cache.get(uuid, rev)
+      if cached:
+        raw_revprops, raw_changes = cached
+      else:
+        raw_revprops = fs.revision_proplist(self.fs_ptr, rev)
+        raw_changes = None
+      msg, author, date, revprops = \
+        _split_revprops(raw_revprops and raw_revprops.copy())
   
       # Optimization: If our caller doesn't care about the changed
       # paths, and we don't need them to do authz determinations, let's
       # get outta here.
       if self.auth is None and not include_changed_paths:
+        if self.revinfo_cache and not cached:
+          self.revinfo_cache.put(uuid, rev, raw_revprops, None)
         return date, author, msg, revprops, None
   
       # If we get here, then we either need the changed paths because we
@@ -742,14 +940,20 @@ class LocalSubversionRepository(vclib.Repository):
       #
       # If we only need them for authorization checks, though, we
       # won't bother generating fully populated ChangedPath items (the
-      # cost is too great).
-      fsroot = self._getroot(rev)
-      if include_changed_paths:
+      # cost is too great) unless they're cached already.
+      if include_changed_paths and raw_changes is None:
+        raw_changes = _get_raw_changes(self._getroot(rev))
+        if self.revinfo_cache:
+          self.revinfo_cache.put(uuid, rev, raw_revprops, raw_changes)
+      elif self.revinfo_cache and not cached:
+        self.revinfo_cache.put(uuid, rev, raw_revprops, None)
+      if raw_changes is not None:
         found_readable, found_unreadable, changedpaths = \
-          _get_changed_paths(fsroot)
+          _filter_changes(self, rev, raw_changes, include_changed_paths)
       else:
         changedpaths = None
-        found_readable, found_unreadable = _simple_auth_check(fsroot)
+        found_readable, found_unreadable = \
+          _simple_auth_check(self._getroot(rev))
         
       # Filter our metadata where necessary, and return the requested data.
       if found_unreadable:
@@ -771,7 +975,7 @@ class LocalSubversionRepository(vclib.Repository):
     return tuple(cached_info)
   
   def _log_helper(self, path, rev, lockinfo):
-    rev_root = fs.revision_root(self.fs_ptr, rev)
+    rev_root = self._getroot(rev)
     copyfrom_rev, copyfrom_path = fs.copied_from(rev_root, path)
     date, author, msg, revprops, changes = self._revinfo(rev)
     if fs.is_file(rev_root, path):
@@ -815,6 +1019,25 @@ class LocalSubversionRepository(vclib.Repository):
       rev_paths.append([hist_rev, hist_path])
     return rev_paths
   
+  def _get_locks(self, path):
+    """Return a dictionary mapping the paths (as returned by _getpath())
+    of the locked children of directory PATH to their locks, or None
+    if the Subversion bindings can't fetch them all at once."""
+    try:
+      try:
+        locks = repos.svn_repos_fs_get_locks2(self.repos, '/' + path,
+                                              core.svn_depth_immediates,
+                                              _allow_all)
+      except AttributeError:
+        locks = repos.svn_repos_fs_get_locks(self.repos, '/' + path,
+                                             _allow_all)
+    except AttributeError:
+      return None
+    children = {}
+    for lock_path, lock in locks.items():
+      children[_cleanup_path(lock_path)] = lock
+    return children
+
   def _getpath(self, path_parts):
     return '/'.join(path_parts)
 
@@ -833,11 +1056,7 @@ class LocalSubversionRepository(vclib.Repository):
     return rev
 
   def _getroot(self, rev):
-    try:
-      return self._fsroots[rev]
-    except KeyError:
-      r = self._fsroots[rev] = fs.revision_root(self.fs_ptr, rev)
-      return r
+    return self._opened.getroot(rev)
 
   def _gettype(self, path, rev):
     # Similar to itemtype(), but without the authz check.  Returns
@@ -857,6 +1076,9 @@ class LocalSubversionRepository(vclib.Repository):
   def get_youngest_revision(self):
     return self.youngest
 
+  def get_uuid(self):
+    return self._opened.getuuid()
+
   def get_location(self, path, rev, old_rev):
     try:
       results = repos.svn_repos_trace_node_locations(self.fs_ptr, path,
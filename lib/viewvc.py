@@ -33,17 +33,22 @@ import re
 import rfc822
 import stat
 import struct
-import tempfile
 import time
 import types
 import urllib
 
+try:
+  from hashlib import md5
+except ImportError:
+  from md5 import md5
+
 # These modules come from our library (the stub has set up the path)
 from common import _item, _RCSDIFF_NO_CHANGES, _RCSDIFF_IS_BINARY, _RCSDIFF_ERROR, TemplateData
 import accept
 import config
 import ezt
 import popen
+import respcache
 import sapi
 import vcauth
 import vclib
@@ -240,7 +245,8 @@ class Request:
                                                   self.rootpath,
                                                   self.auth,
                                                   cfg.utilities,
-                                                  cfg.options.use_rcsparse)
+                                                  cfg.options.use_rcsparse,
+                                                  cfg.options.rcsparse_cache_dir)
             # required so that spawned rcs programs correctly expand
             # $CVSHeader$
             os.environ['CVSROOT'] = self.rootpath
@@ -250,7 +256,8 @@ class Request:
                                                         self.rootpath,
                                                         self.auth,
                                                         cfg.utilities,
-                                                        cfg.options.svn_config_dir)
+                                                        cfg.options.svn_config_dir,
+                                                        cfg.options.svn_revinfo_cache_dir)
           else:
             raise vclib.ReposNotFound()
         except vclib.ReposNotFound:
@@ -398,7 +405,7 @@ class Request:
       self.server.redirect(self.get_url())
     else:
       debug.t_start('view-func')
-      self.view_func(self)
+      generate_response(self)
       debug.t_end('view-func')
 
   def get_url(self, escape=0, partial=0, prefix=0, **args):
@@ -901,14 +908,57 @@ def get_view_template(cfg, view_name, language="en"):
   # Finally, construct the whole template path.
   tname = cfg.path(tname)
 
+  # Parsed templates are kept for reuse by later requests (which only
+  # helps long-running ViewVC processes), until the template or any of
+  # the files it includes change.
+  cached = _template_cache.get(tname)
+  if cached:
+    stamps, template = cached
+    if not cfg.options.template_mtime_check or stamps == _file_stamps(stamps):
+      return template
+
   debug.t_start('ezt-parse')
-  template = ezt.Template(tname)
+  files = { }
+  template = ezt.Template()
+  template.parse(_TemplateReader(tname, files))
+  _template_cache[tname] = (_file_stamps(files.keys()), template)
   debug.t_end('ezt-parse')
 
   return template
 
+# template path -> (list of stamps of the files read, ezt.Template)
+_template_cache = { }
+
+class _TemplateReader(ezt.Reader):
+  """Reads templates from the filesystem, like ezt's own file reader,
+  but also notes the path of each file read as a key of FILES."""
+  def __init__(self, fname, files):
+    self.text = open(fname, 'rb').read()
+    self._dir = os.path.dirname(fname)
+    self._files = files
+    files[fname] = None
+  def read_other(self, relative):
+    return _TemplateReader(os.path.join(self._dir, relative), self._files)
+
+def _file_stamps(paths):
+  """Return a sorted list of (path, mtime, size) stamps of the files at
+  PATHS (which may itself be such a list)."""
+  stamps = [ ]
+  for path in paths:
+    if type(path) is types.TupleType:
+      path = path[0]
+    try:
+      st = os.stat(path)
+    except OSError:
+      stamps.append((path, None, None))
+    else:
+      stamps.append((path, st.st_mtime, st.st_size))
+  stamps.sort()
+  return stamps
+
 def get_writeready_server_file(request, content_type=None, encoding=None,
-                               content_length=None, allow_compress=True):
+                               content_length=None, allow_compress=True,
+                               is_compressed=False):
   """Return a file handle to a response body stream, after outputting
   any queued special headers (on REQUEST.server) and (optionally) a
   'Content-Type' header whose value is CONTENT_TYPE and character set
@@ -921,10 +971,21 @@ def get_writeready_server_file(request, content_type=None, encoding=None,
   otherwise be allowed.  (Such as when transmitting an
   already-compressed response.)
 
+  Callers may set IS_COMPRESSED if they will write a body which is
+  already gzip-compressed, and the client accepts that (as indicated
+  by REQUEST.gzip_compress_level).  The response is then marked as
+  gzip-encoded, but not compressed again, and CONTENT_LENGTH (if
+  provided) is the length of the compressed body.
+
   After this function is called, it is too late to add new headers to
   the response."""
 
-  if allow_compress and request.gzip_compress_level:
+  if is_compressed:
+    request.server.addheader('Content-Encoding', 'gzip')
+    if content_length is not None:
+      request.server.addheader('Content-Length', content_length)
+    allow_compress = False
+  elif allow_compress and request.gzip_compress_level:
     request.server.addheader('Content-Encoding', 'gzip')
   elif content_length is not None:
     request.server.addheader('Content-Length', content_length)
@@ -949,6 +1010,234 @@ def generate_page(request, view_name, data, content_type=None):
   template = get_view_template(request.cfg, view_name, request.language)
   template.generate(server_fp, data)
 
+# Revisions which always refer to the same content (unlike tags, say).
+_re_fixed_revision = re.compile('^[0-9]+(\\.[0-9]+)*$')
+
+def get_response_cache_key(request):
+  """Return the key under which the response to REQUEST may be cached,
+  or None if it may not be cached at all."""
+
+  cfg = request.cfg
+  if not cfg.options.response_cache_dir:
+    return None
+
+  # Only views of particular revisions of a file (or of the differences
+  # between two of them) have responses which never change.
+  query_dict = request.query_dict
+  view_func = request.view_func
+  if view_func is view_diff or view_func is view_patch:
+    rev_params = ['r1', 'r2']
+    if query_dict.get('r1') == 'text':
+      rev_params[0] = 'tr1'
+    if query_dict.get('r2') == 'text':
+      rev_params[1] = 'tr2'
+  elif view_func is view_annotate:
+    rev_params = ['annotate']
+  elif view_func is view_markup or view_func is view_checkout:
+    rev_params = ['revision']
+  else:
+    return None
+  revs = []
+  for param in rev_params:
+    revs.append(query_dict.get(param, '').split(':')[0])
+  pathrev = query_dict.get('pathrev')
+  for rev in revs + (pathrev is not None and [pathrev.split(':')[0]] or []):
+    if not _re_fixed_revision.match(rev):
+      return None
+
+  # Subversion paths are looked up in the youngest revision unless a
+  # pathrev is given, revision properties may be changed, and revision
+  # views of CVS files show their tags, so note those things which
+  # could otherwise change the response.
+  if request.roottype == 'svn':
+    if pathrev is None:
+      youngest = request.repos.youngest
+    else:
+      youngest = None
+    uuid = request.repos.get_uuid()
+    generations = [respcache.get_revprops_generation(
+                     cfg.options.response_cache_dir, uuid)]
+    for rev in revs:
+      if not rev.isdigit():
+        return None
+      generations.append(respcache.get_revprops_generation(
+        cfg.options.response_cache_dir, uuid, rev))
+    mutable = (youngest, generations)
+  elif request.pathtype == vclib.FILE:
+    # (a diff may compare the file with others, named by p1 and p2)
+    paths = [request.path_parts]
+    if view_func is view_diff or view_func is view_patch:
+      for param in ('p1', 'p2'):
+        if query_dict.has_key(param):
+          paths.append(_path_parts(query_dict[param]))
+    mutable = []
+    for path_parts in paths:
+      try:
+        st = os.stat(request.repos.rcsfile(path_parts, 1))
+      except (OSError, vclib.ItemNotFound):
+        return None
+      mutable.append((st.st_mtime, st.st_size))
+  else:
+    return None
+
+  # Finally, responses depend upon the configuration and templates,
+  # the user's language and identity and the authorization rules
+  # (which may affect which data is shown) and the URLs by which
+  # ViewVC is reached.
+  items = query_dict.items()
+  items.sort()
+  if request.auth is not None:
+    username = request.username
+    auth_stamp = request.auth.get_stamp()
+  else:
+    username = auth_stamp = None
+  return repr((_config_hash(cfg, request.language), mutable,
+               request.server.getenv('HTTP_HOST'), request.script_name,
+               request.rootname, _view_codes[view_func], request.where,
+               items, request.language, username, auth_stamp))
+
+def _config_hash(cfg, language):
+  """Return a hash of the contents of the configuration file and the
+  modification times of the templates and key/value files."""
+
+  # The hash is computed once per loaded configuration (and language),
+  # after which only the files' stamps are checked, and only if the
+  # templates' are.
+  template_dir = cfg.path(cfg.options.template_dir or "templates")
+  templates = vars(cfg.templates).items()
+  templates.sort()
+  memo_key = ('response-cache-config', language, template_dir,
+              tuple(templates), tuple(cfg.general.kv_files))
+  memo = cfg.get_memo(memo_key)
+  if memo:
+    stamps, digest = memo
+    if not cfg.options.template_mtime_check or stamps == _file_stamps(stamps):
+      return digest
+
+  paths = []
+  for dirpath, dirnames, filenames in os.walk(template_dir):
+    for filename in filenames:
+      paths.append(os.path.join(dirpath, filename))
+  for name, tname in templates:
+    if tname:
+      paths.append(cfg.path(os.path.join(template_dir, tname)))
+  for fname in cfg.general.kv_files:
+    if fname[0] == '[':
+      fname = fname[fname.index(']')+1:].strip()
+    paths.append(cfg.path(fname))
+  for i in range(len(paths)):
+    paths[i] = paths[i].replace('%lang%', language)
+  stamps = _file_stamps(paths)
+
+  hash = md5()
+  if cfg.conf_path:
+    hash.update(open(cfg.conf_path, 'rb').read())
+  for stamp in stamps:
+    hash.update('%s %s %s\n' % stamp)
+  digest = hash.hexdigest()
+  cfg.set_memo(memo_key, (stamps, digest))
+  return digest
+
+def _cached_response_readable(request):
+  """Return 1 iff the user may read every revision of every path shown
+  by the response (to REQUEST) found in the response cache."""
+
+  query_dict = request.query_dict
+  view_func = request.view_func
+  try:
+    if view_func is view_diff or view_func is view_patch:
+      p1, p2, rev1, rev2, sym1, sym2 = setup_diff(request)
+      paths = [(p1, rev1), (p2, rev2)]
+    else:
+      if view_func is view_annotate:
+        rev = query_dict['annotate']
+      else:
+        rev = query_dict['revision']
+      if request.roottype == 'svn':
+        rev = request.repos._getrev(rev)
+      paths = [(request.path_parts, rev)]
+    for path_parts, rev in paths:
+      if not vclib.check_path_access(request.repos, path_parts,
+                                     vclib.FILE, rev):
+        return 0
+  except (debug.ViewVCException, vclib.ItemNotFound, vclib.InvalidRevision):
+    return 0
+  return 1
+
+def generate_response(request):
+  """Run REQUEST's view function, or, where possible, serve its
+  response from the response cache, recording it there if need be."""
+
+  key = get_response_cache_key(request)
+  if key is None:
+    request.view_func(request)
+    return
+
+  cfg = request.cfg
+  cache = respcache.ResponseCache(cfg.options.response_cache_dir,
+                                  cfg.options.response_cache_kbytes * 1024)
+  response = cache.get(key)
+  if response is not None and not _cached_response_readable(request):
+    # Let the view itself report the problem.
+    request.view_func(request)
+    return
+  if response is None:
+    debug.t_start('response-cache-miss')
+    # Run the view with a stand-in server, which records the response
+    # rather than sending it.  The response is compressed when stored,
+    # so the view needn't compress it.
+    server = request.server
+    compress_level = request.gzip_compress_level
+    recorder = respcache.ResponseRecorder(server, compress_level,
+                                          cache.max_entry_size)
+    request.server = recorder
+    request.gzip_compress_level = 0
+    try:
+      request.view_func(request)
+    finally:
+      request.server = server
+      request.gzip_compress_level = compress_level
+    response = recorder.finish()
+    if response is not None:
+      cache.put(key, response)
+    debug.t_end('response-cache-miss')
+    if response is None:
+      return
+  serve_cached_response(request, response)
+
+def serve_cached_response(request, response):
+  """Send RESPONSE (a respcache.CachedResponse) as the response to
+  REQUEST."""
+
+  # Freshness headers are regenerated, as the request's validators
+  # and the expiration time differ from those of the original request.
+  mtime = etag = None
+  weak = 0
+  if response.etag:
+    etag = response.etag
+    if etag[:2] == 'W/':
+      etag = etag[2:]
+      weak = 1
+    etag = etag[1:-1]
+  if response.last_modified:
+    mtime = rfc822.mktime_tz(rfc822.parsedate_tz(response.last_modified))
+  if (etag is not None or mtime is not None) \
+     and check_freshness(request, mtime, etag, weak):
+    return
+
+  for name, value in response.headers:
+    request.server.addheader(name, value)
+  if request.gzip_compress_level:
+    body = response.body
+    server_fp = get_writeready_server_file(request, response.content_type,
+                                           content_length=len(body),
+                                           is_compressed=True)
+  else:
+    body = response.get_body()
+    server_fp = get_writeready_server_file(request, response.content_type,
+                                           content_length=len(body))
+  server_fp.write(body)
+
 def nav_path(request):
   """Return current path as list of items with "name" and "href" members
 
@@ -1710,8 +1999,49 @@ def transcode_text(text, encoding=None):
     pass
   return text
 
+# Pygments lexer classes (or None) found for files of a given MIME type
+# and name, so that the lexers needn't be searched on every request.
+# {(mime_type, filename) -> lexer class}
+_lexer_classes = {}
+_LEXER_CLASSES_MAX = 1000
+
+def find_lexer_class(mime_type, filename):
+  """Return the Pygments lexer class associated with MIME_TYPE or, if
+  there is none, with FILENAME, or None if there is neither."""
+
+  key = (mime_type, filename)
+  try:
+    return _lexer_classes[key]
+  except KeyError:
+    pass
+  from pygments.lexers import ClassNotFound, \
+                              get_lexer_for_mimetype, \
+                              get_lexer_for_filename
+
+  # First, see if there's a Pygments lexer associated with MIME_TYPE.
+  lexer_class = None
+  if mime_type:
+    try:
+      lexer_class = get_lexer_for_mimetype(mime_type).__class__
+    except ClassNotFound:
+      pass
+
+  # If we've no lexer thus far, try to find one based on the FILENAME.
+  # (Lexers match whole file names -- "Makefile.*", say -- so file
+  # names can't be reduced to their extensions here.)
+  if not lexer_class:
+    try:
+      lexer_class = get_lexer_for_filename(filename).__class__
+    except ClassNotFound:
+      pass
+
+  if len(_lexer_classes) >= _LEXER_CLASSES_MAX:
+    _lexer_classes.clear()
+  _lexer_classes[key] = lexer_class
+  return lexer_class
+
 def markup_file_contents(request, cfg, file_lines, filename,
-                         mime_type, encoding, colorize):
+                         mime_type, encoding, colorize, cache_key=None):
   # Nothing to mark up?  So be it.
   if not file_lines:
     return []
@@ -1725,9 +2055,6 @@ def markup_file_contents(request, cfg, file_lines, filename,
     from pygments import highlight
     from pygments.formatters import HtmlFormatter
     from pygments.lexers import ClassNotFound, \
-                                get_lexer_by_name, \
-                                get_lexer_for_mimetype, \
-                                get_lexer_for_filename, \
                                 guess_lexer
     if not encoding:
       encoding = 'guess'
@@ -1738,25 +2065,11 @@ def markup_file_contents(request, cfg, file_lines, filename,
         except (SyntaxError, ImportError):
           pass
 
-    # First, see if there's a Pygments lexer associated with MIME_TYPE.
-    if mime_type:
-      try:
-        pygments_lexer = get_lexer_for_mimetype(mime_type,
-                                                encoding=encoding,
-                                                tabsize=cfg.options.tabsize,
-                                                stripnl=False)
-      except ClassNotFound:
-        pygments_lexer = None
-
-    # If we've no lexer thus far, try to find one based on the FILENAME.
-    if not pygments_lexer:
-      try:
-        pygments_lexer = get_lexer_for_filename(filename,
-                                                encoding=encoding,
-                                                tabsize=cfg.options.tabsize,
-                                                stripnl=False)
-      except ClassNotFound:
-        pygments_lexer = None
+    lexer_class = find_lexer_class(mime_type, filename)
+    if lexer_class:
+      pygments_lexer = lexer_class(encoding=encoding,
+                                   tabsize=cfg.options.tabsize,
+                                   stripnl=False)
 
     # Still no lexer?  If we've reason to believe this is a text
     # file, try to guess the lexer based on the file's content.
@@ -1794,7 +2107,21 @@ def markup_file_contents(request, cfg, file_lines, filename,
       file_lines[i] = markup_escaped_urls(sapi.escape(line))
     return file_lines
   
-  # If we get here, we're highlighting something.
+  # If we get here, we're highlighting something.  If CACHE_KEY
+  # identifies the file contents, the highlighted lines may already be
+  # in the highlight cache.
+  cache = None
+  if cache_key is not None and cfg.options.highlight_cache_dir:
+    import pygments
+    lexer_class = pygments_lexer.__class__
+    key = repr((cache_key, lexer_class.__module__, lexer_class.__name__,
+                cfg.options.tabsize, encoding, pygments.__version__))
+    cache = respcache.HighlightCache(cfg.options.highlight_cache_dir,
+                                     cfg.options.highlight_cache_kbytes * 1024)
+    colorized_file_lines = cache.get(key)
+    if colorized_file_lines is not None:
+      return colorized_file_lines
+
   class PygmentsSink:
     def __init__(self):
       self.colorized_file_lines = []
@@ -1808,6 +2135,8 @@ def markup_file_contents(request, cfg, file_lines, filename,
             HtmlFormatter(nowrap=True,
                           classprefix="pygments-",
                           encoding='utf-8'), ps)
+  if cache:
+    cache.put(key, ps.colorized_file_lines)
   return ps.colorized_file_lines
 
 def empty_blame_item(line, line_no):
@@ -2016,9 +2345,12 @@ def markup_or_annotate(request, is_annotate):
 
     # Try to colorize the file contents.
     colorize = cfg.options.enable_syntax_coloration
+    cache_key = None
+    if revision is not None:
+      cache_key = (request.rootpath, _path_join(path), str(revision))
     try:
       lines = markup_file_contents(request, cfg, file_lines, path[-1],
-                                   mime_type, encoding, colorize)
+                                   mime_type, encoding, colorize, cache_key)
     except:
       if colorize:
         lines = markup_file_contents(request, cfg, file_lines, path[-1],
@@ -2239,6 +2571,9 @@ def view_directory(request):
                                            cfg.options.hide_attic))
     options["cvs_subdirs"] = (cfg.options.show_subdir_lastmod and
                               cfg.options.show_logs)
+    options["cvs_logs"] = cfg.options.show_logs
+    options["cvs_jobs"] = cfg.options.cvs_dirlogs_jobs
+    options["cvs_jobs_threshold"] = cfg.options.cvs_dirlogs_jobs_threshold
   debug.t_start("listdir")
   file_data = request.repos.listdir(request.path_parts, request.pathrev,
                                     options)
@@ -3516,6 +3851,7 @@ def view_patch(request):
   # Maybe not.  For a patch, perhaps the precise change is ideal.)
   diff_options = {}
   diff_options['funout'] = cfg.options.hr_funout
+  diff_options['diff_algorithm'] = cfg.options.diff_algorithm
   
   try:
     fp = request.repos.rawdiff(p1, rev1, p2, rev2, diff_type, diff_options)
@@ -3654,6 +3990,7 @@ class DiffDescription:
 
   def get_content_diff(self, left, right):
     diff_options = {}
+    diff_options['diff_algorithm'] = self.request.cfg.options.diff_algorithm
     if self.context != -1:
       diff_options['context'] = self.context
     if self.human_readable:
@@ -3667,6 +4004,7 @@ class DiffDescription:
 
   def get_prop_diff(self, left, right):
     diff_options = {}
+    diff_options['diff_algorithm'] = self.request.cfg.options.diff_algorithm
     if self.context != -1:
       diff_options['context'] = self.context
     if self.human_readable:
@@ -3707,12 +4045,18 @@ class DiffDescription:
                               propname=propname))
 
   def _line_idiff_sidebyside(self, lines_left, lines_right, diff_options):
+    options = self.request.cfg.options
     return idiff.sidebyside(lines_left, lines_right,
-                            diff_options.get("context", 5))
+                            diff_options.get("context", 5),
+                            options.hr_intraline_max_block_size,
+                            options.hr_intraline_time_limit)
 
   def _line_idiff_unified(self, lines_left, lines_right, diff_options):
+    options = self.request.cfg.options
     return idiff.unified(lines_left, lines_right,
-                         diff_options.get("context", 2))
+                         diff_options.get("context", 2),
+                         options.hr_intraline_max_block_size,
+                         options.hr_intraline_time_limit)
 
   def _fp_vclib_hr(self, left, right, fp, propname):
     date1, date2, flag, headers = \
@@ -3755,24 +4099,14 @@ class DiffDescription:
     return val.splitlines()
 
   def _prop_fp(self, left, right, propname, diff_options):
-    fn_left = self._temp_file(left.properties.get(propname))
-    fn_right = self._temp_file(right.properties.get(propname))
-    diff_args = vclib._diff_args(self.diff_type, diff_options)
     info_left = self._property_path(left, propname), \
                 left.log_entry.date, left.rev
     info_right = self._property_path(right, propname), \
                  right.log_entry.date, right.rev
-    return vclib._diff_fp(fn_left, fn_right, info_left, info_right,
-                          self.request.cfg.utilities.diff or 'diff', diff_args)
-
-  def _temp_file(self, val):
-    '''Create a temporary file with content from val'''
-    fn = tempfile.mktemp()
-    fp = open(fn, "wb")
-    if val:
-      fp.write(val)
-    fp.close()
-    return fn
+    return vclib._diff_text(left.properties.get(propname) or '',
+                            right.properties.get(propname) or '',
+                            info_left, info_right, self.diff_type,
+                            diff_options)
 
   def _uniq(self, lst):
     '''Determine unique set of list elements'''
@@ -4072,12 +4406,13 @@ def download_tarball(request):
 
   if debug.TARFILE_PATH:
     request.server.header('')
-    print """
+    request.server.write("""
 <html>
 <body>
 <p>Tarball '%s' successfully generated!</p>
 </body>
-</html>""" % (debug.TARFILE_PATH)
+</html>
+""" % (debug.TARFILE_PATH))
 
 
 def view_revision(request):
@@ -4638,6 +4973,52 @@ def query_backout(request, commits):
                         % (fileinfo.rev, prev_rev(fileinfo.rev),
                            fileinfo.dir, fileinfo.file))
 
+class _QueryCommitGrouper:
+  """Gathers the commits found by a checkin database query, passed to
+  add() as they are read, into the commit objects of the query view.
+  For CVS, consecutive commits with the same commit message are
+  grouped; for Subversion, only those with the same revision number."""
+
+  def __init__(self, request, limit_changes, dir_strip, format):
+    self.request = request
+    self.limit_changes = limit_changes
+    self.dir_strip = dir_strip
+    self.format = format
+    self.commits = []
+    self.plus_count = 0
+    self.minus_count = 0
+    self.mod_time = -1    # time of the newest commit
+    self._files = []
+    self._group = None
+
+  def add(self, commit):
+    if commit.GetTime() > self.mod_time:
+      self.mod_time = commit.GetTime()
+    if self.request.roottype == 'cvs':
+      group = commit.GetDescriptionID()
+    else:
+      group = commit.GetRevision()
+    if self._files and group != self._group:
+      self._build_commit()
+    self._group = group
+    self._files.append(commit)
+
+  def finish(self):
+    """Gather the last group of commits, if any."""
+    if self._files:
+      self._build_commit()
+
+  def _build_commit(self):
+    commit_item = build_commit(self.request, self._files,
+                               self.limit_changes, self.dir_strip,
+                               self.format)
+    if commit_item:
+      # update running plus/minus totals
+      self.plus_count = self.plus_count + commit_item.plus
+      self.minus_count = self.minus_count + commit_item.minus
+      self.commits.append(commit_item)
+    self._files = []
+
 def view_query(request):
   if not is_query_supported(request):
     raise debug.ViewVCException('Can not query project root "%s" at "%s".'
@@ -4742,64 +5123,17 @@ def view_query(request):
   else:
     query.SetLimit(cfg.cvsdb.row_limit)
 
-  # run the query
+  # run the query, gathering the commits as they are read
+  grouper = _QueryCommitGrouper(request, limit_changes,
+                                _path_join(repos_dir), format)
+  query.commit_cb = grouper.add
   db.RunQuery(query)
-  commit_list = query.GetCommitList()
+  grouper.finish()
   row_limit_reached = query.GetLimitReached()
-  
-  # gather commits
-  commits = []
-  plus_count = 0
-  minus_count = 0
-  mod_time = -1
-  if commit_list:
-    files = []
-    limited_files = 0
-    current_desc = commit_list[0].GetDescriptionID()
-    current_rev = commit_list[0].GetRevision()
-    dir_strip = _path_join(repos_dir)
-
-    for commit in commit_list:
-      commit_desc = commit.GetDescriptionID()
-      commit_rev = commit.GetRevision()
-
-      # base modification time on the newest commit
-      if commit.GetTime() > mod_time:
-        mod_time = commit.GetTime()
-        
-      # For CVS, group commits with the same commit message.
-      # For Subversion, group them only if they have the same revision number
-      if request.roottype == 'cvs':
-        if current_desc == commit_desc:
-          files.append(commit)
-          continue
-      else:
-        if current_rev == commit_rev:
-          files.append(commit)
-          continue
-
-      # append this grouping
-      commit_item = build_commit(request, files, limit_changes,
-                                 dir_strip, format)
-      if commit_item:
-        # update running plus/minus totals
-        plus_count = plus_count + commit_item.plus
-        minus_count = minus_count + commit_item.minus
-        commits.append(commit_item)
-
-      files = [ commit ]
-      limited_files = 0
-      current_desc = commit_desc
-      current_rev = commit_rev
-      
-    # we need to tack on our last commit grouping, if any
-    commit_item = build_commit(request, files, limit_changes,
-                               dir_strip, format)
-    if commit_item:
-      # update running plus/minus totals
-      plus_count = plus_count + commit_item.plus
-      minus_count = minus_count + commit_item.minus
-      commits.append(commit_item)
+  commits = grouper.commits
+  plus_count = grouper.plus_count
+  minus_count = grouper.minus_count
+  mod_time = grouper.mod_time
   
   # only show the branch column if we are querying all branches
   # or doing a non-exact branch match on a CVS repository.
@@ -4882,7 +5216,8 @@ def list_roots(request):
     try:
       repos = vclib.svn.SubversionRepository(root, cfg.general.svn_roots[root],
                                              auth, cfg.utilities,
-                                             cfg.options.svn_config_dir)
+                                             cfg.options.svn_config_dir,
+                                             cfg.options.svn_revinfo_cache_dir)
       lastmod = None
       if cfg.options.show_roots_lastmod:
         try:
@@ -4907,7 +5242,8 @@ def list_roots(request):
     auth = setup_authorizer(cfg, request.username, root)
     try:
       vclib.ccvs.CVSRepository(root, cfg.general.cvs_roots[root], auth,
-                               cfg.utilities, cfg.options.use_rcsparse)
+                               cfg.utilities, cfg.options.use_rcsparse,
+                               cfg.options.rcsparse_cache_dir)
     except vclib.ReposNotFound:
       continue
     allroots[root] = [cfg.general.cvs_roots[root], 'cvs', None]
@@ -5013,23 +5349,30 @@ def load_config(pathname=None, server=None):
               or os.path.join(os.path.dirname(os.path.dirname(__file__)),
                               "viewvc.conf"))
 
-  # Load the configuration!
-  cfg = config.Config()
-  cfg.set_defaults()
-  cfg.load_config(pathname, server and server.getenv("HTTP_HOST"))
+  # Load the configuration!  (The parsed configuration is kept for
+  # later requests handled by this process.)
+  cfg = config.get_config(pathname, server and server.getenv("HTTP_HOST"))
 
   # Load mime types file(s), but reverse the order -- our
   # configuration uses a most-to-least preferred approach, but the
-  # 'mimetypes' package wants things the other way around.
+  # 'mimetypes' package wants things the other way around.  That's
+  # only needed when they differ from those last loaded.
+  global _mime_types_loaded
   if cfg.general.mime_types_files:
     files = cfg.general.mime_types_files[:]
     files.reverse()
     files = map(lambda x, y=pathname: os.path.join(os.path.dirname(y), x), files)
-    mimetypes.init(files)
+    loaded = (files, _file_stamps(files))
+    if loaded != _mime_types_loaded:
+      mimetypes.init(files)
+      _mime_types_loaded = loaded
   
   debug.t_end('load-config')
   return cfg
 
+# the mime types files last loaded, and their stamps (see _file_stamps)
+_mime_types_loaded = None
+
 
 def view_error(server, cfg):
   exc_dict = debug.GetExceptionData()
@@ -5071,3 +5414,5 @@ def main(server, cfg):
     debug.t_end('main')
     debug.t_dump(server.file())
     debug.DumpChildren(server)
+    # the page is complete, so send whatever output is still buffered
+    server.flush()
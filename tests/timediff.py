@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# timediff.py: time the intraline diffs of large synthetic files
+#
+# usage: timediff.py [LINES [CHANGE_PERCENT [DIFFLIB_MAX_LINES]]]
+#
+# Two versions of a C-like file of LINES lines (default 20000) are
+# generated, with about CHANGE_PERCENT (default 10) percent of the lines
+# edited, deleted or inserted, half of them singly and half in blocks
+# of up to 1000 consecutive lines, and idiff's unified and side-by-side
+# diffs of them are timed, with the default budgets and with none.
+# For files of no more than DIFFLIB_MAX_LINES lines (default 5000), the
+# difflib-only implementation idiff used to have is timed as well.
+#
+
+import sys
+sys.path.insert(0, '../lib')
+
+import time
+import random
+import difflib
+
+import idiff
+
+
+def make_line(rand):
+  words = ['int', 'i', 'j', '=', '0;', 'return', 'foo(bar);', 'if', '(x)',
+           '{', '}', '/*', 'comment', '*/', 'buf[n]', '+=', 'len;']
+  indent = '  ' * rand.randint(0, 4)
+  return indent + ' '.join(rand.sample(words, rand.randint(1, 8))) + '\n'
+
+def make_files(lines, change_percent, seed=1):
+  rand = random.Random(seed)
+  fromlines = [make_line(rand) for i in xrange(lines)]
+  tolines = fromlines[:]
+  changes = lines * change_percent / 100
+  while changes > 0:
+    pos = rand.randint(0, len(tolines) - 1)
+    count = 1
+    if rand.random() < 0.5:
+      count = min(rand.randint(1, 1000), changes)
+    what = rand.random()
+    if what < 0.5:
+      # edit part of each line
+      for i in xrange(pos, min(pos + count, len(tolines))):
+        line = tolines[i]
+        cut = rand.randint(0, len(line) - 1)
+        tolines[i] = line[:cut] + rand.choice(['x', ' + 1', 'y;']) + line[cut:]
+    elif what < 0.75:
+      del tolines[pos:pos + count]
+    else:
+      tolines[pos:pos] = [make_line(rand) for i in xrange(count)]
+    changes = changes - count
+  return fromlines, tolines
+
+def old_unified(fromlines, tolines, context):
+  # idiff.unified() as it was, with difflib finding the line changes
+  lastrow = None
+  for row in idiff._trim_context(difflib.Differ().compare(fromlines, tolines),
+                                 context):
+    if row[0].startswith("? "):
+      yield idiff._differ_split(lastrow, row[0])
+      lastrow = None
+    else:
+      if lastrow:
+        yield idiff._differ_split(lastrow, None)
+      lastrow = row
+  if lastrow:
+    yield idiff._differ_split(lastrow, None)
+
+def old_sidebyside(fromlines, tolines, context):
+  # idiff.sidebyside() as it was
+  fromlines = map(lambda line: line.rstrip("\n"), fromlines)
+  tolines = map(lambda line: line.rstrip("\n"), tolines)
+  for fromdata, todata, flag in difflib._mdiff(fromlines, tolines, context):
+    if flag is not None:
+      yield idiff._mdiff_split(flag, fromdata), \
+            idiff._mdiff_split(flag, todata)
+
+def time_rows(label, rows):
+  t = time.time()
+  count = 0
+  for row in rows:
+    count = count + 1
+  t = time.time() - t
+  sys.stdout.write('%-36s %8.2f s %8d rows\n' % (label, t, count))
+
+def main(argv):
+  lines = 20000
+  change_percent = 10
+  difflib_max_lines = 5000
+  if argv:
+    lines = int(argv[0])
+  if argv[1:]:
+    change_percent = int(argv[1])
+  if argv[2:]:
+    difflib_max_lines = int(argv[2])
+  fromlines, tolines = make_files(lines, change_percent)
+  sys.stdout.write('%d lines, %d percent changed\n' % (lines, change_percent))
+
+  time_rows('unified', idiff.unified(fromlines, tolines, 2))
+  time_rows('unified (no intraline budget)',
+            idiff.unified(fromlines, tolines, 2, sys.maxint, sys.maxint))
+  time_rows('unified (no intraline diffs)',
+            idiff.unified(fromlines, tolines, 2, 0))
+  time_rows('side-by-side', idiff.sidebyside(fromlines, tolines, 5))
+  time_rows('side-by-side (no intraline budget)',
+            idiff.sidebyside(fromlines, tolines, 5, sys.maxint, sys.maxint))
+  time_rows('side-by-side (no intraline diffs)',
+            idiff.sidebyside(fromlines, tolines, 5, 0))
+  if lines <= difflib_max_lines:
+    time_rows('unified (difflib)', old_unified(fromlines, tolines, 2))
+    time_rows('side-by-side (difflib)',
+              old_sidebyside(fromlines, tolines, 5))
+
+if __name__ == '__main__':
+  main(sys.argv[1:])